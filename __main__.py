@@ -1,5 +1,9 @@
-import asyncio
 import streamlit as st
+from _src import config
+from _src import metrics
+from _src import order_partitions
+from _src import orders
+from _src import sales_rollups
 from _src.pages import buy_products
 from _src.pages import log_user
 from _src.pages import edit_products
@@ -7,9 +11,11 @@ from _src.pages import edit_managers
 from _src.pages import cart_page
 from _src.pages import customer_page
 from _src.pages import main_window
+from _src.pages import dev_panel
+from _src.pages import analytics_page
 
 
-async def main():
+def main():
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
     if 'user_id' not in st.session_state:
@@ -22,6 +28,7 @@ async def main():
     if not st.session_state.logged_in:
         # Показать меню для входа/регистрации
         page = st.sidebar.selectbox("Выберите действие", ["Вход", "Регистрация"])
+        metrics.set_page(page)
 
         if page == "Вход":
             # Вызов асинхронной формы для входа
@@ -30,12 +37,20 @@ async def main():
             # Вызов асинхронной формы для регистрации
             log_user.registration_form()
     else:
+        # Роль берётся из контекста сессии при каждом обновлении страницы, поэтому снятие прав
+        # действует сразу; запрос к базе выполняется, только если роль или баланс меняли
+        user = log_user.current_user()
+        if user is None:
+            log_user.log_out()
+        st.session_state.role = user.role
+
         # Авторизованный пользователь
         if st.session_state.role == 'customer':
             page = st.sidebar.radio(
                 "Меню",
                 ["Главная", "Купить товары", "Корзина", "Профиль"]
             )
+            metrics.set_page(page)
 
             if page == "Главная":
                 main_window.main_window()
@@ -53,8 +68,9 @@ async def main():
         elif st.session_state.role == 'manager':
             page = st.sidebar.radio(
                 "Меню",
-                ["Главная", "Купить товары", "Корзина", "Профиль", "Редактировать товары"]
+                ["Главная", "Купить товары", "Корзина", "Профиль", "Редактировать товары", "Аналитика продаж"]
             )
+            metrics.set_page(page)
 
             if page == "Главная":
                 main_window.main_window()
@@ -66,6 +82,8 @@ async def main():
                 customer_page.profile_page()  # Профиль и отзывы
             elif page == "Редактировать товары":
                 edit_products.products_management_page()
+            elif page == "Аналитика продаж":
+                analytics_page.analytics_page()
 
             # Добавление кнопки выхода из аккаунта
             if st.sidebar.button("Выйти"):
@@ -74,8 +92,10 @@ async def main():
         elif st.session_state.role == 'admin':
             page = st.sidebar.radio(
                 "Меню",
-                ["Главная", "Купить товары", "Корзина", "Профиль", "Редактировать товары", "Управление менеджерами"]
+                ["Главная", "Купить товары", "Корзина", "Профиль", "Редактировать товары", "Аналитика продаж",
+                 "Управление менеджерами"]
             )
+            metrics.set_page(page)
 
             if page == "Главная":
                 main_window.main_window()
@@ -88,6 +108,8 @@ async def main():
                 customer_page.profile_page()  # Профиль и отзывы
             elif page == "Редактировать товары":
                 edit_products.products_management_page()
+            elif page == "Аналитика продаж":
+                analytics_page.analytics_page()
             elif page == "Управление менеджерами":
                 edit_managers.manager_page()
 
@@ -97,4 +119,12 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    metrics.start_server()
+    orders.start_reaper()
+    order_partitions.start_maintenance()
+    sales_rollups.start_refresher()
+    # Запросы отрисовки собираются для панели разработчика и метрик по страницам
+    with metrics.render("-") as current_render:
+        main()
+    if config.DEV_PANEL:
+        dev_panel.dev_panel(current_render)
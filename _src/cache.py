@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import decimal
+import json
+import threading
+import time
+
+from _src import config
+from _src import notifications
+
+# ----- Кэши процесса -----
+# Живут в модуле, то есть общие для всех сессий и переживают reruns. Значения
+# загружаются корутинами в цикле _src.runner; сбросить кэш можно из любого потока.
+
+
+class TTLCache:
+    """Кэш значений по ключу с временем жизни и явной инвалидацией.
+
+    Одновременные промахи по одному ключу выполняют одну загрузку. Если кэш
+    сбросили во время загрузки, результат возвращается, но не сохраняется.
+    При заданном channel кэш сбрасывается уведомлениями LISTEN/NOTIFY: payload
+    считается ключом, пустой payload сбрасывает всё. При заданном max_entries
+    хранится не больше max_entries ключей, вытесняются давно не читанные."""
+
+    def __init__(self, ttl, channel=None, max_entries=None):
+        self._ttl = ttl
+        self._channel = channel
+        self._max_entries = max_entries
+        self._subscribed = False
+        self._entries = collections.OrderedDict()
+        self._loading = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    async def get(self, key, loader):
+        """Значение по ключу; при промахе или истёкшем TTL вызывает await loader()."""
+        if self._channel and not self._subscribed:
+            self._subscribed = True
+            await notifications.listen(self._channel, self._on_notify)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            pending = self._loading.get(key)
+            if pending is None:
+                pending = asyncio.ensure_future(self._load(key, loader, self._generation))
+                self._loading[key] = pending
+        return await asyncio.shield(pending)
+
+    async def _load(self, key, loader, generation):
+        try:
+            value = await loader()
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self._ttl, value)
+                self._entries.move_to_end(key)
+                if self._max_entries is not None and len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        """Сбрасывает указанные ключи или, без аргументов, весь кэш."""
+        with self._lock:
+            self._generation += 1
+            if keys:
+                for key in keys:
+                    self._entries.pop(key, None)
+            else:
+                self._entries.clear()
+
+    def invalidate_where(self, predicate):
+        """Сбрасывает ключи, для которых predicate(key) истинно."""
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def _on_notify(self, payload):
+        if payload:
+            self.invalidate(payload)
+        else:
+            self.invalidate()
+
+
+class ProductCache(TTLCache):
+    """Кэш страниц каталога: значение - список строк-словарей с ключом 'id'.
+
+    Последний элемент ключа - frozenset столбцов products, от которых зависят
+    состав и порядок строк (столбец сортировки, столбцы фильтров). Уведомление
+    об изменении товара сбрасывает ключи, зависящие от изменённых столбцов; в
+    остальных ключах строка товара заменяется исправленной копией, если изменились
+    только цена или остаток, иначе ключ сбрасывается. Выданные строки не меняются. Пустой payload сбрасывает всё.
+    Изменение средней оценки ('rating', migrations/010_product_rating_stats.sql)
+    сбрасывает только зависящие от неё ключи: в строках страниц её нет."""
+
+    PATCHABLE = frozenset({'price', 'stock_quantity'})
+    HIDDEN = frozenset({'rating'})
+
+    def _on_notify(self, payload):
+        if not payload:
+            self.invalidate()
+            return
+        change = json.loads(payload, parse_float=decimal.Decimal)
+        changed = frozenset(change['changed'])
+        shown = changed - self.HIDDEN
+        patch = {column: change[column] for column in self.PATCHABLE & shown}
+        with self._lock:
+            # Загрузки, начатые до изменения, не должны сохранить устаревшие строки
+            self._generation += 1
+            for key in list(self._entries):
+                expires, rows = self._entries[key]
+                if changed & key[-1]:
+                    del self._entries[key]
+                    continue
+                if not shown:
+                    continue
+                if not any(row['id'] == change['id'] for row in rows):
+                    continue
+                if shown <= self.PATCHABLE:
+                    # Строки и списки, уже выданные get(), читают потоки отрисовки - они не
+                    # меняются: ключ получает новый список с исправленными копиями строк
+                    rows = [{**row, **patch} if row['id'] == change['id'] else row for row in rows]
+                    self._entries[key] = (expires, rows)
+                else:
+                    del self._entries[key]
+
+
+# Справочники для фильтров каталога: ключи 'brands' и 'categories' совпадают с именами
+# таблиц, которые триггеры из migrations/003_reference_data_notify.sql передают в payload
+reference_data = TTLCache(config.REFERENCE_CACHE_TTL, channel="reference_data_changed")
+
+# Страницы каталога и результаты поиска, общие для всех сессий; уведомления шлют
+# триггеры из migrations/007_products_notify.sql и, при переименовании или удалении
+# бренда или категории, из 016_reference_data_products_notify.sql
+products = ProductCache(config.PRODUCT_CACHE_TTL, channel="products_changed", max_entries=config.PRODUCT_CACHE_SIZE)
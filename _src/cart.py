@@ -0,0 +1,158 @@
+from _src import config
+from _src import db
+from _src import queries
+
+# ----- Корзина (позиции открытого заказа) -----
+# Изменения корзины выполняются либо одним SQL-оператором из Python, либо одним
+# вызовом функции PL/pgSQL из migrations/004_order_procedures.sql (с изменениями
+# из 005_order_total_deltas.sql) - режим выбирается config.ORDER_BACKEND.
+# Сумма заказа orders.order_summ не пересчитывается по всем позициям, а сдвигается
+# на разницу в том же операторе, что меняет order_items, - правка стоит O(1) при
+# любом размере корзины. Сверить и починить суммы: python -m tools.check_order_totals.
+
+# Секция заказа (order_date) берётся из open_orders (migrations/009_order_partitions.sql):
+# запросы читают и меняют одну секцию orders и order_items. Заказа, которого нет
+# в open_orders, корзина уже не касается - он оплачен или перенесён в архив.
+ORDER_DATE = "(SELECT order_date FROM open_orders WHERE order_id = {})"
+
+# Строка заказа блокируется, как в оформлении заказа (_src/checkout.py): позиция не попадёт
+# в заказ, который оплачивают одновременно, - после оплаты order_state уже другой и
+# запрос ничего не меняет (возвращает NULL)
+ADD_ITEM_QUERY = queries.statement("cart.add_item", f"""
+    WITH ord AS (
+        SELECT o.id, o.order_date
+        FROM orders o
+        WHERE o.id = $1 AND o.order_date = {ORDER_DATE.format("$1")} AND o.order_state = 'в обработке'
+        FOR UPDATE
+    ), added AS (
+        INSERT INTO order_items (order_id, order_date, product_id, quantity, unitprice)
+        SELECT id, order_date, $2, $3, $4
+        FROM ord
+        RETURNING quantity * unitprice AS amount
+    )
+    UPDATE orders o
+    SET order_summ = COALESCE(o.order_summ, 0) + (SELECT amount FROM added)
+    FROM ord
+    WHERE o.id = ord.id AND o.order_date = ord.order_date
+    RETURNING o.order_summ
+""")
+
+SET_QUANTITY_QUERY = queries.statement("cart.set_item_quantity", f"""
+    WITH previous AS (
+        SELECT id, quantity
+        FROM order_items
+        WHERE order_id = $2 AND order_date = {ORDER_DATE.format("$2")} AND product_id = $3
+        FOR UPDATE
+    ), changed AS (
+        UPDATE order_items oi
+        SET quantity = $1
+        FROM previous
+        WHERE oi.id = previous.id AND oi.order_date = {ORDER_DATE.format("$2")}
+        RETURNING (oi.quantity - previous.quantity) * oi.unitprice AS delta
+    )
+    UPDATE orders
+    SET order_summ = COALESCE(order_summ, 0) + COALESCE((SELECT SUM(delta) FROM changed), 0)
+    WHERE id = $2 AND order_date = {ORDER_DATE.format("$2")}
+    RETURNING order_summ
+""")
+
+REMOVE_ITEM_QUERY = queries.statement("cart.remove_item", f"""
+    WITH removed AS (
+        DELETE FROM order_items
+        WHERE order_id = $1 AND order_date = {ORDER_DATE.format("$1")} AND product_id = $2
+        RETURNING quantity * unitprice AS amount
+    )
+    UPDATE orders
+    SET order_summ = COALESCE(order_summ, 0) - COALESCE((SELECT SUM(amount) FROM removed), 0)
+    WHERE id = $1 AND order_date = {ORDER_DATE.format("$1")}
+    RETURNING order_summ
+""")
+
+CLEAR_QUERY = queries.statement("cart.clear", f"""
+    WITH removed AS (
+        DELETE FROM order_items
+        WHERE order_id = $1 AND order_date = {ORDER_DATE.format("$1")}
+    )
+    UPDATE orders
+    SET order_summ = 0
+    WHERE id = $1 AND order_date = {ORDER_DATE.format("$1")}
+""")
+
+LOAD_CART_QUERY = queries.statement("cart.load_cart", f"""
+    SELECT oi.product_id, p.name, oi.unitprice, oi.quantity, p.price, p.stock_quantity
+    FROM order_items oi
+    JOIN products p ON p.id = oi.product_id
+    WHERE oi.order_id = $1 AND oi.order_date = {ORDER_DATE.format("$1")}
+    ORDER BY oi.id
+""")
+
+# Вызовы функций из migrations/004_order_procedures.sql (config.ORDER_BACKEND == 'procedure')
+ADD_ITEM_CALL = queries.statement("cart.add_item_call", "SELECT shop_add_cart_item($1, $2, $3, $4)")
+SET_QUANTITY_CALL = queries.statement("cart.set_item_quantity_call", "SELECT shop_set_cart_item_quantity($1, $2, $3)")
+REMOVE_ITEM_CALL = queries.statement("cart.remove_item_call", "SELECT shop_remove_cart_item($1, $2)")
+
+
+class CartItem:
+    """Позиция корзины вместе со снимком текущих данных товара.
+
+    unitprice - цена, по которой товар положен в корзину (order_items.unitprice),
+    price и stock_quantity - текущие цена и остаток товара на момент загрузки."""
+
+    __slots__ = ('product_id', 'name', 'unitprice', 'quantity', 'price', 'stock_quantity')
+
+    def __init__(self, product_id, name, unitprice, quantity, price, stock_quantity):
+        self.product_id = product_id
+        self.name = name
+        self.unitprice = unitprice
+        self.quantity = quantity
+        self.price = price
+        self.stock_quantity = stock_quantity
+
+    def __repr__(self):
+        return f"CartItem(product_id={self.product_id}, name={self.name!r}, quantity={self.quantity})"
+
+    @property
+    def total(self):
+        return self.unitprice * self.quantity
+
+
+async def load_cart(order_id):
+    """Позиции заказа с названием, ценой и остатком товара - одним запросом."""
+    async with db.connection() as conn:
+        rows = await conn.fetch(LOAD_CART_QUERY, order_id)
+        return [CartItem(*row) for row in rows]
+
+
+def cart_total(items):
+    """Итоговая сумма позиций корзины."""
+    return sum(item.total for item in items)
+
+
+async def add_item(order_id, product_id, quantity, unitprice):
+    """Добавление товара в заказ; возвращает новую сумму заказа или None, если заказ уже не открыт."""
+    async with db.connection() as conn:
+        if config.ORDER_BACKEND == 'procedure':
+            return await conn.fetchval(ADD_ITEM_CALL, order_id, product_id, quantity, unitprice)
+        return await conn.fetchval(ADD_ITEM_QUERY, order_id, product_id, quantity, unitprice)
+
+
+async def set_item_quantity(order_id, product_id, quantity):
+    """Изменение количества товара в заказе; возвращает новую сумму заказа."""
+    async with db.connection() as conn:
+        if config.ORDER_BACKEND == 'procedure':
+            return await conn.fetchval(SET_QUANTITY_CALL, order_id, product_id, quantity)
+        return await conn.fetchval(SET_QUANTITY_QUERY, quantity, order_id, product_id)
+
+
+async def remove_item(order_id, product_id):
+    """Удаление товара из заказа; возвращает новую сумму заказа."""
+    async with db.connection() as conn:
+        if config.ORDER_BACKEND == 'procedure':
+            return await conn.fetchval(REMOVE_ITEM_CALL, order_id, product_id)
+        return await conn.fetchval(REMOVE_ITEM_QUERY, order_id, product_id)
+
+
+async def clear(order_id):
+    """Удаление всех позиций заказа."""
+    async with db.connection() as conn:
+        await conn.execute(CLEAR_QUERY, order_id)
@@ -0,0 +1,313 @@
+import asyncio
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from _src import config
+from _src import db
+from _src import product_sync
+
+# ----- Импорт и экспорт каталога (CSV, Parquet) -----
+# Импорт читает файл кусками по config.IMPORT_CHUNK_SIZE строк, проверяет каждый
+# кусок целиком (без циклов по строкам), копирует (COPY) годные строки во
+# временную таблицу и в конце одной транзакцией создаёт недостающие бренды и
+# категории и обновляет или добавляет товары. Экспорт читает товары серверным
+# курсором и пишет файл кусками - весь каталог в памяти не собирается.
+# Чтение и запись файла выполняются в пуле потоков, чтобы не занимать цикл _src.runner.
+
+CSV = 'csv'
+PARQUET = 'parquet'
+
+# Столбцы файла; product_id необязателен - строки без него добавляются как новые товары
+COLUMNS = ['product_id', 'product_name', 'description', 'price', 'stock_quantity', 'brand_name', 'category_name']
+REQUIRED_COLUMNS = ['product_name', 'price', 'stock_quantity', 'brand_name', 'category_name']
+
+# Сколько отклонённых строк хранится в отчёте (счётчик учитывает все)
+REJECTED_LIMIT = 1000
+
+# Наибольшее значение int4 - типа products.id и products.stock_quantity
+INT4_MAX = 2_147_483_647
+
+STAGING_TABLE = "catalogue_import"
+
+CREATE_STAGING_QUERY = f"""
+    CREATE TEMP TABLE {STAGING_TABLE} (
+        line int8,
+        id int4,
+        name varchar,
+        description text,
+        price float8,
+        stock_quantity int8,
+        brand_name varchar,
+        category_name varchar
+    ) ON COMMIT DROP
+"""
+
+RESOLVED_ROWS = f"""
+    SELECT s.line, s.id, s.name, s.description, s.price::numeric AS price, s.stock_quantity::int4 AS stock_quantity,
+           b.id AS brand_id, c.id AS category_id
+    FROM {STAGING_TABLE} s
+    LEFT JOIN LATERAL (SELECT min(id) AS id FROM brands WHERE brand_name = s.brand_name) b ON true
+    LEFT JOIN LATERAL (SELECT min(id) AS id FROM categories WHERE name = s.category_name) c ON true
+"""
+
+# Строки с product_id: обновление существующего товара или добавление с этим id.
+# Если id в файле повторяется, побеждает последняя строка.
+UPSERT_QUERY = f"""
+    WITH upserted AS (
+        INSERT INTO products AS p (id, name, description, price, stock_quantity, brand_id, category_id)
+        SELECT DISTINCT ON (r.id) r.id, r.name, r.description, r.price, r.stock_quantity, r.brand_id, r.category_id
+        FROM ({RESOLVED_ROWS}) r
+        WHERE r.id IS NOT NULL
+        ORDER BY r.id, r.line DESC
+        ON CONFLICT (id) DO UPDATE
+        SET name = EXCLUDED.name, description = EXCLUDED.description, price = EXCLUDED.price,
+            stock_quantity = EXCLUDED.stock_quantity, brand_id = EXCLUDED.brand_id, category_id = EXCLUDED.category_id
+        WHERE (p.name, p.description, p.price, p.stock_quantity, p.brand_id, p.category_id)
+              IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.description, EXCLUDED.price,
+                                EXCLUDED.stock_quantity, EXCLUDED.brand_id, EXCLUDED.category_id)
+        RETURNING xmax = 0 AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted) AS inserted, count(*) FILTER (WHERE NOT inserted) AS updated
+    FROM upserted
+"""
+
+INSERT_QUERY = f"""
+    INSERT INTO products (name, description, price, stock_quantity, brand_id, category_id)
+    SELECT r.name, r.description, r.price, r.stock_quantity, r.brand_id, r.category_id
+    FROM ({RESOLVED_ROWS}) r
+    WHERE r.id IS NULL
+    ORDER BY r.line
+"""
+
+# После вставки товаров с явными id последовательность products.id (migrations/ddl.sql)
+# не должна выдавать уже занятые значения
+SEQUENCE_QUERY = """
+    SELECT setval('products_new_id_seq',
+                  GREATEST((SELECT max(id) FROM products), (SELECT last_value FROM products_new_id_seq)))
+"""
+
+EXPORT_QUERY = """
+    SELECT p.id AS product_id,
+           p.name AS product_name,
+           p.description,
+           p.price,
+           p.stock_quantity,
+           b.brand_name,
+           c.name AS category_name
+    FROM products p
+    LEFT JOIN brands b ON p.brand_id = b.id
+    LEFT JOIN categories c ON p.category_id = c.id
+    ORDER BY p.id
+"""
+
+EXPORT_SCHEMA = pa.schema([
+    ('product_id', pa.int32()),
+    ('product_name', pa.string()),
+    ('description', pa.string()),
+    ('price', pa.float64()),
+    ('stock_quantity', pa.int32()),
+    ('brand_name', pa.string()),
+    ('category_name', pa.string()),
+])
+
+
+class ImportReport:
+    """Ход и итог импорта. Счётчики обновляются по мере работы, их можно читать из другого потока.
+
+    total - число строк файла, если его можно узнать заранее (Parquet), иначе None;
+    rejected_rows - первые REJECTED_LIMIT отклонённых строк как (номер строки, причина);
+    chunk - кусок, который сейчас копируется в базу: (номер, первая строка, последняя строка),
+    или None, когда все куски скопированы (по нему видно, на каком куске импорт прервался)."""
+
+    __slots__ = ('total', 'read', 'rejected', 'rejected_rows', 'inserted', 'updated', 'chunk', 'done')
+
+    def __init__(self):
+        self.total = None
+        self.read = 0
+        self.rejected = 0
+        self.rejected_rows = []
+        self.inserted = 0
+        self.updated = 0
+        self.chunk = None
+        self.done = False
+
+    def __repr__(self):
+        return (f"ImportReport(read={self.read}, rejected={self.rejected}, "
+                f"inserted={self.inserted}, updated={self.updated})")
+
+
+def file_format(filename):
+    """Формат файла по расширению."""
+    if filename.lower().endswith('.parquet'):
+        return PARQUET
+    if filename.lower().endswith('.csv'):
+        return CSV
+    raise ValueError(f"Неизвестный формат файла: {filename}")
+
+
+def _read_chunks(source, fmt, chunk_size, report):
+    """Итератор по кускам файла (DataFrame); источник - путь или файловый объект."""
+    if fmt == PARQUET:
+        parquet = pq.ParquetFile(source)
+        report.total = parquet.metadata.num_rows
+        for batch in parquet.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[''])
+
+
+def _reject(reasons, condition, reason):
+    condition = condition.astype('boolean').fillna(False).astype(bool)
+    return reasons.mask(condition, reasons + reason + '; ')
+
+
+def validate_chunk(chunk, first_line):
+    """Проверяет кусок файла; возвращает (годные строки в нормализованном виде, отклонённые [(строка, причина)]).
+
+    first_line - номер первой строки куска в файле (для CSV с учётом заголовка)."""
+    missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"В файле нет столбцов: {', '.join(missing)}")
+
+    chunk = chunk.reset_index(drop=True)
+    reasons = pd.Series('', index=chunk.index)
+
+    name = chunk['product_name'].astype('string').str.strip()
+    reasons = _reject(reasons, name.isna() | (name == ''), 'пустое название')
+
+    price = pd.to_numeric(chunk['price'], errors='coerce')
+    reasons = _reject(reasons, price.isna() | (price < 0), 'цена должна быть неотрицательным числом')
+
+    stock = pd.to_numeric(chunk['stock_quantity'], errors='coerce')
+    reasons = _reject(reasons, stock.isna() | (stock < 0) | (stock > INT4_MAX) | (stock % 1 != 0),
+                      'остаток должен быть неотрицательным целым числом')
+
+    brand = chunk['brand_name'].astype('string').str.strip()
+    reasons = _reject(reasons, brand.isna() | (brand == ''), 'не указан бренд')
+
+    category = chunk['category_name'].astype('string').str.strip()
+    reasons = _reject(reasons, category.isna() | (category == ''), 'не указана категория')
+
+    if 'product_id' in chunk.columns:
+        product_id = pd.to_numeric(chunk['product_id'], errors='coerce')
+        given = chunk['product_id'].notna() & (chunk['product_id'].astype('string').str.strip() != '')
+        reasons = _reject(reasons, given & (product_id.isna() | (product_id <= 0) | (product_id > INT4_MAX)
+                                            | (product_id % 1 != 0)),
+                          'product_id должен быть положительным целым числом')
+    else:
+        product_id = pd.Series(float('nan'), index=chunk.index)
+
+    description = chunk['description'] if 'description' in chunk.columns else pd.Series(None, index=chunk.index)
+
+    bad = reasons != ''
+    lines = pd.Series(range(first_line, first_line + len(chunk)), index=chunk.index)
+    rejected = list(zip(lines[bad].tolist(), reasons[bad].str.rstrip('; ').tolist()))
+
+    keep = ~bad
+    valid = pd.DataFrame({
+        'line': lines[keep],
+        'id': product_id[keep].round().astype('Int64'),
+        'name': name[keep],
+        'description': description[keep].astype('string'),
+        'price': price[keep],
+        'stock_quantity': stock[keep].round().astype('Int64'),
+        'brand_name': brand[keep],
+        'category_name': category[keep],
+    })
+    return valid, rejected
+
+
+def _records(valid):
+    """Строки для COPY во временную таблицу: кортежи Python-значений, пропуски заменены на None."""
+    values = valid.astype(object)
+    return values.where(values.notna(), None).itertuples(index=False, name=None)
+
+
+async def import_catalogue(source, fmt, report=None, chunk_size=None):
+    """Импортирует товары из файла одной транзакцией; возвращает ImportReport.
+
+    Строки с product_id обновляют товар с этим id (или добавляют его), строки без
+    него добавляются как новые товары. Неверные строки пропускаются и попадают в отчёт."""
+    if report is None:
+        report = ImportReport()
+    if chunk_size is None:
+        chunk_size = config.IMPORT_CHUNK_SIZE
+    loop = asyncio.get_running_loop()
+    chunks = _read_chunks(source, fmt, chunk_size, report)
+    # В CSV первая строка - заголовок
+    first_line = 2 if fmt == CSV else 1
+
+    try:
+        async with db.connection() as conn:
+            async with conn.transaction():
+                await conn.execute(CREATE_STAGING_QUERY)
+                number = 0
+                while True:
+                    chunk = await loop.run_in_executor(None, next, chunks, None)
+                    if chunk is None:
+                        break
+                    number += 1
+                    report.chunk = (number, first_line, first_line + len(chunk) - 1)
+                    valid, rejected = validate_chunk(chunk, first_line)
+                    first_line += len(chunk)
+                    if not valid.empty:
+                        await conn.copy_records_to_table(STAGING_TABLE, records=_records(valid),
+                                                         columns=list(valid.columns))
+                    report.rejected_rows.extend(rejected[:REJECTED_LIMIT - len(report.rejected_rows)])
+                    report.rejected += len(rejected)
+                    report.read += len(chunk)
+                report.chunk = None
+
+                new_brands, new_categories = await product_sync.create_reference_data(conn, STAGING_TABLE)
+                counts = await conn.fetchrow(UPSERT_QUERY)
+                inserted = int((await conn.execute(INSERT_QUERY)).split()[-1])
+                await conn.execute(SEQUENCE_QUERY)
+        report.inserted = counts['inserted'] + inserted
+        report.updated = counts['updated']
+    finally:
+        report.done = True
+
+    product_sync.invalidate_reference_data(new_brands, new_categories)
+    return report
+
+
+def _write_csv(destination, df, header):
+    destination.write(df.to_csv(index=False, header=header).encode('utf-8'))
+
+
+async def export_catalogue(destination, fmt, chunk_size=None):
+    """Выгружает все товары в файл (путь или двоичный файловый объект); возвращает число строк."""
+    if chunk_size is None:
+        chunk_size = config.EXPORT_CHUNK_SIZE
+    loop = asyncio.get_running_loop()
+    exported = 0
+    output = open(destination, 'wb') if isinstance(destination, str) else destination
+    writer = pq.ParquetWriter(output, EXPORT_SCHEMA) if fmt == PARQUET else None
+    try:
+        async with db.connection() as conn:
+            # Серверный курсор живёт только внутри транзакции
+            async with conn.transaction():
+                cursor = await conn.cursor(EXPORT_QUERY)
+                while True:
+                    rows = await cursor.fetch(chunk_size)
+                    # Пустой первый кусок тоже пишется: у пустого каталога будет заголовок или схема
+                    if not rows and exported:
+                        break
+                    df = pd.DataFrame([tuple(row) for row in rows], columns=EXPORT_SCHEMA.names)
+                    if writer is not None:
+                        df['price'] = df['price'].astype('float64')
+                        table = pa.Table.from_pandas(df, schema=EXPORT_SCHEMA, preserve_index=False)
+                        await loop.run_in_executor(None, writer.write_table, table)
+                    else:
+                        await loop.run_in_executor(None, _write_csv, output, df, exported == 0)
+                    exported += len(rows)
+                    if len(rows) < chunk_size:
+                        break
+    finally:
+        if writer is not None:
+            writer.close()
+        if output is not destination:
+            output.close()
+    return exported
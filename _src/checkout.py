@@ -0,0 +1,163 @@
+from _src import config
+from _src import db
+from _src import queries
+from _src import users
+
+# ----- Оформление заказа -----
+# Списание остатков, списание баланса и перевод заказа в «оплачен» выполняются
+# одним SQL-оператором, то есть атомарно и за один round trip. Строки товаров и
+# покупателя блокируются (FOR UPDATE) в порядке id, проверки выполняются по
+# заблокированным актуальным значениям, а изменяющие CTE срабатывают только если
+# все проверки пройдены - иначе не меняется ничего.
+# Заказ и позиции читаются из секции, указанной в open_orders; оплаченный заказ
+# из open_orders удаляется.
+# При config.ORDER_BACKEND == 'procedure' то же самое делает функция shop_checkout
+# из migrations/004_order_procedures.sql (последняя версия - 015_checkout_null_balance.sql).
+
+SUCCESS = 'success'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+OUT_OF_STOCK = 'out_of_stock'
+EMPTY_CART = 'empty_cart'
+ORDER_CLOSED = 'order_closed'
+
+CHECKOUT_QUERY = queries.statement("checkout.checkout", """
+    WITH ord AS (
+        SELECT o.id, o.order_date
+        FROM orders o
+        WHERE o.id = $1 AND o.order_date = (SELECT order_date FROM open_orders WHERE order_id = $1)
+          AND o.customer_id = $2 AND o.order_state = 'в обработке'
+        FOR UPDATE
+    ), items AS (
+        SELECT oi.product_id, SUM(oi.quantity) AS quantity, SUM(oi.quantity * oi.unitprice) AS amount
+        FROM order_items oi
+        WHERE oi.order_id = $1 AND oi.order_date = (SELECT order_date FROM ord)
+        GROUP BY oi.product_id
+    ), locked AS (
+        SELECT p.id, p.name, p.stock_quantity
+        FROM products p
+        WHERE p.id IN (SELECT product_id FROM items)
+        ORDER BY p.id
+        FOR UPDATE
+    ), buyer AS (
+        SELECT c.balance
+        FROM customers c
+        WHERE c.id = $2
+        FOR UPDATE
+    ), verdict AS (
+        SELECT EXISTS (SELECT 1 FROM ord) AS order_open,
+               (SELECT count(*) FROM items) AS item_count,
+               (SELECT COALESCE(SUM(amount), 0) FROM items) AS total,
+               -- Баланс без значения (NULL) считается нулевым
+               COALESCE((SELECT balance FROM buyer), 0) AS balance,
+               short.product_ids AS short_ids, short.names AS short_names,
+               short.requested AS short_requested, short.available AS short_available
+        FROM (
+            SELECT array_agg(l.id ORDER BY l.id) AS product_ids,
+                   array_agg(l.name ORDER BY l.id) AS names,
+                   array_agg(i.quantity ORDER BY l.id) AS requested,
+                   array_agg(COALESCE(l.stock_quantity, 0) ORDER BY l.id) AS available
+            FROM locked l
+            JOIN items i ON i.product_id = l.id
+            WHERE COALESCE(l.stock_quantity, 0) < i.quantity
+        ) short
+    ), approved AS (
+        SELECT total
+        FROM verdict
+        WHERE order_open AND item_count > 0 AND short_ids IS NULL AND balance >= total
+    ), stock AS (
+        UPDATE products p
+        SET stock_quantity = p.stock_quantity - i.quantity
+        FROM items i, approved
+        WHERE p.id = i.product_id
+        RETURNING p.id
+    ), debit AS (
+        UPDATE customers c
+        SET balance = COALESCE(c.balance, 0) - approved.total
+        FROM approved
+        WHERE c.id = $2
+        RETURNING c.balance
+    ), paid AS (
+        UPDATE orders o
+        SET order_state = 'оплачен', order_summ = approved.total, paid_at = NOW()
+        FROM approved
+        WHERE o.id = $1 AND o.order_date = (SELECT order_date FROM ord)
+        RETURNING o.id
+    ), closed AS (
+        DELETE FROM open_orders
+        WHERE order_id = $1 AND EXISTS (SELECT 1 FROM paid)
+    )
+    SELECT v.*, (SELECT balance FROM debit) AS new_balance, EXISTS (SELECT 1 FROM paid) AS paid
+    FROM verdict v
+""")
+
+CHECKOUT_CALL = queries.statement("checkout.checkout_call", "SELECT * FROM shop_checkout($1, $2)")
+
+
+class OutOfStockItem:
+    """Товар, которого не хватило: сколько запрошено и сколько осталось на складе."""
+
+    __slots__ = ('product_id', 'name', 'requested', 'available')
+
+    def __init__(self, product_id, name, requested, available):
+        self.product_id = product_id
+        self.name = name
+        self.requested = requested
+        self.available = available
+
+
+class CheckoutResult:
+    """Итог оформления заказа.
+
+    status - одна из констант модуля; total - сумма заказа; balance - баланс после
+    списания при успехе или текущий баланс при отказе; out_of_stock - товары, которых не хватило."""
+
+    __slots__ = ('status', 'total', 'balance', 'out_of_stock')
+
+    def __init__(self, status, total, balance, out_of_stock=()):
+        self.status = status
+        self.total = total
+        self.balance = balance
+        self.out_of_stock = list(out_of_stock)
+
+    @property
+    def ok(self):
+        return self.status == SUCCESS
+
+
+def _result_from_row(row):
+    if row['paid']:
+        return CheckoutResult(SUCCESS, row['total'], row['new_balance'])
+    if not row['order_open']:
+        return CheckoutResult(ORDER_CLOSED, row['total'], row['balance'])
+    if row['item_count'] == 0:
+        return CheckoutResult(EMPTY_CART, row['total'], row['balance'])
+    if row['short_ids'] is not None:
+        out_of_stock = [OutOfStockItem(*item) for item in zip(row['short_ids'], row['short_names'],
+                                                             row['short_requested'], row['short_available'])]
+        return CheckoutResult(OUT_OF_STOCK, row['total'], row['balance'], out_of_stock)
+    return CheckoutResult(INSUFFICIENT_FUNDS, row['total'], row['balance'])
+
+
+def _result_from_procedure(row):
+    out_of_stock = []
+    if row['short_ids'] is not None:
+        out_of_stock = [OutOfStockItem(*item) for item in zip(row['short_ids'], row['short_names'],
+                                                             row['short_requested'], row['short_available'])]
+    # shop_checkout возвращает баланс как есть; NULL считается нулевым, как в CHECKOUT_QUERY
+    balance = row['balance'] if row['balance'] is not None else 0
+    return CheckoutResult(row['status'], row['total'], balance, out_of_stock)
+
+
+async def checkout(order_id, customer_id):
+    """Оформляет открытый заказ покупателя; возвращает CheckoutResult."""
+    async with db.connection() as conn:
+        if config.ORDER_BACKEND == 'procedure':
+            row = await conn.fetchrow(CHECKOUT_CALL, order_id, customer_id)
+            result = _result_from_procedure(row)
+        else:
+            row = await conn.fetchrow(CHECKOUT_QUERY, order_id, customer_id)
+            result = _result_from_row(row)
+    if result.ok:
+        # Баланс в контексте сессии покупателя устарел
+        users.invalidate(customer_id)
+    return result
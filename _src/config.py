@@ -0,0 +1,93 @@
+import os
+
+# ----- Подключение к базе данных -----
+# DATABASE_URL (задаётся в docker-compose) имеет приоритет над отдельными параметрами
+DATABASE_URL = os.environ.get("DATABASE_URL")
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_PORT = int(os.environ.get("DB_PORT", 5432))
+DB_NAME = os.environ.get("DB_NAME", "postgres")
+DB_USER = os.environ.get("DB_USER", "postgres")
+DB_PASSWORD = os.environ.get("DB_PASSWORD", "password")
+
+# ----- Пул соединений -----
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+# Через сколько секунд простоя соединение закрывается пулом
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.environ.get("DB_POOL_MAX_INACTIVE_LIFETIME", 300))
+# Соединение, простоявшее дольше этого времени, проверяется запросом SELECT 1 перед выдачей
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+DB_COMMAND_TIMEOUT = float(os.environ.get("DB_COMMAND_TIMEOUT", 30))
+# Кэш подготовленных операторов каждого соединения (_src/queries.py): сколько запросов
+# держать и сколько секунд (0 - без ограничения; по умолчанию asyncpg разбирает запрос заново каждые 300 с)
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 500))
+DB_STATEMENT_CACHE_LIFETIME = float(os.environ.get("DB_STATEMENT_CACHE_LIFETIME", 0))
+# Слушать уведомления базы (LISTEN/NOTIFY) для сброса кэшей процесса
+DB_LISTEN_NOTIFY = os.environ.get("DB_LISTEN_NOTIFY", "1") == "1"
+
+# ----- Пароли -----
+# Стоимость bcrypt (log2 числа раундов); пароли с другой стоимостью перехешируются при входе
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+# Сколько хеширований и проверок паролей выполняется одновременно (потоки вне цикла событий)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+
+# ----- Каталог -----
+CATALOGUE_PAGE_SIZE = int(os.environ.get("CATALOGUE_PAGE_SIZE", 20))
+# Сколько лучших результатов показывает поиск по каталогу
+SEARCH_TOP_K = int(os.environ.get("SEARCH_TOP_K", 20))
+# Сколько последних отзывов показывается у товара (число и средняя оценка - по всем отзывам)
+REVIEWS_SHOWN = int(os.environ.get("REVIEWS_SHOWN", 20))
+
+# ----- Управление товарами -----
+# Сколько товаров показывает таблица менеджера за раз
+MANAGEMENT_PAGE_SIZE = int(os.environ.get("MANAGEMENT_PAGE_SIZE", 50))
+# Остаток, при котором товар попадает в фильтр «заканчивается»
+LOW_STOCK_THRESHOLD = int(os.environ.get("LOW_STOCK_THRESHOLD", 5))
+
+# ----- Кэши -----
+# Время жизни кэша справочников (бренды, категории), секунды
+REFERENCE_CACHE_TTL = float(os.environ.get("REFERENCE_CACHE_TTL", 300))
+# Время жизни и наибольшее число страниц в общем кэше каталога
+PRODUCT_CACHE_TTL = float(os.environ.get("PRODUCT_CACHE_TTL", 60))
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", 1000))
+# Наибольший возраст контекста пользователя в сессии (роль, баланс), секунды
+USER_CONTEXT_TTL = float(os.environ.get("USER_CONTEXT_TTL", 60))
+
+# ----- Заказы -----
+# Где выполняются оформление заказа и изменения корзины:
+# python - запросами из приложения, procedure - функциями PL/pgSQL (migrations/004_order_procedures.sql)
+ORDER_BACKEND = os.environ.get("ORDER_BACKEND", "python")
+if ORDER_BACKEND not in ("python", "procedure"):
+    raise ValueError(f"ORDER_BACKEND должен быть 'python' или 'procedure', получено {ORDER_BACKEND!r}")
+# Открытый заказ, не тронутый дольше этого времени (часы от последнего действия с корзиной),
+# переносится в архив; время должно быть больше жизни сессии, иначе у открытой вкладки пропадёт корзина
+OPEN_ORDER_MAX_AGE_HOURS = float(os.environ.get("OPEN_ORDER_MAX_AGE_HOURS", 7 * 24))
+# Сколько заказов архивируется одним запросом и как часто (секунды) процесс ищет заброшенные; 0 - не искать
+OPEN_ORDER_REAP_BATCH = int(os.environ.get("OPEN_ORDER_REAP_BATCH", 1000))
+OPEN_ORDER_REAP_INTERVAL = float(os.environ.get("OPEN_ORDER_REAP_INTERVAL", 3600))
+
+# ----- Сводки продаж -----
+# Сколько оплаченных заказов добавляется в сводки аналитики одним запросом и как часто (секунды); 0 - не обновлять
+SALES_ROLLUP_BATCH = int(os.environ.get("SALES_ROLLUP_BATCH", 5000))
+SALES_ROLLUP_INTERVAL = float(os.environ.get("SALES_ROLLUP_INTERVAL", 60))
+
+# ----- Импорт и экспорт каталога -----
+# Сколько строк файла проверяется и копируется в базу за раз
+IMPORT_CHUNK_SIZE = int(os.environ.get("IMPORT_CHUNK_SIZE", 10_000))
+# Сколько строк выгрузки читается из серверного курсора за раз
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 10_000))
+
+# ----- Секции заказов -----
+# На сколько месяцев вперёд создаются секции orders и order_items
+ORDER_PARTITIONS_AHEAD = int(os.environ.get("ORDER_PARTITIONS_AHEAD", 3))
+# Секции старше стольких месяцев выгружаются в ORDER_ARCHIVE_DIR и отсоединяются; 0 - только вручную
+ORDER_ARCHIVE_AFTER_MONTHS = int(os.environ.get("ORDER_ARCHIVE_AFTER_MONTHS", 0))
+ORDER_ARCHIVE_DIR = os.environ.get("ORDER_ARCHIVE_DIR", "order_archive")
+
+# ----- Метрики запросов -----
+# Запросы дольше этого времени (мс) пишутся в журнал с опущенными значениями параметров
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+# Локальная страница метрик в формате Prometheus (/metrics); порт 0 - выключена
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+# Панель разработчика в боковой панели: запросы последней отрисовки страницы
+DEV_PANEL = os.environ.get("DEV_PANEL", "0") == "1"
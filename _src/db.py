@@ -0,0 +1,189 @@
+import asyncio
+import atexit
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from _src import config
+from _src import metrics
+from _src import runner
+
+# ----- Общий пул соединений процесса -----
+# Пул asyncpg привязан к циклу событий, в котором он создан, поэтому он живёт в
+# фоновом цикле _src.runner (один на процесс сервера Streamlit). Модуль импортируется
+# один раз на процесс, так что пул переживает перезапуски скрипта (reruns).
+# Корутины, запущенные через runner, получают соединения пула напрямую; вызовы из
+# других циклов (например, asyncio.run в скриптах) передаются в цикл пула.
+
+_pool = None
+_pool_lock = None
+
+# Время последнего возврата соединения в пул (ключ - PID серверного процесса)
+_last_used = {}
+
+# Число запросов (round trips) через соединения пула с запуска процесса
+_query_count = 0
+
+_CONNECTION_ERRORS = (
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.InterfaceError,
+    OSError,
+)
+
+
+async def _submit(coro):
+    """Выполняет корутину в цикле пула и дожидается результата из текущего цикла."""
+    if runner.in_loop():
+        return await coro
+    return await asyncio.wrap_future(runner.submit(coro))
+
+
+def connect_options():
+    """Параметры подключения к базе из _src.config (для пула и отдельных скриптов)."""
+    if config.DATABASE_URL:
+        return dict(dsn=config.DATABASE_URL)
+    return dict(
+        host=config.DB_HOST,
+        port=config.DB_PORT,
+        database=config.DB_NAME,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+    )
+
+
+def _count_query(record):
+    global _query_count
+    _query_count += 1
+
+
+async def _init_connection(conn):
+    # add_query_logger появился в asyncpg 0.29; без него счётчик запросов не растёт
+    if hasattr(conn, 'add_query_logger'):
+        conn.add_query_logger(_count_query)
+
+
+def query_count():
+    """Сколько запросов выполнено через пул с запуска процесса."""
+    return _query_count
+
+
+async def _create_pool():
+    return await asyncpg.create_pool(
+        init=_init_connection,
+        min_size=config.DB_POOL_MIN_SIZE,
+        max_size=config.DB_POOL_MAX_SIZE,
+        max_inactive_connection_lifetime=config.DB_POOL_MAX_INACTIVE_LIFETIME,
+        command_timeout=config.DB_COMMAND_TIMEOUT,
+        # Запросы реестра _src/queries.py разбираются один раз на соединение
+        statement_cache_size=config.DB_STATEMENT_CACHE_SIZE,
+        max_cached_statement_lifetime=config.DB_STATEMENT_CACHE_LIFETIME,
+        **connect_options()
+    )
+
+
+async def _get_pool():
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await _create_pool()
+    return _pool
+
+
+async def _acquire(pool):
+    """Берёт соединение из пула; долго простаивавшее соединение сначала проверяется."""
+    while True:
+        conn = await pool.acquire()
+        last_used = _last_used.get(conn.get_server_pid())
+        if last_used is None or time.monotonic() - last_used < config.DB_POOL_HEALTH_CHECK_INTERVAL:
+            return conn
+        try:
+            await conn.fetchval("SELECT 1")
+            return conn
+        except _CONNECTION_ERRORS:
+            # Соединение оборвано (перезапуск сервера, сетевой таймаут) - выбрасываем и берём другое
+            _last_used.pop(conn.get_server_pid(), None)
+            conn.terminate()
+            await pool.release(conn)
+
+
+async def _release(pool, conn):
+    if not conn.is_closed():
+        _last_used[conn.get_server_pid()] = time.monotonic()
+    await pool.release(conn)
+
+
+class _ForeignLoopConnection:
+    """Соединение пула, используемое из другого цикла событий.
+
+    Каждый асинхронный метод соединения выполняется в цикле пула."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                return _submit(result)
+            return result
+
+        return call
+
+    def transaction(self, **kwargs):
+        return _ForeignLoopTransaction(self._conn.transaction(**kwargs))
+
+
+class _ForeignLoopTransaction:
+    def __init__(self, transaction):
+        self._transaction = transaction
+
+    async def __aenter__(self):
+        await _submit(self._transaction.__aenter__())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await _submit(self._transaction.__aexit__(exc_type, exc, tb))
+
+
+@asynccontextmanager
+async def connection():
+    """Соединение из общего пула процесса, возвращается в пул при выходе из блока.
+
+    Запросы через него записываются в _src.metrics."""
+    if runner.in_loop():
+        pool = await _get_pool()
+        conn = await _acquire(pool)
+        try:
+            yield metrics.InstrumentedConnection(conn)
+        finally:
+            await _release(pool, conn)
+    else:
+        pool = await _submit(_get_pool())
+        conn = await _submit(_acquire(pool))
+        try:
+            yield metrics.InstrumentedConnection(_ForeignLoopConnection(conn))
+        finally:
+            await _submit(_release(pool, conn))
+
+
+def close():
+    """Закрывает пул и останавливает фоновый цикл."""
+    global _pool
+    if _pool is not None:
+        try:
+            runner.run(_pool.close(), timeout=10)
+        except Exception:
+            runner.get_loop().call_soon_threadsafe(_pool.terminate)
+        _pool = None
+    runner.stop()
+
+
+atexit.register(close)
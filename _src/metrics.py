@@ -0,0 +1,289 @@
+import bisect
+import contextlib
+import contextvars
+import http.server
+import logging
+import re
+import sys
+import threading
+import time
+
+from _src import config
+from _src import queries
+
+# ----- Метрики запросов к базе -----
+# db.connection() выдаёт соединение в обёртке InstrumentedConnection: каждый запрос
+# (fetch, fetchrow, fetchval, execute, executemany, copy_*) записывается с именем
+# «модуль.функция» вызывающего кода (запрос из реестра _src/queries.py - под своим
+# именем), временем и числом строк. Запрос относится к отрисовке страницы, открытой
+# в потоке скрипта через render(); runner передаёт её в фоновый цикл вместе с
+# остальными контекстными переменными.
+# Медленные запросы пишутся в журнал без значений параметров. Сводные счётчики
+# процесса отдаются в формате Prometheus локальным HTTP-сервером (config.METRICS_PORT).
+# Разбор запроса сервером (prepare) отмечается, когда запроса не было в кэше
+# подготовленных операторов соединения до вызова, а после вызова он там есть:
+# отношение shop_query_prepares_total к числу выполнений показывает, работает ли кэш.
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы времени запроса, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Методы, которые выполняют запрос через кэш подготовленных операторов asyncpg
+# (execute без параметров идёт простым протоколом и в кэш не попадает)
+CACHED_METHODS = ('fetch', 'fetchrow', 'fetchval', 'execute', 'executemany')
+
+_render = contextvars.ContextVar("render", default=None)
+
+_lock = threading.Lock()
+_queries = {}
+_renders = {}
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class Query:
+    __slots__ = ('name', 'elapsed', 'rows', 'failed')
+
+    def __init__(self, name, elapsed, rows, failed):
+        self.name = name
+        self.elapsed = elapsed
+        self.rows = rows
+        self.failed = failed
+
+
+class Render:
+    """Одна отрисовка страницы и запросы, выполненные за время отрисовки."""
+
+    __slots__ = ('page', 'started', 'elapsed', 'queries')
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.queries = []
+
+    def query_time(self):
+        return sum(query.elapsed for query in self.queries)
+
+
+class _QueryStats:
+    __slots__ = ('count', 'seconds', 'rows', 'errors', 'prepares', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.errors = 0
+        self.prepares = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class _RenderStats:
+    __slots__ = ('count', 'seconds', 'queries')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+
+
+@contextlib.contextmanager
+def render(page):
+    """Относит запросы, выполненные внутри блока (в том числе через runner), к отрисовке страницы page."""
+    current = Render(page)
+    token = _render.set(current)
+    try:
+        yield current
+    finally:
+        _render.reset(token)
+        current.elapsed = time.perf_counter() - current.started
+        with _lock:
+            stats = _renders.setdefault(current.page, _RenderStats())
+            stats.count += 1
+            stats.seconds += current.elapsed
+            stats.queries += len(current.queries)
+
+
+def set_page(page):
+    """Задаёт страницу текущей отрисовки (когда она становится известна в ходе отрисовки)."""
+    current = _render.get()
+    if current is not None:
+        current.page = page
+
+
+def _caller_name(depth):
+    frame = sys._getframe(depth + 1)
+    return f"{frame.f_globals.get('__name__', '?').rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+
+
+def redact(args):
+    """Параметры запроса для журнала: только типы (и длина строк), без значений."""
+    shown = []
+    for number, value in enumerate(args, start=1):
+        kind = type(value).__name__
+        if isinstance(value, (str, bytes, list, tuple)):
+            kind = f"{kind}[{len(value)}]"
+        shown.append(f"${number}={kind}")
+    return ", ".join(shown)
+
+
+def _row_count(result):
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        # Статус команды: 'UPDATE 3', 'INSERT 0 1', 'COPY 100'
+        last = result.rsplit(' ', 1)[-1]
+        return int(last) if last.isdigit() else 0
+    return 1
+
+
+def _is_cached(conn, query):
+    """Есть ли запрос в кэше подготовленных операторов соединения; None - если узнать нельзя.
+
+    Кэш (Connection._stmt_cache с ключом (текст, класс записи, ignore_custom_codec)) -
+    закрытая часть asyncpg: если её устройство изменится, prepare просто не считается."""
+    try:
+        return conn._stmt_cache.has((query, conn._protocol.get_record_class(), False))
+    except AttributeError:
+        return None
+
+
+def record(name, sql, args, elapsed, rows, failed, prepared=False):
+    query = Query(name, elapsed, rows, failed)
+    current = _render.get()
+    if current is not None:
+        current.queries.append(query)
+    with _lock:
+        stats = _queries.get(name)
+        if stats is None:
+            stats = _queries[name] = _QueryStats()
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.rows += rows
+        stats.errors += failed
+        stats.prepares += prepared
+        bucket = bisect.bisect_left(BUCKETS, elapsed)
+        if bucket < len(BUCKETS):
+            stats.buckets[bucket] += 1
+    if elapsed * 1000 >= config.SLOW_QUERY_MS:
+        logger.warning("Медленный запрос %s: %.1f мс, строк %d, страница %s: %s [%s]",
+                       name, elapsed * 1000, rows, current.page if current else "-",
+                       re.sub(r"\s+", " ", sql).strip(), redact(args))
+
+
+def _instrumented(method):
+    async def call(self, query, *args, **kwargs):
+        name = query.name if isinstance(query, queries.Statement) else _caller_name(1)
+        cached = _is_cached(self._conn, query) if method in CACHED_METHODS else None
+        started = time.perf_counter()
+        failed = True
+        rows = 0
+        try:
+            result = await getattr(self._conn, method)(query, *args, **kwargs)
+            failed = False
+            rows = _row_count(result)
+            return result
+        finally:
+            elapsed = time.perf_counter() - started
+            prepared = cached is False and _is_cached(self._conn, query) is True
+            record(name, query, args, elapsed, rows, failed, prepared)
+
+    call.__name__ = method
+    return call
+
+
+class InstrumentedConnection:
+    """Соединение, записывающее метрики своих запросов; остальные методы передаются как есть."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    fetch = _instrumented('fetch')
+    fetchrow = _instrumented('fetchrow')
+    fetchval = _instrumented('fetchval')
+    execute = _instrumented('execute')
+    executemany = _instrumented('executemany')
+    copy_to_table = _instrumented('copy_to_table')
+    copy_from_query = _instrumented('copy_from_query')
+    copy_records_to_table = _instrumented('copy_records_to_table')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """Сводные метрики процесса в текстовом формате Prometheus."""
+    with _lock:
+        queries = {name: (s.count, s.seconds, s.rows, s.errors, list(s.buckets), s.prepares)
+                   for name, s in _queries.items()}
+        renders = {page: (s.count, s.seconds, s.queries) for page, s in _renders.items()}
+
+    lines = [
+        "# HELP shop_query_duration_seconds Время запросов к базе по месту вызова.",
+        "# TYPE shop_query_duration_seconds histogram",
+    ]
+    for name, (count, seconds, _, _, buckets, _) in sorted(queries.items()):
+        cumulative = 0
+        for bound, hits in zip(BUCKETS, buckets):
+            cumulative += hits
+            lines.append(f'shop_query_duration_seconds_bucket{{query="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'shop_query_duration_seconds_bucket{{query="{_label(name)}",le="+Inf"}} {count}')
+        lines.append(f'shop_query_duration_seconds_sum{{query="{_label(name)}"}} {seconds}')
+        lines.append(f'shop_query_duration_seconds_count{{query="{_label(name)}"}} {count}')
+    lines += ["# HELP shop_query_rows_total Строк, возвращённых или изменённых запросами.",
+              "# TYPE shop_query_rows_total counter"]
+    lines += [f'shop_query_rows_total{{query="{_label(name)}"}} {q[2]}' for name, q in sorted(queries.items())]
+    lines += ["# HELP shop_query_errors_total Запросов, завершившихся ошибкой.",
+              "# TYPE shop_query_errors_total counter"]
+    lines += [f'shop_query_errors_total{{query="{_label(name)}"}} {q[3]}' for name, q in sorted(queries.items())]
+    lines += ["# HELP shop_query_prepares_total Разборов запроса сервером (промахов кэша подготовленных операторов).",
+              "# TYPE shop_query_prepares_total counter"]
+    lines += [f'shop_query_prepares_total{{query="{_label(name)}"}} {q[5]}' for name, q in sorted(queries.items())]
+    lines += ["# HELP shop_query_executions_total Выполнений запроса.",
+              "# TYPE shop_query_executions_total counter"]
+    lines += [f'shop_query_executions_total{{query="{_label(name)}"}} {q[0]}' for name, q in sorted(queries.items())]
+    lines += ["# HELP shop_render_duration_seconds Время отрисовки страниц.",
+              "# TYPE shop_render_duration_seconds summary"]
+    for page, (count, seconds, _) in sorted(renders.items()):
+        lines.append(f'shop_render_duration_seconds_sum{{page="{_label(page)}"}} {seconds}')
+        lines.append(f'shop_render_duration_seconds_count{{page="{_label(page)}"}} {count}')
+    lines += ["# HELP shop_render_queries_total Запросов к базе за отрисовки страницы.",
+              "# TYPE shop_render_queries_total counter"]
+    lines += [f'shop_render_queries_total{{page="{_label(page)}"}} {r[2]}' for page, r in sorted(renders.items())]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    """Запускает страницу /metrics, если задан config.METRICS_PORT (один раз на процесс)."""
+    global _server
+    if not config.METRICS_PORT:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        _server = http.server.ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
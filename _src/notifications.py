@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+import asyncpg
+
+from _src import config
+from _src import db
+
+# ----- LISTEN/NOTIFY -----
+# Одно выделенное соединение на процесс (не из пула: LISTEN занимает соединение
+# навсегда) слушает каналы, в которые пишут триггеры базы. Уведомления позволяют
+# сбрасывать кэши процесса, когда данные меняет другой процесс или прямой SQL.
+# Все функции выполняются в цикле _src.runner.
+
+logger = logging.getLogger(__name__)
+
+_callbacks = {}
+_conn = None
+_lock = None
+_reconnect_task = None
+
+RECONNECT_DELAY = 5
+
+
+def _dispatch(connection, pid, channel, payload):
+    for callback in list(_callbacks.get(channel, [])):
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Ошибка обработчика уведомления %s", channel)
+
+
+def _on_terminated(connection):
+    global _conn, _reconnect_task
+    _conn = None
+    if _reconnect_task is None or _reconnect_task.done():
+        _reconnect_task = asyncio.ensure_future(_reconnect())
+
+
+async def _reconnect():
+    while _conn is None:
+        await asyncio.sleep(RECONNECT_DELAY)
+        try:
+            await _connect()
+        except (OSError, asyncpg.PostgresError, asyncpg.exceptions.InterfaceError):
+            logger.warning("Не удалось переподключить слушателя уведомлений", exc_info=True)
+            continue
+        # Пока соединения не было, уведомления терялись - считаем устаревшим всё
+        for channel, callbacks in _callbacks.items():
+            for callback in callbacks:
+                callback(None)
+
+
+async def _connect():
+    global _conn
+    conn = await asyncpg.connect(**db.connect_options())
+    conn.add_termination_listener(_on_terminated)
+    for channel in _callbacks:
+        await conn.add_listener(channel, _dispatch)
+    _conn = conn
+
+
+async def listen(channel, callback):
+    """Подписывает callback(payload) на канал; payload None означает «возможно, пропущены уведомления»."""
+    global _lock, _reconnect_task
+    if not config.DB_LISTEN_NOTIFY:
+        return
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        is_new_channel = channel not in _callbacks
+        _callbacks.setdefault(channel, []).append(callback)
+        if _conn is None:
+            if _reconnect_task is None or _reconnect_task.done():
+                try:
+                    await _connect()
+                except (OSError, asyncpg.PostgresError, asyncpg.exceptions.InterfaceError):
+                    logger.warning("Слушатель уведомлений недоступен, повтор через %s с", RECONNECT_DELAY)
+                    _reconnect_task = asyncio.ensure_future(_reconnect())
+        elif is_new_channel:
+            await _conn.add_listener(channel, _dispatch)
+
@@ -0,0 +1,176 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import logging
+import pathlib
+import threading
+
+import asyncpg
+
+from _src import config
+from _src import db
+from _src import queries
+from _src import runner
+
+# ----- Секции заказов -----
+# orders и order_items секционированы по месяцам order_date
+# (migrations/009_order_partitions.sql), секции называются orders_ГГГГ_ММ и
+# order_items_ГГГГ_ММ. Процесс приложения раз в MAINTENANCE_INTERVAL секунд создаёт
+# секции на config.ORDER_PARTITIONS_AHEAD месяцев вперёд и, если задан
+# config.ORDER_ARCHIVE_AFTER_MONTHS, выгружает старые секции в сжатые CSV
+# (ORDER_ARCHIVE_DIR/<секция>.csv.gz) и удаляет их из базы. Вручную:
+# python -m tools.order_partitions ensure | archive | restore.
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL = 6 * 3600
+
+PARTITIONS_QUERY = queries.statement("order_partitions.partition_months", """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.orders'::regclass
+    ORDER BY c.relname
+""")
+
+OPEN_ORDERS_IN_MONTH_QUERY = queries.statement("order_partitions.open_orders_in_month", """
+    SELECT EXISTS (SELECT 1 FROM open_orders WHERE order_date >= $1 AND order_date < $2)
+""")
+
+# Недостающие секции orders и order_items для месяцев с $1 до $2 (не включая); возвращает число созданных
+CREATE_PARTITIONS_QUERY = queries.statement("order_partitions.create_partitions",
+                                            "SELECT shop_create_order_partitions($1, $2)")
+
+_maintenance_started = False
+_maintenance_lock = threading.Lock()
+
+
+def add_months(month, count):
+    """Первое число месяца, отстоящего от month на count месяцев."""
+    years, month_index = divmod(month.month - 1 + count, 12)
+    return datetime.date(month.year + years, month_index + 1, 1)
+
+
+def _suffix(month):
+    return month.strftime('%Y_%m')
+
+
+async def ensure_partitions(months_ahead=None):
+    """Создаёт недостающие секции с текущего месяца на months_ahead вперёд; возвращает число созданных."""
+    months_ahead = config.ORDER_PARTITIONS_AHEAD if months_ahead is None else months_ahead
+    current = datetime.date.today().replace(day=1)
+    async with db.connection() as conn:
+        return await conn.fetchval(CREATE_PARTITIONS_QUERY, current, add_months(current, months_ahead + 1))
+
+
+async def _partition_months(conn):
+    months = []
+    for row in await conn.fetch(PARTITIONS_QUERY):
+        try:
+            months.append(datetime.datetime.strptime(row['relname'][-7:], '%Y_%m').date())
+        except ValueError:
+            continue
+    return months
+
+
+async def _dump(conn, table, path):
+    """Копирует таблицу в сжатый CSV; возвращает число строк."""
+    with gzip.open(path, 'wb') as file:
+        status = await conn.copy_from_table(table, output=file, format='csv', header=True)
+    return int(status.split()[-1])
+
+
+def _count_dumped(path):
+    """Число записей в сжатом CSV (без заголовка), прочитанное обратно с диска."""
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as file:
+        return sum(1 for _ in csv.reader(file)) - 1
+
+
+async def _archive_month(conn, month, directory):
+    """Выгружает и удаляет секции месяца одной транзакцией: при любой ошибке обе остаются в базе."""
+    # Позиции раньше заказов: на строки заказов ссылается внешний ключ позиций
+    partitions = [(table, f"{table}_{_suffix(month)}") for table in ('order_items', 'orders')]
+    paths = [directory / f"{partition}.csv.gz" for _, partition in partitions]
+    try:
+        async with conn.transaction():
+            # SHARE не даёт менять строки секций до конца транзакции: выгрузка, проверка
+            # и удаление видят одни и те же данные
+            await conn.execute(f"LOCK TABLE {', '.join(p for _, p in partitions)} IN SHARE MODE")
+            for (_, partition), path in zip(partitions, paths):
+                rows = await conn.fetchval(f"SELECT count(*) FROM {partition}")
+                dumped = await _dump(conn, partition, path)
+                written = await asyncio.get_running_loop().run_in_executor(None, _count_dumped, path)
+                if not rows == dumped == written:
+                    raise RuntimeError(f"{partition}: в секции {rows} строк, выгружено {dumped}, в файле {written}")
+            for table, partition in partitions:
+                await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+                await conn.execute(f"DROP TABLE {partition}")
+    except BaseException:
+        # Секции остались в базе - неполный архив не должен выглядеть готовым
+        for path in paths:
+            path.unlink(missing_ok=True)
+        raise
+
+
+async def archive_partitions(older_than_months=None, directory=None):
+    """Выгружает секции, закончившиеся раньше older_than_months месяцев назад, в сжатые CSV и удаляет их.
+
+    Возвращает список архивированных месяцев (первые числа)."""
+    older_than_months = older_than_months or config.ORDER_ARCHIVE_AFTER_MONTHS
+    directory = pathlib.Path(directory or config.ORDER_ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    cutoff = add_months(datetime.date.today().replace(day=1), -older_than_months)
+    archived = []
+    async with db.connection() as conn:
+        for month in await _partition_months(conn):
+            if month >= cutoff:
+                continue
+            if await conn.fetchval(OPEN_ORDERS_IN_MONTH_QUERY, month, add_months(month, 1)):
+                logger.warning("Секция %s содержит открытые заказы и не архивируется", _suffix(month))
+                continue
+            await _archive_month(conn, month, directory)
+            archived.append(month)
+    return archived
+
+
+async def restore_partition(month, directory=None):
+    """Возвращает в базу архивированный месяц из ORDER_ARCHIVE_DIR; возвращает число заказов."""
+    directory = pathlib.Path(directory or config.ORDER_ARCHIVE_DIR)
+    restored = 0
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(CREATE_PARTITIONS_QUERY, month, add_months(month, 1))
+            for table in ('orders', 'order_items'):
+                with gzip.open(directory / f"{table}_{_suffix(month)}.csv.gz", 'rb') as file:
+                    # Столбцы берутся из заголовка: в архиве, выгруженном до добавления столбца
+                    # (например, orders.paid_at), его нет, и он остаётся NULL
+                    columns = next(csv.reader([file.readline().decode('utf-8')]))
+                    status = await conn.copy_to_table(table, source=file, columns=columns, format='csv')
+                if table == 'orders':
+                    restored = int(status.split()[-1])
+    return restored
+
+
+async def _maintain_forever():
+    while True:
+        try:
+            created = await ensure_partitions()
+            if created:
+                logger.info("Созданы секции заказов: %d", created)
+            if config.ORDER_ARCHIVE_AFTER_MONTHS:
+                for month in await archive_partitions():
+                    logger.info("Секция заказов %s выгружена в архив", _suffix(month))
+        except (OSError, RuntimeError, asyncpg.PostgresError, asyncpg.exceptions.InterfaceError):
+            logger.warning("Не удалось обслужить секции заказов", exc_info=True)
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+
+def start_maintenance():
+    """Запускает фоновое создание и архивацию секций заказов (один раз на процесс)."""
+    global _maintenance_started
+    with _maintenance_lock:
+        if _maintenance_started:
+            return
+        _maintenance_started = True
+    runner.submit(_maintain_forever())
@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+import logging
+import threading
+
+import asyncpg
+
+from _src import config
+from _src import db
+from _src import queries
+from _src import runner
+
+# ----- Открытый заказ покупателя -----
+# У покупателя не больше одного заказа 'в обработке': он записан в open_orders
+# (первичный ключ customer_id, migrations/009_order_partitions.sql) вместе с order_date -
+# секцией orders, где лежит заказ. Новая сессия, обновление страницы или повторный
+# вход получают тот же заказ вместо новой пустой строки.
+# Заказы, не тронутые дольше config.OPEN_ORDER_MAX_AGE_HOURS, фоновая задача процесса
+# переносит вместе с позициями в orders_archive / order_items_archive.
+
+logger = logging.getLogger(__name__)
+
+# Состояния заказа (orders.order_state): открытый и перенесённый в архив заброшенным
+OPEN = 'в обработке'
+EXPIRED = 'просрочен'
+
+# Существующий открытый заказ (его touched_at сдвигается - покупатель вернулся к корзине)
+# или новый. Строка open_orders вставляется первой с id из
+# последовательности (внешний ключ на orders проверяется в конце оператора); если заказ
+# одновременно создала другая сессия, запрос ничего не вернёт и повторится.
+ACQUIRE_QUERY = queries.statement("orders.acquire_open_order", f"""
+    WITH existing AS (
+        UPDATE open_orders
+        SET touched_at = NOW()
+        WHERE customer_id = $1
+        RETURNING order_id
+    ), registered AS (
+        INSERT INTO open_orders (customer_id, order_id, order_date)
+        SELECT $1, nextval('orders_id_seq'), DATE_TRUNC('minute', NOW())
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (customer_id) DO NOTHING
+        RETURNING order_id, order_date
+    ), created AS (
+        INSERT INTO orders (id, customer_id, order_date, order_summ, order_state)
+        SELECT order_id, $1, order_date, 0, '{OPEN}'
+        FROM registered
+    )
+    SELECT order_id FROM existing
+    UNION ALL
+    SELECT order_id FROM registered
+""")
+
+# Пачка заброшенных заказов - не тронутых дольше $1 (open_orders.touched_at сдвигают корзина
+# и acquire_open_order, migrations/012_open_orders_touched_at.sql). Заказы, которые сейчас
+# меняет корзина или оформление, пропускаются; строка open_orders тоже блокируется, поэтому
+# touched_at, сдвинутый параллельной транзакцией, перепроверяется.
+# Позиции и заказ удаляются по (id, order_date) - каждая строка ищется в своей секции.
+REAP_QUERY = queries.statement("orders.reap_stale_orders", f"""
+    WITH stale AS (
+        SELECT o.id, o.order_date
+        FROM open_orders oo
+        JOIN orders o ON o.id = oo.order_id AND o.order_date = oo.order_date
+        WHERE oo.touched_at < NOW() - $1::interval
+        ORDER BY oo.touched_at
+        LIMIT $2
+        FOR UPDATE OF o, oo SKIP LOCKED
+    ), items AS (
+        DELETE FROM order_items oi
+        USING stale
+        WHERE oi.order_id = stale.id AND oi.order_date = stale.order_date
+        RETURNING oi.id, oi.order_id, oi.order_date, oi.product_id, oi.quantity, oi.unitprice
+    ), archived_items AS (
+        INSERT INTO order_items_archive (id, order_id, order_date, product_id, quantity, unitprice)
+        SELECT id, order_id, order_date, product_id, quantity, unitprice FROM items
+    ), removed AS (
+        DELETE FROM orders o
+        USING stale
+        WHERE o.id = stale.id AND o.order_date = stale.order_date
+        RETURNING o.id, o.customer_id, o.order_date, o.order_summ
+    ), archived AS (
+        INSERT INTO orders_archive (id, customer_id, order_date, order_summ, order_state)
+        SELECT id, customer_id, order_date, order_summ, '{EXPIRED}' FROM removed
+        RETURNING id
+    )
+    SELECT count(*) FROM archived
+""")
+
+_reaper_started = False
+_reaper_lock = threading.Lock()
+
+
+async def acquire_open_order(customer_id):
+    """id открытого заказа покупателя; создаёт заказ, если открытого нет."""
+    async with db.connection() as conn:
+        while True:
+            order_id = await conn.fetchval(ACQUIRE_QUERY, customer_id)
+            if order_id is not None:
+                return order_id
+
+
+async def reap_stale_orders(max_age_hours=None, batch_size=None):
+    """Переносит в архив заказы 'в обработке', не тронутые дольше max_age_hours, пачками по batch_size; возвращает их число."""
+    max_age = datetime.timedelta(hours=config.OPEN_ORDER_MAX_AGE_HOURS if max_age_hours is None else max_age_hours)
+    batch_size = batch_size or config.OPEN_ORDER_REAP_BATCH
+    total = 0
+    while True:
+        # Каждая пачка - отдельная транзакция: блокировки держатся недолго
+        async with db.connection() as conn:
+            archived = await conn.fetchval(REAP_QUERY, max_age, batch_size)
+        total += archived
+        if archived < batch_size:
+            return total
+
+
+async def _reap_forever():
+    while True:
+        try:
+            archived = await reap_stale_orders()
+            if archived:
+                logger.info("В архив перенесено заброшенных заказов: %d", archived)
+        except (OSError, asyncpg.PostgresError, asyncpg.exceptions.InterfaceError):
+            logger.warning("Не удалось перенести заброшенные заказы в архив", exc_info=True)
+        await asyncio.sleep(config.OPEN_ORDER_REAP_INTERVAL)
+
+
+def start_reaper():
+    """Запускает фоновую архивацию заброшенных заказов (один раз на процесс; выключается интервалом 0)."""
+    global _reaper_started
+    if not config.OPEN_ORDER_REAP_INTERVAL:
+        return
+    with _reaper_lock:
+        if _reaper_started:
+            return
+        _reaper_started = True
+    runner.submit(_reap_forever())
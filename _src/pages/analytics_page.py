@@ -0,0 +1,197 @@
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from _src import config
+from _src import db
+from _src import queries
+from _src import runner
+from _src.pages import log_user
+
+
+# Страница читает только сводки продаж (migrations/011_sales_rollups.sql, _src/sales_rollups.py):
+# объём чтения зависит от выбранного периода и каталога, но не от истории заказов.
+PERIODS = {
+    7: "7 дней",
+    30: "30 дней",
+    90: "90 дней",
+    365: "Год",
+}
+
+STEPS = {
+    'D': "По дням",
+    'W': "По неделям",
+}
+
+# Разрезы: столбец -> (подпись столбца, название вкладки)
+GROUPS = {
+    'brand_name': ("Бренд", "По брендам"),
+    'category_name': ("Категория", "По категориям"),
+}
+
+DAILY_TOTALS_QUERY = queries.statement("analytics_page.fetch_daily_totals", """
+    SELECT day, orders, units, revenue::float8 AS revenue
+    FROM sales_daily_totals
+    WHERE day >= $1
+    ORDER BY day
+""")
+
+PRODUCT_SALES_QUERY = queries.statement("analytics_page.fetch_product_sales", """
+    SELECT s.product_id, b.brand_name, c.name AS category_name,
+           sum(s.units)::int8 AS units, sum(s.revenue)::float8 AS revenue
+    FROM sales_daily s
+    LEFT JOIN brands b ON b.id = s.brand_id
+    LEFT JOIN categories c ON c.id = s.category_id
+    WHERE s.day >= $1
+    GROUP BY s.product_id, b.brand_name, c.name
+""")
+
+PRODUCT_NAMES_QUERY = queries.statement("analytics_page.fetch_product_names",
+                                        "SELECT id, name FROM products WHERE id = ANY($1::int[])")
+
+
+async def fetch_daily_totals(since):
+    """Итоги оплаченных заказов по дням начиная с since: DataFrame day, orders, units, revenue."""
+    async with db.connection() as conn:
+        rows = await conn.fetch(DAILY_TOTALS_QUERY, since)
+    columns = list(zip(*rows)) if rows else [()] * 4
+    return pd.DataFrame({
+        'day': pd.to_datetime(pd.Series(columns[0], dtype=object)),
+        'orders': np.asarray(columns[1], dtype=np.int64),
+        'units': np.asarray(columns[2], dtype=np.int64),
+        'revenue': np.asarray(columns[3], dtype=np.float64),
+    })
+
+
+async def fetch_product_sales(since):
+    """Продажи каждого товара начиная с since с брендом и категорией."""
+    async with db.connection() as conn:
+        rows = await conn.fetch(PRODUCT_SALES_QUERY, since)
+    columns = list(zip(*rows)) if rows else [()] * 5
+    return pd.DataFrame({
+        'product_id': np.asarray(columns[0], dtype=np.int64),
+        'brand_name': pd.array(columns[1], dtype='string').fillna("—"),
+        'category_name': pd.array(columns[2], dtype='string').fillna("—"),
+        'units': np.asarray(columns[3], dtype=np.int64),
+        'revenue': np.asarray(columns[4], dtype=np.float64),
+    })
+
+
+async def fetch_product_names(product_ids):
+    """Названия только показываемых товаров: product_id -> name."""
+    async with db.connection() as conn:
+        rows = await conn.fetch(PRODUCT_NAMES_QUERY, product_ids)
+    return {row['id']: row['name'] for row in rows}
+
+
+def sales_series(daily, since, until, step):
+    """Ряд без пропусков (дни без продаж - нули) по дням или неделям со средним чеком."""
+    days = pd.date_range(since, until, freq='D')
+    series = daily.set_index('day').reindex(days, fill_value=0)
+    if step == 'W':
+        series = series.resample('W-MON', label='left', closed='left').sum()
+    orders = series['orders'].to_numpy(dtype=np.float64)
+    revenue = series['revenue'].to_numpy()
+    series['average_check'] = np.divide(revenue, orders, out=np.zeros_like(revenue), where=orders > 0)
+    return series
+
+
+def period_change(current, previous):
+    """Изменение к предыдущему периоду в процентах или None, если сравнивать не с чем."""
+    if not previous:
+        return None
+    return f"{(current - previous) / previous:+.1%}"
+
+
+def group_summary(sales, group, top_n):
+    """Итоги по группам (бренд или категория) и top_n товаров каждой группы по выручке."""
+    totals = sales.groupby(group, sort=False)[['units', 'revenue']].sum()
+    totals = totals.sort_values('revenue', ascending=False)
+    total_revenue = totals['revenue'].sum()
+    totals['share'] = totals['revenue'] / total_revenue if total_revenue else 0.0
+
+    ranked = sales.sort_values(['revenue', 'product_id'], ascending=[False, True], kind='stable')
+    ranked = ranked.assign(rank=ranked.groupby(group, sort=False).cumcount().to_numpy() + 1)
+    top = ranked[ranked['rank'] <= top_n]
+    group_revenue = top[group].map(totals['revenue']).to_numpy(dtype=np.float64)
+    top = top.assign(group_share=np.divide(top['revenue'].to_numpy(), group_revenue,
+                                           out=np.zeros(len(top)), where=group_revenue > 0))
+    # Группы идут в порядке выручки, товары внутри группы - по месту
+    order = pd.Categorical(top[group], categories=totals.index, ordered=True)
+    return totals, top.assign(**{group: order}).sort_values([group, 'rank'])
+
+
+def analytics_page():
+    st.title("Аналитика продаж")
+
+    user = log_user.current_user()
+    if user is None or user.role == 'customer':
+        st.error("Страница доступна только менеджерам")
+        st.session_state.role = 'customer'
+        time.sleep(3)
+        st.rerun()
+
+    col_period, col_step, col_top = st.columns(3)
+    with col_period:
+        days = st.selectbox("Период", list(PERIODS), index=1, format_func=PERIODS.get)
+    with col_step:
+        step = st.radio("Шаг", list(STEPS), format_func=STEPS.get, horizontal=True)
+    with col_top:
+        top_n = st.slider("Товаров в группе", min_value=1, max_value=20, value=5)
+
+    until = datetime.date.today()
+    since = until - datetime.timedelta(days=days - 1)
+    # Предыдущий период того же размера нужен для сравнения
+    daily, sales = runner.gather(fetch_daily_totals(since - datetime.timedelta(days=days)),
+                                 fetch_product_sales(since))
+    current = daily[daily['day'] >= pd.Timestamp(since)]
+    previous = daily[daily['day'] < pd.Timestamp(since)]
+
+    revenue, orders, units = (current[column].sum() for column in ('revenue', 'orders', 'units'))
+    col_revenue, col_orders, col_units, col_check = st.columns(4)
+    col_revenue.metric("Выручка", f"${revenue:,.2f}", period_change(revenue, previous['revenue'].sum()))
+    col_orders.metric("Заказов", f"{orders:,}", period_change(orders, previous['orders'].sum()))
+    col_units.metric("Продано штук", f"{units:,}", period_change(units, previous['units'].sum()))
+    col_check.metric("Средний чек", f"${revenue / orders:,.2f}" if orders else "—")
+    st.caption(f"Только оплаченные заказы, по дню оплаты; сводки обновляются раз в {config.SALES_ROLLUP_INTERVAL:g} с.")
+
+    series = sales_series(current, since, until, step)
+    st.subheader("Выручка")
+    st.line_chart(series[['revenue']])
+    st.subheader("Продано штук")
+    st.bar_chart(series[['units']])
+    st.subheader("Средний чек")
+    st.line_chart(series[['average_check']])
+
+    if sales.empty:
+        st.info("За выбранный период оплаченных заказов нет.")
+        return
+
+    summaries = {group: group_summary(sales, group, top_n) for group in GROUPS}
+    shown_ids = np.unique(np.concatenate([top['product_id'].to_numpy() for _, top in summaries.values()]))
+    names = runner.run(fetch_product_names(shown_ids.tolist()))
+
+    tabs = st.tabs([title for _, title in GROUPS.values()])
+    for tab, (group, (totals, top)) in zip(tabs, summaries.items()):
+        with tab:
+            label = GROUPS[group][0]
+            st.dataframe(
+                totals.reset_index().rename(columns={group: label, 'units': "Штук", 'revenue': "Выручка",
+                                                     'share': "Доля"}),
+                use_container_width=True, hide_index=True,
+            )
+            st.write(f"**Лучшие товары в каждой группе ({label.lower()})**")
+            product_names = top['product_id'].map(names).fillna(top['product_id'].map("удалённый товар #{}".format))
+            st.dataframe(
+                pd.DataFrame({
+                    label: top[group].astype('string'),
+                    "Место": top['rank'],
+                    "Товар": product_names,
+                    "Штук": top['units'],
+                    "Выручка": top['revenue'],
+                    "Доля в группе": top['group_share'],
+                }),
+                use_container_width=True, hide_index=True,
+            )
@@ -1,97 +1,252 @@
-import asyncio
-import asyncpg
 import streamlit as st
-from contextlib import asynccontextmanager
+from _src import cache
+from _src import cart
+from _src import config
+from _src import db
+from _src import orders
+from _src import queries
+from _src import runner
+from _src import search
+
+
+# Варианты сортировки каталога: выражение ключа и направление.
+# К ключу всегда добавляется p.id, чтобы порядок был строгим и пригодным для keyset-пагинации.
+SORT_OPTIONS = {
+    'name': ("COALESCE(p.name, '')", 'ASC'),
+    'price_asc': ("COALESCE(p.price, 0)", 'ASC'),
+    'price_desc': ("COALESCE(p.price, 0)", 'DESC'),
+    'rating': ("rs.avg_rate", 'DESC'),
+    'stock': ("COALESCE(p.stock_quantity, 0)", 'DESC'),
+}
+
+# Столбец products, от которого зависит порядок каждой сортировки (для сброса общего кэша каталога).
+# 'rating' - средняя оценка из product_rating_stats, её изменения приходят уведомлениями
+# migrations/010_product_rating_stats.sql.
+SORT_COLUMNS = {
+    'name': 'name',
+    'price_asc': 'price',
+    'price_desc': 'price',
+    'rating': 'rating',
+    'stock': 'stock_quantity',
+}
+
+SORT_LABELS = {
+    'name': "По названию",
+    'price_asc': "Сначала дешевле",
+    'price_desc': "Сначала дороже",
+    'rating': "По рейтингу",
+    'stock': "По остатку на складе",
+}
+
+
+# Варианты фильтра по минимальной средней оценке
+MIN_RATING_LABELS = {
+    None: "Любой",
+    4: "★ 4 и выше",
+    3: "★ 3 и выше",
+    2: "★ 2 и выше",
+}
+
+
+def build_products_query(search_query=None, brand_filter=None, category_filter=None,
+                         sort='name', after=None, limit=None, min_rating=None):
+    """Текст и параметры запроса страницы каталога (см. fetch_products)."""
+    sort_expr, direction = SORT_OPTIONS[sort]
+    if limit is None:
+        limit = config.CATALOGUE_PAGE_SIZE
+    # Сортировка по рейтингу идёт по индексу (avg_rate, product_id) сводки оценок,
+    # поэтому и второй ключ берётся из неё (он равен p.id)
+    id_expr = "rs.product_id" if sort == 'rating' else "p.id"
+
+    # Базовый SQL-запрос
+    query = f"""
+        SELECT p.id, p.name, p.description, p.price, p.stock_quantity, b.brand_name AS brand, c.name AS category,
+               {sort_expr} AS sort_key
+        FROM products p
+        LEFT JOIN brands b ON p.brand_id = b.id
+        LEFT JOIN categories c ON p.category_id = c.id
+    """
+    if sort == 'rating' or min_rating:
+        # Сводка есть у каждого товара (migrations/010_product_rating_stats.sql)
+        query += """
+        JOIN product_rating_stats rs ON rs.product_id = p.id
+        """
+    # Условия поиска и фильтрации
+    conditions = []
+    params = []
+
+
+    if search_query and search_query != "":
+        # Полнотекстовый и триграммный поиск по индексам вместо p.name LIKE '%...%'
+        conditions.append(search.match_condition(len(params) + 1))
+        params.append(search_query)
+
+    if brand_filter and brand_filter.strip():
+        # Обратите внимание на порядок $N: если нет search_query, это $1
+        conditions.append(f"b.brand_name = ${len(params) + 1}")
+        params.append(brand_filter)
+
+        # Фильтр по категории
+    if category_filter and category_filter.strip():
+        conditions.append(f"c.name = ${len(params) + 1}")
+        params.append(category_filter)
+
+    if min_rating:
+        conditions.append(f"rs.avg_rate >= ${len(params) + 1}")
+        params.append(min_rating)
+
+    # Keyset: продолжаем строго после последней строки предыдущей страницы
+    if after is not None:
+        comparison = '>' if direction == 'ASC' else '<'
+        conditions.append(f"({sort_expr}, {id_expr}) {comparison} (${len(params) + 1}, ${len(params) + 2})")
+        params.extend(after)
+
+    # Добавляем условия, если они существуют
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" ORDER BY {sort_expr} {direction}, {id_expr} {direction} LIMIT ${len(params) + 1}"
+    params.append(limit)
+
+    return query, params
+
+
+async def fetch_products(search_query=None, brand_filter=None, category_filter=None,
+                         sort='name', after=None, limit=None, min_rating=None):
+    """Получение страницы продуктов из базы данных с учетом фильтров и сортировки.
+
+    after - курсор (sort_key, id) последней строки предыдущей страницы, limit - размер страницы,
+    min_rating - минимальная средняя оценка.
+    Каждая строка содержит sort_key, из которого строится курсор следующей страницы."""
+    # Текст собирается из фильтров и сортировки, поэтому в реестр _src/queries.py не входит;
+    # каждый вариант всё равно разбирается один раз на соединение кэшем операторов asyncpg
+    query, params = build_products_query(search_query, brand_filter, category_filter, sort, after, limit,
+                                         min_rating)
+    async with db.connection() as conn:
+        result = await conn.fetch(query, *params)
+        return result
 
+def _dependencies(search_query, brand_filter, category_filter, sort=None, min_rating=None):
+    """Столбцы products, изменение которых может поменять состав или порядок страницы."""
+    columns = {SORT_COLUMNS.get(sort)} - {None}
+    if min_rating:
+        columns.add('rating')
+    if search_query:
+        columns |= {'name', 'description'}
+    if brand_filter:
+        columns.add('brand_id')
+    if category_filter:
+        columns.add('category_id')
+    return frozenset(columns)
 
 
-@asynccontextmanager
-async def get_db_connection():
-    conn = None
-    try:
-        conn = await asyncpg.connect(
-            host="localhost",
-            port=5432,
-            database="postgres",
-            user="postgres",
-            password="password"
-        )
-        yield conn
-    finally:
-        if conn:
-            await conn.close()
-
-
-async def fetch_products(search_query=None, brand_filter=None, category_filter=None):
-    """Получение информации о продуктах из базы данных с учетом фильтров."""
-    async with get_db_connection() as conn:
-        # Базовый SQL-запрос
-        query = """
-            SELECT p.id, p.name, p.description, p.price, p.stock_quantity, b.brand_name AS brand, c.name AS category
-            FROM products p
-            LEFT JOIN brands b ON p.brand_id = b.id
-            LEFT JOIN categories c ON p.category_id = c.id
-        """
-        # Условия поиска и фильтрации
-        conditions = []
-        params = []
+async def fetch_products_cached(search_query=None, brand_filter=None, category_filter=None,
+                                sort='name', after=None, limit=None, min_rating=None):
+    """fetch_products через общий для всех сессий кэш каталога (cache.products)."""
+    async def load():
+        return [dict(row) for row in await fetch_products(search_query, brand_filter, category_filter,
+                                                          sort, after, limit, min_rating)]
 
+    key = ('page', search_query, brand_filter, category_filter, sort, after, limit, min_rating,
+           _dependencies(search_query, brand_filter, category_filter, sort, min_rating))
+    return await cache.products.get(key, load)
 
-        if search_query and search_query != "":
-            conditions.append(f"p.name LIKE ${len(params) + 1}")
-            params.append(f"%{search_query}%")
 
-        if brand_filter and brand_filter.strip():
-            # Обратите внимание на порядок $N: если нет search_query, это $1
-            conditions.append(f"b.brand_name = ${len(params) + 1}")
-            params.append(brand_filter)
+async def search_products_cached(search_query, brand_filter=None, category_filter=None, min_rating=None):
+    """search.search_products через общий кэш каталога."""
+    async def load():
+        return [dict(row) for row in await search.search_products(search_query, brand_filter, category_filter,
+                                                                  min_rating=min_rating)]
 
-            # Фильтр по категории
-        if category_filter and category_filter.strip():
-            conditions.append(f"c.name = ${len(params) + 1}")
-            params.append(category_filter)
+    key = ('search', search_query, brand_filter, category_filter, min_rating,
+           _dependencies(search_query, brand_filter, category_filter, min_rating=min_rating))
+    return await cache.products.get(key, load)
 
-        # Добавляем условия, если они существуют
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
 
-        result = await conn.fetch(query, *params)
-        return result
+BRANDS_QUERY = queries.statement("buy_products.load_brands", "SELECT DISTINCT brand_name FROM brands")
+CATEGORIES_QUERY = queries.statement("buy_products.load_categories", "SELECT DISTINCT name FROM categories")
+STOCK_UPDATE_QUERY = queries.statement("buy_products.update_product_stock_quantity",
+                                       "UPDATE products SET stock_quantity = stock_quantity + $1 WHERE id = $2")
 
-async def fetch_brands():
+
+async def load_brands():
     """Получение списка брендов из базы данных."""
-    async with get_db_connection() as conn:
-        query = "SELECT DISTINCT brand_name FROM brands"
-        result = await conn.fetch(query)
+    async with db.connection() as conn:
+        result = await conn.fetch(BRANDS_QUERY)
         return [record['brand_name'] for record in result]
 
 
-async def fetch_categories():
+async def load_categories():
     """Получение списка категорий из базы данных."""
-    async with get_db_connection() as conn:
-        query = "SELECT DISTINCT name FROM categories"
-        result = await conn.fetch(query)
+    async with db.connection() as conn:
+        result = await conn.fetch(CATEGORIES_QUERY)
         return [record['name'] for record in result]
 
+
+async def fetch_brands():
+    """Список брендов для фильтра из общего кэша справочников (без запроса к базе при попадании)."""
+    return await cache.reference_data.get('brands', load_brands)
+
+
+async def fetch_categories():
+    """Список категорий для фильтра из общего кэша справочников."""
+    return await cache.reference_data.get('categories', load_categories)
+
 async def update_product_stock_quantity(product_id, stock_diff):
-    async with get_db_connection() as conn:
-        query = '''UPDATE products
-                          SET stock_quantity = stock_quantity + $1
-                          WHERE id = $2'''
-        conn.execute(query, stock_diff, product_id)
-        conn.commit()
-
-
-async def fetch_reviews(product_id):
-    """Получение отзывов о конкретном товаре из базы данных."""
-    async with get_db_connection() as conn:
-        query = '''SELECT c.name, r.comment, r.rate
-                   FROM reviews r
-                   JOIN customers c 
-                   ON r.customer_id = c.id
-                   WHERE r.product_id = $1'''
-        result = await conn.fetch(query, product_id)
-        return result
+    async with db.connection() as conn:
+        await conn.execute(STOCK_UPDATE_QUERY, stock_diff, product_id)
+
+
+# Отзывы и оценки читаются при каждой отрисовке каталога (_src/queries.py).
+# Последние отзывы каждого товара читаются по индексу (product_id, date)
+REVIEWS_QUERY = queries.statement("buy_products.fetch_reviews", """
+    SELECT r.product_id, c.name, r.comment, r.rate
+    FROM unnest($1::int[]) AS p(id)
+    CROSS JOIN LATERAL (
+        SELECT product_id, customer_id, comment, rate, date
+        FROM reviews
+        WHERE product_id = p.id
+        ORDER BY date DESC
+        LIMIT $2
+    ) r
+    JOIN customers c
+    ON r.customer_id = c.id
+    ORDER BY r.product_id, r.date
+""")
+
+RATING_STATS_QUERY = queries.statement("buy_products.fetch_rating_stats", """
+    SELECT product_id, review_count, rate_count, avg_rate,
+           rate_1, rate_2, rate_3, rate_4, rate_5
+    FROM product_rating_stats
+    WHERE product_id = ANY($1::int[])
+""")
+
+
+async def fetch_reviews(product_ids):
+    """Получение отзывов сразу для нескольких товаров одним запросом.
+
+    Возвращает словарь product_id -> {'reviews': [...], 'count': N, 'avg_rate': средняя оценка или None,
+    'histogram': [число оценок 1..5]}. Число, средняя и гистограмма берутся из product_rating_stats,
+    отзывов возвращается не больше config.REVIEWS_SHOWN последних."""
+    reviews = {product_id: {'reviews': [], 'count': 0, 'avg_rate': None, 'histogram': [0] * 5}
+               for product_id in product_ids}
+    if not reviews:
+        return reviews
+
+    async with db.connection() as conn:
+        rows = await conn.fetch(REVIEWS_QUERY, list(reviews), config.REVIEWS_SHOWN)
+        stats = await conn.fetch(RATING_STATS_QUERY, list(reviews))
+
+    for row in rows:
+        reviews[row['product_id']]['reviews'].append(row)
+
+    for row in stats:
+        summary = reviews[row['product_id']]
+        summary['count'] = row['review_count']
+        summary['avg_rate'] = row['avg_rate'] if row['rate_count'] else None
+        summary['histogram'] = [row[f'rate_{rate}'] for rate in range(1, 6)]
+
+    return reviews
 
 
 # Инициализация корзины в session_state
@@ -99,79 +254,52 @@ if 'cart' not in st.session_state:
     st.session_state.cart = {}
 
 
-async def add_to_cart(product_id, name, price, quantity):
+def add_to_cart(customer_id, product_id, name, price, quantity, stock_quantity):
     """Добавление товара в корзину и в order_items."""
-    order_id = st.session_state.order_id
     if product_id in st.session_state.cart:
         st.info("Товар уже у вас в корзине")
         return
-    else:
-        # Добавляем новый товар в корзину и базу
-        st.session_state.cart[product_id] = {
-            'name': name,
-            'price': price,
-            'quantity': quantity
-        }
 
-        await add_item_to_order(order_id, product_id, quantity, price)
+    # Позиция заказа и стоимость заказа в таблице orders обновляются вместе
+    total = runner.run(cart.add_item(st.session_state.order_id, product_id, quantity, price))
+    if total is None:
+        # Заказ сессии уже не открыт (оплачен в другой вкладке или перенесён в архив) -
+        # берём открытый заказ покупателя заново вместе с его корзиной
+        st.session_state.order_id = runner.run(orders.acquire_open_order(customer_id))
+        st.session_state.cart = {
+            item.product_id: item for item in runner.run(cart.load_cart(st.session_state.order_id))
+        }
+        if product_id in st.session_state.cart:
+            st.info("Товар уже у вас в корзине")
+            return
+        total = runner.run(cart.add_item(st.session_state.order_id, product_id, quantity, price))
+    if total is None:
+        st.error("Не удалось добавить товар в корзину, попробуйте ещё раз.")
+        return
 
-    await update_order_summary(order_id)  # Обновляем стоимость заказа в таблице orders
+    st.session_state.cart[product_id] = cart.CartItem(product_id, name, price, quantity, price, stock_quantity)
     st.success(f"Товар '{name}' ({quantity} шт.) успешно добавлен в корзину!")
 
 
-async def create_new_order(customer_id):
-    """Создание новой строки в таблице orders."""
-    async with get_db_connection() as conn:
-        query = """
-            INSERT INTO orders (customer_id, order_date, order_summ, order_state)
-            VALUES ($1, DATE_TRUNC('minute', NOW()), $2, $3)
-            RETURNING id
-        """
-        # await conn.execute(query, (customer_id, 0, 'в обработке'))  # Сумма заказа пока нулевая
-        results = await conn.fetch(query, customer_id, 0, 'в обработке')
-
-        # Вытаскиваем id из первой строки результата
-        return results[0]['id'] if results else None
-
-
-async def add_item_to_order(order_id, product_id, quantity, unitprice):
-    """Добавление товара в таблицу order_items."""
-    async with get_db_connection() as conn:
-        query = """
-            INSERT INTO order_items (order_id, product_id, quantity, unitprice)
-            VALUES ($1, $2, $3, $4)
-        """
-        await conn.execute(query, order_id, product_id, quantity, unitprice)
-
-
-
-async def update_order_summary(order_id):
-    """Обновление общей суммы в таблице orders."""
-    async with get_db_connection() as conn:
-        query = """
-            UPDATE orders
-            SET order_summ = (
-                SELECT SUM(quantity * unitprice)
-                FROM order_items
-                WHERE order_id = $1
-            )
-            WHERE id = $1
-        """
-        await conn.execute(query, order_id)
-
-
-
 def purchase_page(customer_id):
     """Страница просмотра товаров и добавления в корзину."""
     st.title("Покупка товаров")
     st.sidebar.info("🔵 Используйте эту страницу для оформления покупок.")
 
+    # Независимые запросы выполняются конкурентно в одном цикле событий
     if 'order_id' not in st.session_state:
-        st.session_state.order_id = asyncio.run(create_new_order(customer_id))
-
+        st.session_state.order_id, brands, categories = runner.gather(
+            orders.acquire_open_order(customer_id), fetch_brands(), fetch_categories()
+        )
+        # Открытый заказ мог остаться от прошлой сессии - корзина сессии берётся из него
+        st.session_state.cart = {
+            item.product_id: item for item in runner.run(cart.load_cart(st.session_state.order_id))
+        }
+    else:
+        brands, categories = runner.gather(fetch_brands(), fetch_categories())
 
-    all_brands = ["Все"] + asyncio.run(fetch_brands())
-    all_categories = ["Все"] + asyncio.run(fetch_categories())
+    all_brands = ["Все"] + brands
+    all_categories = ["Все"] + categories
 
     st.sidebar.header("Фильтры")
     search_query = st.sidebar.text_input("Поиск по названию товара")
@@ -180,12 +308,32 @@ def purchase_page(customer_id):
     selected_brand = st.sidebar.selectbox("Фильтр по бренду", all_brands)
     selected_category = st.sidebar.selectbox("Фильтр по категории", all_categories)
 
+    sort = st.sidebar.selectbox("Сортировка", list(SORT_LABELS), format_func=SORT_LABELS.get)
+    min_rating = st.sidebar.selectbox("Рейтинг", list(MIN_RATING_LABELS), format_func=MIN_RATING_LABELS.get)
+
     # Преобразуем выбор пользователя
     brand_filter = None if selected_brand == "Все" else selected_brand
     category_filter = None if selected_category == "Все" else selected_category
 
-    # Получение продуктов с учетом фильтров
-    products = asyncio.run(fetch_products(search_query, brand_filter, category_filter))
+    # Курсоры начала просмотренных страниц; при смене фильтров или сортировки листаем с начала
+    catalogue_filters = (search_query, brand_filter, category_filter, sort, min_rating)
+    if st.session_state.get('catalogue_filters') != catalogue_filters:
+        st.session_state.catalogue_filters = catalogue_filters
+        st.session_state.catalogue_cursors = [None]
+
+    if search_query:
+        # Поиск показывает лучшие совпадения по релевантности с подсветкой, без постраничного вывода
+        products = runner.run(search_products_cached(search_query, brand_filter, category_filter, min_rating))
+        has_next_page = False
+    else:
+        # Получение одной страницы продуктов; лишняя строка показывает, есть ли следующая страница
+        page_size = config.CATALOGUE_PAGE_SIZE
+        # Страница берётся из общего кэша: повторные обновления страницы не обращаются к базе
+        products = runner.run(fetch_products_cached(search_query, brand_filter, category_filter, sort,
+                                                    after=st.session_state.catalogue_cursors[-1],
+                                                    limit=page_size + 1, min_rating=min_rating))
+        has_next_page = len(products) > page_size
+        products = products[:page_size]
 
     if products is not None:
         if int(len(products)) == 0:
@@ -197,18 +345,32 @@ def purchase_page(customer_id):
         if rerun_button:
             st.rerun()
 
+        # Отзывы по всем товарам в наличии загружаются одним запросом, а не по одному в цикле отрисовки
+        reviews_by_product = runner.run(fetch_reviews(
+            [product['id'] for product in products if product['stock_quantity'] > 0]
+        ))
+
         for product in products:
             if product['stock_quantity'] > 0:
-                with st.expander(f"{product['name']} - ${product['price']}"):
-                    st.write(f"**Описание:** {product['description']}")
+                product_reviews = reviews_by_product[product['id']]
+                rating = ""
+                if product_reviews['avg_rate'] is not None:
+                    rating = f" - ★ {product_reviews['avg_rate']:.1f} ({product_reviews['count']} отз.)"
+
+                name = product['name_highlight'] if search_query else product['name']
+                description = product['description_highlight'] if search_query else product['description']
+
+                with st.expander(f"{name} - ${product['price']}{rating}"):
+                    st.write(f"**Описание:** {description}")
                     st.write(f"**Цена:** ${product['price']}")
                     st.write(f"**Остаток на складе:** {product['stock_quantity']}")
 
                     # Просмотр отзывов
                     st.subheader("Отзывы о товаре")
-                    reviews = asyncio.run(fetch_reviews(product['id']))
-                    if reviews:
-                        for review in reviews:
+                    if product_reviews['reviews']:
+                        st.caption("  ".join(f"★{rate}: {count}"
+                                             for rate, count in enumerate(product_reviews['histogram'], 1)))
+                        for review in product_reviews['reviews']:
                             st.write(f"📜 {review['name']}: {review['comment']} (Оценка: {review['rate']}/5)")
                     else:
                         st.write("Пока отзывов нет.")
@@ -225,12 +387,29 @@ def purchase_page(customer_id):
                         add_button = st.form_submit_button("Добавить в корзину")
                         if add_button:
                             if product['stock_quantity'] >= quantity:
-                                asyncio.run(add_to_cart(product['id'], product['name'], product['price'], quantity))
+                                add_to_cart(customer_id, product['id'], product['name'], product['price'], quantity,
+                                            product['stock_quantity'])
                             else:
                                 st.error("Недостаточно товара на складе для добавления в корзину.")
             else:
                 st.warning(f"Товара {product['name']} пока нет в наличии")
 
+        # Переключение страниц каталога (при поиске выводятся только лучшие совпадения)
+        if not search_query:
+            cursors = st.session_state.catalogue_cursors
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if st.button("← Назад", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with col_page:
+                st.write(f"Страница {len(cursors)}")
+            with col_next:
+                if st.button("Вперёд →", disabled=not has_next_page):
+                    last = products[-1]
+                    cursors.append((last['sort_key'], last['id']))
+                    st.rerun()
+
     elif products is None:
         st.warning("Список товаров временно недоступен.")
     else:
@@ -0,0 +1,21 @@
+import pandas as pd
+import streamlit as st
+
+
+def dev_panel(render):
+    """Панель разработчика в боковой панели: запросы к базе за отрисовку страницы (config.DEV_PANEL)."""
+    with st.sidebar.expander("Запросы к базе"):
+        st.caption(f"{render.page}: отрисовка {render.elapsed * 1000:.0f} мс, запросов {len(render.queries)}, "
+                   f"в базе {render.query_time() * 1000:.0f} мс")
+        if not render.queries:
+            return
+        queries = pd.DataFrame(
+            [(query.name, query.elapsed * 1000, query.rows, query.failed) for query in render.queries],
+            columns=["запрос", "мс", "строк", "ошибок"],
+        )
+        # Повторяющиеся запросы одного места вызова (N+1) видны по столбцу «раз»
+        summary = (queries.groupby("запрос")
+                   .agg(раз=("мс", "size"), мс=("мс", "sum"), строк=("строк", "sum"), ошибок=("ошибок", "sum"))
+                   .sort_values("мс", ascending=False)
+                   .round({"мс": 1}))
+        st.dataframe(summary, use_container_width=True)
@@ -1,48 +1,32 @@
 import streamlit as st
-import asyncpg
-import asyncio
-from contextlib import asynccontextmanager
+from _src import db
+from _src import queries
+from _src import runner
+from _src import users
 
+USERS_QUERY = queries.statement("edit_managers.fetch_users", """
+    SELECT c.id AS user_id, r.role AS _role, c.name AS name
+    FROM customers c
+    JOIN roles r
+    ON c.role = r.id
+""")
 
-# Функция для подключения к БД
-@asynccontextmanager
-async def get_db_connection():
-    conn = None
-    try:
-        conn = await asyncpg.connect(
-            host="localhost",
-            port=5432,
-            database="postgres",
-            user="postgres",
-            password="password"
-        )
-        yield conn
-    finally:
-        if conn:
-            await conn.close()
-
+UPDATE_ROLE_QUERY = queries.statement("edit_managers.update_user_role", "UPDATE customers SET role = $1 WHERE id = $2")
 
 # Функция для получения текущих пользователей
 async def fetch_users():
-    async with get_db_connection() as conn:
-        query = '''SELECT *
-                        FROM (
-        		              SELECT c.id AS user_id, r.role AS _role, c.name AS name
-        		              FROM customers c
-        		              JOIN roles r
-        		              ON c.role = r.id)'''
-        result = await conn.fetch(query)
+    async with db.connection() as conn:
+        result = await conn.fetch(USERS_QUERY)
         return result
 
 
 
 # Функция для обновления роли пользователя
 async def update_user_role(user_id, new_role):
-    async with get_db_connection() as conn:
-        query = "UPDATE customers SET role = $1 WHERE id = $2"
-        await conn.execute(
-            query, new_role, user_id
-        )
+    async with db.connection() as conn:
+        await conn.execute(UPDATE_ROLE_QUERY, new_role, user_id)
+    # Новая роль действует со следующего обновления страницы пользователя
+    users.invalidate(user_id)
 
 
 # Определение страницы Streamlit
@@ -50,12 +34,12 @@ def manager_page():
     st.title("Управление менеджерами")
 
     # Загружаем всех пользователей из базы
-    users = asyncio.run(fetch_users())
+    manager_rows = runner.run(fetch_users())
 
     # Интерфейс таблицы с пользователями
-    if users:
+    if manager_rows:
         st.subheader("Список сотрудников:")
-        for user in users:
+        for user in manager_rows:
             col1, col2, col3 = st.columns([1, 4, 2])
 
             with col1:
@@ -65,11 +49,11 @@ def manager_page():
             with col3:
                 if user["_role"] == 'customer':  # Обычный сотрудник
                     if st.button(f"Назначить менеджером", key=f"make_manager_{user['user_id']}"):
-                        asyncio.run(update_user_role(user["user_id"], 2))
+                        runner.run(update_user_role(user["user_id"], 2))
                         st.rerun()
                 elif user["_role"] == 'manager':  # Менеджер
                     if st.button(f"Снять права менеджера", key=f"remove_manager_{user['user_id']}"):
-                        asyncio.run(update_user_role(user["user_id"], 1))
+                        runner.run(update_user_role(user["user_id"], 1))
                         st.rerun()
     else:
         st.warning("Нет доступных сотрудников в базе данных.")
\ No newline at end of file
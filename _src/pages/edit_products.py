@@ -1,110 +1,186 @@
-import asyncio
+import os
+import pathlib
+import tempfile
+
 import asyncpg
 import streamlit as st
-from contextlib import asynccontextmanager
 import pandas as pd
 import time
+from _src import catalogue_io
+from _src import config
+from _src import db
+from _src import product_sync
+from _src import runner
+from _src import search
+from _src.pages import buy_products
+from _src.pages import log_user
+
+
+# Столбцы таблицы товаров и их типы в DataFrame: столбцы строятся сразу из записей, без словарей
+PRODUCT_COLUMNS = {
+    'product_id': 'Int64',
+    'product_name': 'string',
+    'description': 'string',
+    'price': 'Float64',
+    'stock_quantity': 'Int64',
+    'brand_name': 'string',
+    'category_name': 'string',
+}
+
+# Ключ сортировки окна таблицы совпадает с индексом (COALESCE(name, ''), id) из migrations/002_indexes.sql
+WINDOW_SORT_KEY = "COALESCE(p.name, '')"
+
+
+def build_products_window_query(brand_filter=None, category_filter=None, name_search=None, low_stock=False,
+                                after=None, limit=None):
+    """Текст и параметры запроса одного окна таблицы товаров (см. get_products_dataframe)."""
+    if limit is None:
+        limit = config.MANAGEMENT_PAGE_SIZE
+
+    query = f"""
+        SELECT p.id AS product_id,
+               p.name AS product_name,
+               p.description,
+               p.price::float8 AS price,
+               p.stock_quantity,
+               b.brand_name AS brand_name,
+               c.name AS category_name
+        FROM products p
+        LEFT JOIN brands b ON p.brand_id = b.id
+        LEFT JOIN categories c ON p.category_id = c.id
+    """
+    conditions = []
+    params = []
+
+    if brand_filter:
+        conditions.append(f"b.brand_name = ${len(params) + 1}")
+        params.append(brand_filter)
+
+    if category_filter:
+        conditions.append(f"c.name = ${len(params) + 1}")
+        params.append(category_filter)
+
+    if name_search:
+        conditions.append(search.match_condition(len(params) + 1))
+        params.append(name_search)
+
+    if low_stock:
+        conditions.append(f"COALESCE(p.stock_quantity, 0) <= ${len(params) + 1}")
+        params.append(config.LOW_STOCK_THRESHOLD)
+
+    # Keyset: окно начинается строго после последней строки предыдущего
+    if after is not None:
+        conditions.append(f"({WINDOW_SORT_KEY}, p.id) > (${len(params) + 1}, ${len(params) + 2})")
+        params.extend(after)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" ORDER BY {WINDOW_SORT_KEY}, p.id LIMIT ${len(params) + 1}"
+    params.append(limit)
+
+    return query, params
+
+
+def records_to_dataframe(rows):
+    """DataFrame товаров из записей asyncpg: по типизированному массиву на столбец."""
+    columns = list(zip(*rows)) if rows else [()] * len(PRODUCT_COLUMNS)
+    return pd.DataFrame({
+        name: pd.array(values, dtype=dtype)
+        for (name, dtype), values in zip(PRODUCT_COLUMNS.items(), columns)
+    })
+
+
+async def get_products_dataframe(brand_filter=None, category_filter=None, name_search=None, low_stock=False,
+                                 after=None, limit=None):
+    """Окно таблицы товаров с фильтрами, упорядоченное по названию.
+
+    after - курсор (название, id) последней строки предыдущего окна."""
+    query, params = build_products_window_query(brand_filter, category_filter, name_search, low_stock, after, limit)
+    async with db.connection() as conn:
+        rows = await conn.fetch(query, *params)
+        return records_to_dataframe(rows)
+
+
+def import_section():
+    """Загрузка товаров из CSV или Parquet с ходом выполнения и списком отклонённых строк."""
+    uploaded = st.file_uploader("Файл с товарами", type=["csv", "parquet"], key="catalogue_import_file")
+    st.caption("Столбцы: " + ", ".join(catalogue_io.COLUMNS) + ". Строки без product_id добавляются как новые товары.")
+    if uploaded is None or not st.button("Импортировать"):
+        return
+
+    report = catalogue_io.ImportReport()
+    future = runner.submit(catalogue_io.import_catalogue(uploaded, catalogue_io.file_format(uploaded.name), report))
+    progress = st.progress(0.0, text="Импорт...")
+    # Импорт идёт в цикле runner, страница только показывает счётчики отчёта
+    while not future.done():
+        if report.total:
+            progress.progress(min(report.read / report.total, 1.0), text=f"Прочитано строк: {report.read}")
+        else:
+            progress.progress(0.0, text=f"Прочитано строк: {report.read}")
+        time.sleep(0.2)
 
-# Асинхронный контекст для подключения к базе данных
-@asynccontextmanager
-async def get_connection():
-    conn = None
     try:
-        conn = await asyncpg.connect(
-            host="localhost",
-            port=5432,
-            database="postgres",
-            user="postgres",
-            password="password"
-        )
-        yield conn
-    finally:
-        if conn:
-            await conn.close()
-
-async def check_customer(id):
-    async with get_connection() as conn:
-        query = '''SELECT * 
-                   FROM customers 
-                   JOIN roles ON customers.ROLE = roles.id
-                   WHERE customers.id = $1'''
-        user = await conn.fetchrow(query, id)
-        return user
-
-
-# Асинхронная функция для получения продуктов в формате DataFrame
-async def get_products_dataframe():
-    async with get_connection() as conn:
-        query = '''
-            SELECT p.id AS product_id,
-                   p.name AS product_name,
-                   description,
-                   price,
-                   stock_quantity,
-                   b.brand_name AS brand_name,
-                   c.name AS category_name
-            FROM products p
-            JOIN brands b ON p.brand_id = b.id
-            JOIN categories c ON p.category_id = c.id
-            ORDER BY product_name
-        '''
-        rows = await conn.fetch(query)
-        df = pd.DataFrame([dict(row) for row in rows])
-        return df
-
-
-# Асинхронная операция добавления, удаления или изменения через DataFrame
-async def sync_dataframe_changes(df: pd.DataFrame, original_ids: list):
-    async with get_connection() as conn:
-        for index, row in df.iterrows():
-            product_id = row['product_id']
-
-            # Если запись существует в базе данных, обновляем ее, иначе добавляем
-            if product_id in original_ids:
-                query = '''
-                    UPDATE products
-                    SET name = $1, description = $2, price = $3, stock_quantity = $4
-                    WHERE id = $5
-                '''
-                await conn.execute(query, row['product_name'], row['description'], row['price'], row['stock_quantity'],
-                                   product_id)
-            else:
-                category_id = await find_category_id(conn, row['category_name'])
-                brand_id = await find_brand_id(conn, row['brand_name'])
-                query = '''
-                    INSERT INTO products (name, description, price, stock_quantity, category_id, brand_id)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                '''
-                await conn.execute(query, row['product_name'], row['description'], row['price'], row['stock_quantity'],
-                                   category_id, brand_id)
-
-        # Удаление записей, которые отсутствуют в текущей версии DataFrame
-        ids_to_delete = list(set(original_ids) - set(df['product_id']))
-        if ids_to_delete:
-            await conn.execute("DELETE FROM order_items WHERE product_id = ANY($1)", ids_to_delete)
-            await conn.execute("DELETE FROM products WHERE id = ANY($1)", ids_to_delete)
-
-
-async def find_category_id(conn, category_name):
-    query = "SELECT id FROM categories WHERE name = $1"
-    category_id = await conn.fetchval(query, category_name)
-
-    if not category_id:
-        query_insert = "INSERT INTO categories (name) VALUES ($1) RETURNING id"
-        category_id = await conn.fetchval(query_insert, category_name)
-
-    return category_id
-
-
-async def find_brand_id(conn, brand_name):
-    query = "SELECT id FROM brands WHERE brand_name = $1"
-    brand_id = await conn.fetchval(query, brand_name)
-
-    if not brand_id:
-        query_insert = "INSERT INTO brands (brand_name) VALUES ($1) RETURNING id"
-        brand_id = await conn.fetchval(query_insert, brand_name)
-
-    return brand_id
+        future.result()
+    except ValueError as error:
+        progress.empty()
+        st.error(f"Файл не импортирован: {error}")
+        return
+    except asyncpg.PostgresError as error:
+        # Импорт идёт одной транзакцией: после ошибки в базе не осталось ничего из файла
+        progress.empty()
+        if report.chunk is not None:
+            number, first_line, last_line = report.chunk
+            st.error(f"Файл не импортирован: ошибка базы данных в куске {number} "
+                     f"(строки {first_line}–{last_line}): {error}")
+        else:
+            st.error(f"Файл не импортирован: ошибка базы данных при сохранении товаров: {error}")
+        return
+
+    progress.progress(1.0, text=f"Прочитано строк: {report.read}")
+    st.success(f"Импорт завершён. Добавлено: {report.inserted}, обновлено: {report.updated}, "
+               f"отклонено: {report.rejected}")
+    if report.rejected_rows:
+        rejected_df = pd.DataFrame(report.rejected_rows, columns=["Строка", "Причина"])
+        if report.rejected > len(report.rejected_rows):
+            st.warning(f"Показаны первые {len(report.rejected_rows)} отклонённых строк из {report.rejected}")
+        st.dataframe(rejected_df, use_container_width=True)
+        st.download_button("Скачать отклонённые строки", rejected_df.to_csv(index=False).encode('utf-8'),
+                           file_name="rejected_rows.csv", mime="text/csv")
+
+
+def _discard_export():
+    """Удаляет подготовленную выгрузку: временный файл и запись в сессии."""
+    export = st.session_state.pop('catalogue_export', None)
+    if export is not None:
+        pathlib.Path(export[0]).unlink(missing_ok=True)
+
+
+def export_section():
+    """Выгрузка всего каталога в CSV или Parquet во временный файл; файл удаляется после скачивания."""
+    fmt = st.radio("Формат выгрузки", [catalogue_io.CSV, catalogue_io.PARQUET], horizontal=True,
+                   key="catalogue_export_format")
+    if st.button("Подготовить выгрузку"):
+        _discard_export()
+        with st.spinner("Выгружаем каталог..."):
+            # Выгрузка пишется кусками на диск: в сессии хранится только путь к файлу
+            with tempfile.NamedTemporaryFile(prefix="catalogue_", suffix=f".{fmt}", delete=False) as file:
+                path = file.name
+            try:
+                rows = runner.run(catalogue_io.export_catalogue(path, fmt))
+            except BaseException:
+                os.unlink(path)
+                raise
+        st.session_state.catalogue_export = (path, fmt, rows)
+
+    if 'catalogue_export' in st.session_state:
+        path, fmt, rows = st.session_state.catalogue_export
+        if not os.path.exists(path):
+            st.session_state.pop('catalogue_export')
+            return
+        with open(path, 'rb') as file:
+            st.download_button(f"Скачать каталог ({rows} товаров)", file, file_name=f"catalogue.{fmt}",
+                               on_click=_discard_export)
 
 
 def products_management_page():
@@ -113,35 +189,111 @@ def products_management_page():
     # Функция для работы с DataFrame
     st.subheader("Интерактивный список товаров")
 
-    user_role = asyncio.run(check_customer(st.session_state.user_id))['role']
+    # Роль берётся из контекста сессии: без запроса к базе, пока её не изменили
+    user = log_user.current_user()
 
-    if user_role == 'customer':
+    if user is None or user.role == 'customer':
         st.error("Так, хулиган, что тут забыл?) БАН")
         st.session_state.role = 'customer'
         time.sleep(3)
         st.rerun()
 
-    # Загружаем исходные данные
-    with st.spinner("Загружаем данные..."):
-        products_df = asyncio.run(get_products_dataframe())
+    brands, categories = runner.gather(buy_products.fetch_brands(), buy_products.fetch_categories())
+    col_brand, col_category, col_search, col_low = st.columns([2, 2, 2, 1])
+    with col_brand:
+        selected_brand = st.selectbox("Бренд", ["Все"] + brands, key="management_brand")
+    with col_category:
+        selected_category = st.selectbox("Категория", ["Все"] + categories, key="management_category")
+    with col_search:
+        name_search = st.text_input("Поиск по названию", key="management_search")
+    with col_low:
+        low_stock = st.checkbox(f"Остаток ≤ {config.LOW_STOCK_THRESHOLD}", key="management_low_stock")
+
+    brand_filter = None if selected_brand == "Все" else selected_brand
+    category_filter = None if selected_category == "Все" else selected_category
 
-    if not products_df.empty:
-        original_ids = products_df['product_id'].tolist()
+    # Курсоры начала просмотренных окон; при смене фильтров листаем с начала
+    filters = (brand_filter, category_filter, name_search, low_stock)
+    if st.session_state.get('management_filters') != filters:
+        st.session_state.management_filters = filters
+        st.session_state.management_cursors = [None]
+    cursors = st.session_state.management_cursors
 
-        edited_df = st.data_editor(
-            products_df,
-            use_container_width=True,
-            num_rows="dynamic",
-            key="products_editor"
-        )
+    # Несохранённые правки хранятся по окнам: окно -> (исходный DataFrame, изменённый, есть ли следующее окно).
+    # Сохранение затрагивает только строки окон, которые правили.
+    pending = st.session_state.setdefault('product_edits', {})
+    version = st.session_state.setdefault('product_editor_version', 0)
+    window = (filters, cursors[-1])
 
-        if st.button("Сохранить изменения"):
-            if sum(edited_df[edited_df.columns[1:]].isna().any(axis=1)) > 0:
+    if window in pending:
+        products_df, shown_df, has_next_page = pending[window]
+    else:
+        with st.spinner("Загружаем данные..."):
+            page_size = config.MANAGEMENT_PAGE_SIZE
+            products_df = runner.run(get_products_dataframe(*filters, after=cursors[-1], limit=page_size + 1))
+        has_next_page = len(products_df) > page_size
+        products_df = products_df.iloc[:page_size].reset_index(drop=True)
+        shown_df = products_df
+
+    if products_df.empty and len(cursors) == 1 and not any(filters):
+        st.write("📦 В базе данных пока нет товаров. Добавьте их в таблицу или загрузите из файла ниже.")
+
+    edited_df = st.data_editor(
+        shown_df,
+        use_container_width=True,
+        num_rows="dynamic",
+        disabled=["product_id"],
+        key=f"products_editor_{version}_{window}"
+    )
+
+    changed, added, deleted = product_sync.diff_products(products_df, edited_df)
+    if len(changed) or len(added) or deleted:
+        pending[window] = (products_df, edited_df, has_next_page)
+    else:
+        pending.pop(window, None)
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("← Назад", disabled=len(cursors) == 1, key="management_prev"):
+            cursors.pop()
+            st.rerun()
+    with col_page:
+        st.write(f"Страница {len(cursors)}")
+    with col_next:
+        if st.button("Вперёд →", disabled=not has_next_page, key="management_next"):
+            last = products_df.iloc[-1]
+            name = last['product_name']
+            cursors.append(("" if pd.isna(name) else name, int(last['product_id'])))
+            st.rerun()
+
+    if pending:
+        st.info(f"Несохранённые изменения на страницах: {len(pending)}")
+
+    col_save, col_discard = st.columns(2)
+    with col_save:
+        if st.button("Сохранить изменения", disabled=not pending):
+            if any(sum(edited[edited.columns[1:]].isna().any(axis=1)) > 0 for _, edited, _ in pending.values()):
                 st.error("Заполните все поля в датасете")
                 time.sleep(3)
                 st.rerun()
 
-            asyncio.run(sync_dataframe_changes(edited_df, original_ids))
-            st.success("Изменения успешно сохранены!")
-    else:
-        st.write("📦 В базе данных пока нет товаров. Добавьте их через таблицу выше.")
\ No newline at end of file
+            # Окна сохраняются по очереди: каждое - одной транзакцией по своим строкам
+            results = [runner.run(product_sync.sync_products(original, edited))
+                       for original, edited, _ in pending.values()]
+            pending.clear()
+            st.session_state.product_editor_version += 1
+            st.success(f"Изменения успешно сохранены! Изменено: {sum(r.updated for r in results)}, "
+                       f"добавлено: {sum(r.inserted for r in results)}, удалено: {sum(r.deleted for r in results)}")
+            time.sleep(2)
+            st.rerun()
+    with col_discard:
+        if st.button("Отменить изменения", disabled=not pending):
+            pending.clear()
+            st.session_state.product_editor_version += 1
+            st.rerun()
+
+    st.subheader("Импорт и экспорт")
+    with st.expander("Импорт из файла"):
+        import_section()
+    with st.expander("Экспорт каталога"):
+        export_section()
\ No newline at end of file
@@ -1,55 +1,68 @@
-import asyncio
 import streamlit as st
-import bcrypt
-import asyncpg
-import nest_asyncio
-from contextlib import asynccontextmanager
 import time
-nest_asyncio.apply()
-
-# ----- Асинхронное подключение к базе данных -----
-@asynccontextmanager
-async def connect_to_db():
-    conn = None
-    try:
-        conn = await asyncpg.connect(
-            host="localhost",
-            port=5432,
-            database="postgres",
-            user="postgres",
-            password="password"
-        )
-        yield conn
-    finally:
-        if conn:
-            await conn.close()
-
+from _src import db
+from _src import passwords
+from _src import queries
+from _src import runner
+from _src import users
+
+ADD_CUSTOMER_QUERY = queries.statement("log_user.add_customer",
+                                       "INSERT INTO customers (name, role, password, balance) VALUES ($1, $2, $3, $4)")
+
+# Заменяется только тот хеш, который проверяли: пароль могли сменить одновременно
+REHASH_QUERY = queries.statement("log_user.rehash",
+                                 "UPDATE customers SET password = $1 WHERE id = $2 AND password = $3")
+
+# Запрос при каждом входе (_src/queries.py)
+CUSTOMER_QUERY = queries.statement("log_user.check_customer", '''
+    SELECT c.id, c.name, c.password, r.role
+    FROM customers c
+    JOIN roles r ON c.role = r.id
+    WHERE c.name = $1
+''')
 
 async def add_customer(username, role, password):
-    async with connect_to_db() as conn:
+    async with db.connection() as conn:
         async with conn.transaction():
-            await conn.execute(
-                "INSERT INTO customers (name, role, password, balance) VALUES ($1, $2, $3, $4)",
-                username, role, password, 0
-            )
-            st.success("Пользователь добавлен успешно.")
-
-
+            await conn.execute(ADD_CUSTOMER_QUERY, username, role, password, 0)
 
-def hashed_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 
 async def check_customer(username):
-    async with connect_to_db() as conn:
-        query = '''SELECT * 
-                   FROM customers 
-                   JOIN roles ON customers.ROLE = roles.id
-                   WHERE name = $1'''
-        user = await conn.fetchrow(query, username)
+    async with db.connection() as conn:
+        user = await conn.fetchrow(CUSTOMER_QUERY, username)
         return user
 
 
+async def login(username, password):
+    """Проверка имени и пароля; возвращает (запись пользователя или None, верен ли пароль).
+
+    Если пароль верен, но сохранён с другой стоимостью bcrypt, хеш заменяется на новый."""
+    user = await check_customer(username)
+    if user is None:
+        return None, False
+    stored_password = user['password']
+    if not await passwords.verify_password(password, stored_password):
+        return user, False
+
+    if passwords.needs_rehash(stored_password):
+        new_hash = await passwords.hash_password(password)
+        async with db.connection() as conn:
+            await conn.execute(REHASH_QUERY, new_hash, user['id'], stored_password)
+    return user, True
+
+
+def current_user():
+    """Контекст вошедшего пользователя (users.UserContext) из сессии; None, если пользователь удалён.
+
+    Запрос к базе выполняется, только если контекст устарел (см. _src/users.py)."""
+    context = st.session_state.get('user_context')
+    if context is None or context.id != st.session_state.user_id or not users.is_current(context):
+        context = runner.run(users.load(st.session_state.user_id))
+        st.session_state.user_context = context
+    return context
+
+
 # ----- Интерфейс приложения -----
 def login_form():
     st.title("Вход в приложение")
@@ -60,13 +73,13 @@ def login_form():
         login_button = st.form_submit_button("Войти")
 
         if login_button:
-            user_data = asyncio.run(check_customer(username))
+            # Проверка пароля выполняется в пуле потоков, а не в потоке страницы
+            user_data, password_ok = runner.run(login(username, password))
             if user_data:
-                stored_password = user_data[3]
-                if bcrypt.checkpw(password.encode('utf-8'), stored_password.encode('utf-8')):
+                if password_ok:
                     st.session_state['logged_in'] = True
-                    st.session_state['user_id'] = user_data[2]
-                    st.session_state['role'] = user_data[6]
+                    st.session_state['user_id'] = user_data['id']
+                    st.session_state['role'] = user_data['role']
                     st.session_state['username'] = username
                     st.success("Вы успешно вошли!")
                     st.rerun()
@@ -99,10 +112,15 @@ def registration_form():
             if new_password != enter_password_again:
                 st.error("Пароли не совпадают, попробуйте снова.")
             else:
-                hash_pw = hashed_password(new_password)
-                asyncio.run(add_customer(new_username, 1, hash_pw))
+                hash_pw = runner.run(passwords.hash_password(new_password))
+                runner.run(add_customer(new_username, 1, hash_pw))
+                st.success("Пользователь добавлен успешно.")
 
 
 def log_out():
     st.session_state['logged_in'] = False
+    st.session_state.pop('user_context', None)
+    # Открытый заказ принадлежит покупателю, а не сессии: следующий вход получит свой
+    st.session_state.pop('order_id', None)
+    st.session_state.cart = {}
     st.rerun()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import asyncio
+import concurrent.futures
+
+import bcrypt
+
+from _src import config
+
+# ----- Хеширование паролей -----
+# bcrypt намеренно медленный и занимает процессор на десятки миллисекунд, поэтому
+# хеширование и проверка выполняются не в цикле _src.runner и не в потоке
+# страницы, а в ограниченном пуле потоков (bcrypt отпускает GIL на время расчёта).
+# Пока все потоки пула заняты, новые задачи ждут в очереди, а цикл событий
+# продолжает обслуживать запросы к базе.
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS,
+                                                          thread_name_prefix="password-hash")
+    return _executor
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, stored_hash):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+    except ValueError:
+        # В базе не хеш bcrypt
+        return False
+
+
+def rounds_of(stored_hash):
+    """Стоимость, с которой получен хеш bcrypt ($2b$12$... -> 12); None для нераспознанного хеша."""
+    if not stored_hash:
+        return None
+    parts = stored_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def needs_rehash(stored_hash):
+    """Хеш получен не с текущей стоимостью config.BCRYPT_ROUNDS."""
+    return rounds_of(stored_hash) != config.BCRYPT_ROUNDS
+
+
+async def hash_password(password):
+    """Хеш bcrypt пароля с текущей стоимостью."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _hash, password, config.BCRYPT_ROUNDS)
+
+
+async def verify_password(password, stored_hash):
+    """Совпадает ли пароль с сохранённым хешем; без хеша (NULL в базе) вход не выполняется."""
+    if not stored_hash:
+        return False
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), _check, password, stored_hash)
@@ -0,0 +1,193 @@
+import pandas as pd
+
+from _src import cache
+from _src import db
+from _src import queries
+
+# ----- Сохранение таблицы товаров из редактора менеджера -----
+# Отредактированный DataFrame сравнивается с исходным целиком (без циклов по
+# строкам), в базу уходят только изменённые, новые и удалённые товары: строки
+# копируются (COPY) во временную таблицу, а дальше всё делают несколько
+# set-based запросов в одной транзакции. Запросы к временной таблице не входят
+# в реестр _src/queries.py: таблица живёт одну транзакцию, и разобранный оператор
+# не пережил бы её.
+
+# Столбцы DataFrame (как в edit_products.get_products_dataframe), которые редактирует менеджер
+EDITABLE_COLUMNS = ['product_name', 'description', 'price', 'stock_quantity', 'brand_name', 'category_name']
+
+STAGING_TABLE = "product_sync"
+
+CREATE_STAGING_QUERY = f"""
+    CREATE TEMP TABLE {STAGING_TABLE} (
+        id int4,
+        name varchar,
+        description text,
+        price float8,
+        stock_quantity int8,
+        brand_name varchar,
+        category_name varchar
+    ) ON COMMIT DROP
+"""
+
+# Недостающие бренды и категории создаются одним запросом на справочник;
+# {table} - временная таблица со столбцами brand_name и category_name
+INSERT_BRANDS_QUERY = """
+    INSERT INTO brands (brand_name)
+    SELECT DISTINCT s.brand_name
+    FROM {table} s
+    WHERE s.brand_name IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM brands b WHERE b.brand_name = s.brand_name)
+    RETURNING id
+"""
+
+INSERT_CATEGORIES_QUERY = """
+    INSERT INTO categories (name)
+    SELECT DISTINCT s.category_name
+    FROM {table} s
+    WHERE s.category_name IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.name = s.category_name)
+    RETURNING id
+"""
+
+# Строки временной таблицы с id брендов и категорий
+RESOLVED_ROWS = f"""
+    SELECT s.id, s.name, s.description, s.price::numeric AS price, s.stock_quantity::int4 AS stock_quantity,
+           b.id AS brand_id, c.id AS category_id
+    FROM {STAGING_TABLE} s
+    LEFT JOIN LATERAL (SELECT min(id) AS id FROM brands WHERE brand_name = s.brand_name) b ON true
+    LEFT JOIN LATERAL (SELECT min(id) AS id FROM categories WHERE name = s.category_name) c ON true
+"""
+
+UPDATE_QUERY = f"""
+    UPDATE products p
+    SET name = r.name, description = r.description, price = r.price, stock_quantity = r.stock_quantity,
+        brand_id = r.brand_id, category_id = r.category_id
+    FROM ({RESOLVED_ROWS}) r
+    WHERE r.id IS NOT NULL AND p.id = r.id
+      AND (p.name, p.description, p.price, p.stock_quantity, p.brand_id, p.category_id)
+          IS DISTINCT FROM (r.name, r.description, r.price, r.stock_quantity, r.brand_id, r.category_id)
+"""
+
+INSERT_QUERY = f"""
+    INSERT INTO products (name, description, price, stock_quantity, brand_id, category_id)
+    SELECT r.name, r.description, r.price, r.stock_quantity, r.brand_id, r.category_id
+    FROM ({RESOLVED_ROWS}) r
+    WHERE r.id IS NULL
+"""
+
+# Позиции удаляемых товаров уходят и из заказов; суммы открытых заказов уменьшаются на их стоимость
+DELETE_ORDER_ITEMS_QUERY = queries.statement("product_sync.delete_order_items", """
+    WITH removed AS (
+        DELETE FROM order_items
+        WHERE product_id = ANY($1::int[])
+        RETURNING order_id, order_date, quantity * unitprice AS amount
+    )
+    UPDATE orders o
+    SET order_summ = COALESCE(o.order_summ, 0) - r.amount
+    FROM (SELECT order_id, order_date, SUM(amount) AS amount FROM removed GROUP BY order_id, order_date) r
+    WHERE o.id = r.order_id AND o.order_date = r.order_date AND o.order_state = 'в обработке'
+""")
+
+DELETE_QUERY = queries.statement("product_sync.delete_products", "DELETE FROM products WHERE id = ANY($1::int[])")
+
+
+class SyncResult:
+    """Сколько товаров изменено, добавлено и удалено."""
+
+    __slots__ = ('updated', 'inserted', 'deleted')
+
+    def __init__(self, updated=0, inserted=0, deleted=0):
+        self.updated = updated
+        self.inserted = inserted
+        self.deleted = deleted
+
+    def __repr__(self):
+        return f"SyncResult(updated={self.updated}, inserted={self.inserted}, deleted={self.deleted})"
+
+
+def _comparable(df):
+    """Редактируемые столбцы в виде, пригодном для сравнения: цены и остатки - числа."""
+    values = df[EDITABLE_COLUMNS].copy()
+    values['price'] = pd.to_numeric(values['price'], errors='coerce')
+    values['stock_quantity'] = pd.to_numeric(values['stock_quantity'], errors='coerce')
+    return values
+
+
+def diff_products(original, edited):
+    """Разница между исходной и отредактированной таблицей товаров.
+
+    Возвращает (изменённые строки с product_id, новые строки, список удалённых id).
+    Новыми считаются строки без product_id или с id, которого не было в исходной таблице."""
+    original_ids = pd.Index(original['product_id'].dropna().astype('int64'))
+    edited_ids = pd.to_numeric(edited['product_id'], errors='coerce')
+
+    is_existing = edited_ids.isin(original_ids)
+    added = edited[~is_existing]
+
+    existing = edited[is_existing].set_index(edited_ids[is_existing].astype('int64'))
+    before = _comparable(original.set_index(original['product_id'].astype('int64')).loc[existing.index])
+    after = _comparable(existing)
+    # Сравнение с NA в nullable-столбцах даёт NA, а не True: замена NULL на значение
+    # (и обратно) отмечается отдельно по маскам пропусков, а два пропуска (в том числе NaN) равны
+    before_na, after_na = before.isna(), after.isna()
+    differs = (before_na != after_na) | ((before != after).fillna(False) & ~before_na & ~after_na)
+    changed = existing[differs.any(axis=1)]
+    changed = changed.assign(product_id=changed.index)
+
+    deleted = original_ids.difference(pd.Index(edited_ids[is_existing].astype('int64')))
+    return changed, added, [int(product_id) for product_id in deleted]
+
+
+def _records(df, with_id):
+    """Строки для COPY во временную таблицу: кортежи Python-значений, NaN заменены на None."""
+    columns = pd.DataFrame({
+        'id': df['product_id'] if with_id else None,
+        'name': df['product_name'],
+        'description': df['description'],
+        'price': pd.to_numeric(df['price'], errors='coerce'),
+        'stock_quantity': pd.to_numeric(df['stock_quantity'], errors='coerce').round().astype('Int64'),
+        'brand_name': df['brand_name'],
+        'category_name': df['category_name'],
+    }).astype(object)
+    return columns.where(columns.notna(), None).itertuples(index=False, name=None)
+
+
+async def create_reference_data(conn, table):
+    """Создаёт бренды и категории из временной таблицы, которых ещё нет; возвращает их id."""
+    new_brands = await conn.fetch(INSERT_BRANDS_QUERY.format(table=table))
+    new_categories = await conn.fetch(INSERT_CATEGORIES_QUERY.format(table=table))
+    return new_brands, new_categories
+
+
+def invalidate_reference_data(new_brands, new_categories):
+    """Новые бренды и категории должны сразу появиться в фильтрах каталога."""
+    if new_brands:
+        cache.reference_data.invalidate('brands')
+    if new_categories:
+        cache.reference_data.invalidate('categories')
+
+
+async def sync_products(original, edited):
+    """Сохраняет правки таблицы товаров одной транзакцией; возвращает SyncResult."""
+    changed, added, deleted = diff_products(original, edited)
+    result = SyncResult()
+    if changed.empty and added.empty and not deleted:
+        return result
+
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(CREATE_STAGING_QUERY)
+            for df, with_id in ((changed, True), (added, False)):
+                if not df.empty:
+                    await conn.copy_records_to_table(STAGING_TABLE, records=_records(df, with_id))
+
+            new_brands, new_categories = await create_reference_data(conn, STAGING_TABLE)
+
+            result.updated = int((await conn.execute(UPDATE_QUERY)).split()[-1])
+            result.inserted = int((await conn.execute(INSERT_QUERY)).split()[-1])
+            if deleted:
+                await conn.execute(DELETE_ORDER_ITEMS_QUERY, deleted)
+                result.deleted = int((await conn.execute(DELETE_QUERY, deleted)).split()[-1])
+
+    invalidate_reference_data(new_brands, new_categories)
+    return result
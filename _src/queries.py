@@ -0,0 +1,50 @@
+import threading
+
+# ----- Реестр именованных запросов -----
+# Постоянный запрос объявляется один раз: NAME_QUERY = queries.statement("модуль.имя", sql).
+# Statement - это строка SQL с именем, поэтому её можно передавать всюду, где ждут текст
+# запроса (EXPLAIN в tools/check_query_plans.py, f-строки). Соединение из db.connection()
+# (metrics.InstrumentedConnection) записывает метрики такого запроса под его именем.
+#
+# Сервер разбирает запрос один раз на соединение пула: повторные выполнения берут
+# подготовленный оператор из кэша соединения asyncpg. Размер и срок жизни кэша задаются
+# config.DB_STATEMENT_CACHE_SIZE и DB_STATEMENT_CACHE_LIFETIME (0 - без срока).
+# Сколько раз запрос разобран сервером и сколько выполнен, показывают метрики
+# shop_query_prepares_total и shop_query_executions_total (_src/metrics.py).
+# Connection.prepare здесь не подходит: asyncpg запрещает пользоваться подготовленным
+# оператором после возврата соединения в пул.
+#
+# Не регистрируются запросы, текст которых собирается из фильтров (каталог, поиск, таблица
+# менеджера), и запросы к временной таблице product_sync, которая живёт одну транзакцию.
+
+_statements = {}
+_lock = threading.Lock()
+
+
+class Statement(str):
+    """Текст SQL-запроса с именем из реестра."""
+
+    name = None
+
+
+def statement(name, sql):
+    """Регистрирует запрос под именем name и возвращает его Statement."""
+    with _lock:
+        existing = _statements.get(name)
+        if existing is not None and existing != sql:
+            raise ValueError(f"Запрос {name!r} уже зарегистрирован с другим текстом")
+        registered = Statement(sql)
+        registered.name = name
+        _statements[name] = registered
+    return registered
+
+
+def get(name):
+    """Зарегистрированный запрос по имени."""
+    return _statements[name]
+
+
+def registered():
+    """Все зарегистрированные запросы в порядке имён."""
+    with _lock:
+        return [_statements[name] for name in sorted(_statements)]
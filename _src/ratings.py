@@ -0,0 +1,16 @@
+from _src import db
+from _src import queries
+
+# ----- Сводка оценок товаров -----
+# product_rating_stats (migrations/010_product_rating_stats.sql) хранит для каждого товара
+# число отзывов, сумму и среднюю оценку и гистограмму оценок 1-5. Сводку поддерживают
+# триггеры на reviews (добавление, изменение, удаление отзыва), приложение её только читает.
+# Пересчёт с нуля нужен после ручных правок сводки или выключенных триггеров.
+
+REBUILD_QUERY = queries.statement("ratings.rebuild_stats", "SELECT shop_rebuild_rating_stats()")
+
+
+async def rebuild_stats():
+    """Пересчитывает сводку оценок по всем отзывам; возвращает число исправленных товаров."""
+    async with db.connection() as conn:
+        return await conn.fetchval(REBUILD_QUERY)
@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import threading
+
+# ----- Долгоживущий цикл событий процесса -----
+# Страницы Streamlit синхронные, а доступ к базе асинхронный. Вместо asyncio.run(...)
+# на каждый запрос (создание и закрытие цикла) все корутины выполняются в одном
+# фоновом цикле, запущенном один раз на процесс сервера. В этом же цикле живёт пул
+# соединений (_src.db), поэтому соединения не передаются между циклами.
+#
+# Корутины, отправляемые сюда, выполняются вне потока скрипта Streamlit и не должны
+# обращаться к st.* (в том числе к st.session_state) - это делает вызывающая страница.
+# Контекстные переменные вызывающего потока (например, текущая отрисовка страницы
+# для _src.metrics) передаются в корутину.
+
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """Возвращает фоновый цикл событий, запуская его при первом обращении."""
+    global _loop, _thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="async-runner", daemon=True)
+            _thread.start()
+    return _loop
+
+
+def in_loop():
+    """True, если код выполняется внутри фонового цикла."""
+    try:
+        return asyncio.get_running_loop() is _loop
+    except RuntimeError:
+        return False
+
+
+async def _in_context(coro, context):
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+def submit(coro):
+    """Отправляет корутину в фоновый цикл и сразу возвращает concurrent.futures.Future."""
+    return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), get_loop())
+
+
+def run(coro, timeout=None):
+    """Выполняет корутину в фоновом цикле и синхронно возвращает её результат."""
+    if _thread is not None and threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("runner.run() нельзя вызывать из фонового цикла, используйте await")
+    return submit(coro).result(timeout)
+
+
+async def _gather(coros):
+    return await asyncio.gather(*coros)
+
+
+def gather(*coros, timeout=None):
+    """Выполняет независимые корутины конкурентно и возвращает список результатов по порядку."""
+    if not coros:
+        return []
+    return run(_gather(coros), timeout)
+
+
+def stop():
+    """Останавливает фоновый цикл."""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_loop.stop)
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import threading
+
+import asyncpg
+
+from _src import config
+from _src import db
+from _src import queries
+from _src import runner
+
+# ----- Сводки продаж -----
+# sales_daily (товар за день) и sales_daily_totals (итоги дня) из
+# migrations/011_sales_rollups.sql считаются только по оплаченным заказам; день - день
+# оплаты (orders.paid_at, migrations/013_order_paid_at.sql). Триггеры на
+# orders ставят оплаченный заказ в sales_rollup_queue, здесь очередь разбирается
+# пачками: позиции заказов пачки прибавляются к сводкам тем же оператором, которым
+# строки удаляются из очереди. Фоновая задача процесса разбирает очередь раз в
+# config.SALES_ROLLUP_INTERVAL секунд; страница аналитики читает только сводки.
+
+logger = logging.getLogger(__name__)
+
+# Пачка заказов из очереди; строки, которые разбирает другой процесс, пропускаются
+REFRESH_QUERY = queries.statement("sales_rollups.refresh_rollups", """
+    WITH batch AS (
+        DELETE FROM sales_rollup_queue q
+        USING (
+            SELECT order_id, order_date
+            FROM sales_rollup_queue
+            ORDER BY order_id, order_date
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        ) picked
+        WHERE q.order_id = picked.order_id AND q.order_date = picked.order_date
+        RETURNING q.order_id, q.order_date, q.paid_at
+    ), items AS (
+        SELECT b.paid_at::date AS day, oi.order_id, oi.product_id, p.brand_id, p.category_id,
+               COALESCE(oi.quantity, 0) AS quantity,
+               COALESCE(oi.quantity * oi.unitprice, 0) AS amount
+        FROM batch b
+        JOIN order_items oi ON oi.order_id = b.order_id AND oi.order_date = b.order_date
+        LEFT JOIN products p ON p.id = oi.product_id
+        WHERE oi.product_id IS NOT NULL
+    ), per_product AS (
+        INSERT INTO sales_daily AS s (day, product_id, brand_id, category_id, orders, units, revenue)
+        SELECT day, product_id, min(brand_id), min(category_id), count(DISTINCT order_id), sum(quantity), sum(amount)
+        FROM items
+        GROUP BY day, product_id
+        ORDER BY day, product_id
+        ON CONFLICT (day, product_id) DO UPDATE SET
+            orders = s.orders + EXCLUDED.orders,
+            units = s.units + EXCLUDED.units,
+            revenue = s.revenue + EXCLUDED.revenue
+    ), per_order AS (
+        SELECT order_id, sum(quantity) AS units, sum(amount) AS revenue
+        FROM items
+        GROUP BY order_id
+    ), totals AS (
+        INSERT INTO sales_daily_totals AS t (day, orders, units, revenue)
+        SELECT b.paid_at::date, count(*), COALESCE(sum(o.units), 0), COALESCE(sum(o.revenue), 0)
+        FROM batch b
+        LEFT JOIN per_order o ON o.order_id = b.order_id
+        GROUP BY 1
+        ORDER BY 1
+        ON CONFLICT (day) DO UPDATE SET
+            orders = t.orders + EXCLUDED.orders,
+            units = t.units + EXCLUDED.units,
+            revenue = t.revenue + EXCLUDED.revenue
+    )
+    SELECT count(*) FROM batch
+""")
+
+# Пересчёт сводок (rebuild_rollups): разбор очереди другими процессами ждёт конца пересчёта
+LOCK_QUERY = queries.statement("sales_rollups.lock_rollups",
+                               "LOCK TABLE sales_rollup_queue, sales_daily, sales_daily_totals IN EXCLUSIVE MODE")
+TRUNCATE_QUERY = queries.statement("sales_rollups.truncate_rollups",
+                                   "TRUNCATE sales_rollup_queue, sales_daily, sales_daily_totals")
+QUEUE_ALL_QUERY = queries.statement("sales_rollups.queue_paid_orders", """
+    INSERT INTO sales_rollup_queue (order_id, order_date, paid_at)
+    SELECT id, order_date, COALESCE(paid_at, order_date) FROM orders
+    WHERE order_state = 'оплачен'
+""")
+DELETE_DAILY_QUERY = queries.statement("sales_rollups.delete_daily", "DELETE FROM sales_daily WHERE day >= $1")
+DELETE_TOTALS_QUERY = queries.statement("sales_rollups.delete_daily_totals",
+                                        "DELETE FROM sales_daily_totals WHERE day >= $1")
+DELETE_QUEUED_QUERY = queries.statement("sales_rollups.delete_queued",
+                                        "DELETE FROM sales_rollup_queue WHERE paid_at >= $1::date")
+QUEUE_SINCE_QUERY = queries.statement("sales_rollups.queue_paid_orders_since", """
+    INSERT INTO sales_rollup_queue (order_id, order_date, paid_at)
+    SELECT id, order_date, COALESCE(paid_at, order_date) FROM orders
+    WHERE order_state = 'оплачен'
+      AND COALESCE(paid_at, order_date) >= $1::date
+""")
+
+# Вклад заказов $1 в сводки убирается (удаление тестовых данных в benchmarks и tools):
+# заказы, ещё стоящие в очереди, из неё удаляются, уже учтённые вычитаются из сводок
+FORGET_QUERY = queries.statement("sales_rollups.forget_orders", """
+    WITH queued AS (
+        DELETE FROM sales_rollup_queue
+        WHERE order_id = ANY($1::int[])
+        RETURNING order_id
+    ), counted AS (
+        SELECT o.id, o.order_date, COALESCE(o.paid_at, o.order_date)::date AS day
+        FROM orders o
+        WHERE o.id = ANY($1::int[]) AND o.order_state = 'оплачен'
+          AND o.id NOT IN (SELECT order_id FROM queued)
+    ), items AS (
+        SELECT c.day, oi.order_id, oi.product_id,
+               COALESCE(oi.quantity, 0) AS quantity,
+               COALESCE(oi.quantity * oi.unitprice, 0) AS amount
+        FROM counted c
+        JOIN order_items oi ON oi.order_id = c.id AND oi.order_date = c.order_date
+        WHERE oi.product_id IS NOT NULL
+    ), per_product AS (
+        UPDATE sales_daily s
+        SET orders = s.orders - x.orders, units = s.units - x.units, revenue = s.revenue - x.revenue
+        FROM (
+            SELECT day, product_id, count(DISTINCT order_id) AS orders, sum(quantity) AS units, sum(amount) AS revenue
+            FROM items
+            GROUP BY day, product_id
+        ) x
+        WHERE s.day = x.day AND s.product_id = x.product_id
+    ), per_order AS (
+        SELECT order_id, sum(quantity) AS units, sum(amount) AS revenue
+        FROM items
+        GROUP BY order_id
+    ), totals AS (
+        UPDATE sales_daily_totals t
+        SET orders = t.orders - x.orders, units = t.units - x.units, revenue = t.revenue - x.revenue
+        FROM (
+            SELECT c.day, count(*) AS orders, COALESCE(sum(o.units), 0) AS units, COALESCE(sum(o.revenue), 0) AS revenue
+            FROM counted c
+            LEFT JOIN per_order o ON o.order_id = c.id
+            GROUP BY c.day
+        ) x
+        WHERE t.day = x.day
+    )
+    SELECT count(*) FROM counted
+""")
+DELETE_EMPTY_DAILY_QUERY = queries.statement("sales_rollups.delete_empty_daily",
+                                             "DELETE FROM sales_daily WHERE orders <= 0")
+DELETE_EMPTY_TOTALS_QUERY = queries.statement("sales_rollups.delete_empty_daily_totals",
+                                              "DELETE FROM sales_daily_totals WHERE orders <= 0")
+
+_refresher_started = False
+_refresher_lock = threading.Lock()
+
+
+async def refresh_rollups(batch_size=None):
+    """Разбирает очередь оплаченных заказов пачками по batch_size; возвращает число учтённых заказов."""
+    batch_size = batch_size or config.SALES_ROLLUP_BATCH
+    total = 0
+    while True:
+        # Каждая пачка - отдельная транзакция: очередь и сводки меняются вместе
+        async with db.connection() as conn:
+            refreshed = await conn.fetchval(REFRESH_QUERY, batch_size)
+        total += refreshed
+        if refreshed < batch_size:
+            return total
+
+
+async def rebuild_rollups(since=None):
+    """Пересчитывает сводки с даты since (или целиком): удаляет их и ставит оплаченные заказы в очередь.
+
+    Заказы из выгруженных в архив секций в базе уже не лежат - их дни пересчитывать не нужно.
+    Возвращает число заказов в очереди; сводки пополнит refresh_rollups."""
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(LOCK_QUERY)
+            if since is None:
+                await conn.execute(TRUNCATE_QUERY)
+                status = await conn.execute(QUEUE_ALL_QUERY)
+            else:
+                await conn.execute(DELETE_DAILY_QUERY, since)
+                await conn.execute(DELETE_TOTALS_QUERY, since)
+                await conn.execute(DELETE_QUEUED_QUERY, since)
+                status = await conn.execute(QUEUE_SINCE_QUERY, since)
+    return int(status.split()[-1])
+
+
+async def forget_orders(conn, order_ids):
+    """Убирает заказы order_ids из очереди и сводок продаж в транзакции соединения conn.
+
+    Вызывается до удаления самих заказов и их позиций; возвращает число вычтенных из сводок заказов."""
+    await conn.execute(LOCK_QUERY)
+    forgotten = await conn.fetchval(FORGET_QUERY, order_ids)
+    await conn.execute(DELETE_EMPTY_DAILY_QUERY)
+    await conn.execute(DELETE_EMPTY_TOTALS_QUERY)
+    return forgotten
+
+
+async def _refresh_forever():
+    while True:
+        try:
+            refreshed = await refresh_rollups()
+            if refreshed:
+                logger.debug("В сводки продаж добавлено заказов: %d", refreshed)
+        except (OSError, asyncpg.PostgresError, asyncpg.exceptions.InterfaceError):
+            logger.warning("Не удалось обновить сводки продаж", exc_info=True)
+        await asyncio.sleep(config.SALES_ROLLUP_INTERVAL)
+
+
+def start_refresher():
+    """Запускает фоновое обновление сводок продаж (один раз на процесс; выключается интервалом 0)."""
+    global _refresher_started
+    if not config.SALES_ROLLUP_INTERVAL:
+        return
+    with _refresher_lock:
+        if _refresher_started:
+            return
+        _refresher_started = True
+    runner.submit(_refresh_forever())
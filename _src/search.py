@@ -0,0 +1,83 @@
+from _src import config
+from _src import db
+
+# ----- Поиск товаров -----
+# Использует столбец products.search_vector (GIN-индекс) и триграммный индекс по
+# products.name из migrations/001_product_search.sql. Запрос ищется одновременно в
+# русской и английской конфигурациях; опечатки и части слов ловит pg_trgm.
+
+# Запрос пользователя в виде tsquery; $1 - строка поиска
+TSQUERY = "(websearch_to_tsquery('russian', $1) || websearch_to_tsquery('english', $1))"
+
+# Строка поиска как подстрока для ILIKE: обратная косая черта, % и _ из запроса пользователя экранируются,
+# чтобы «50%» или «a_b» искались буквально (триграммный индекс понимает экранирование)
+LIKE_PATTERN = r"""'%' || replace(replace(replace($1, '\', '\\'), '%', '\%'), '_', '\_') || '%'"""
+
+# Условие совпадения для WHERE: полнотекстовое, нечёткое или подстрока (без учёта регистра)
+MATCH_CONDITION = f"""(p.search_vector @@ {TSQUERY}
+                      OR p.name % $1
+                      OR p.name ILIKE {LIKE_PATTERN} ESCAPE '\\')"""
+
+HIGHLIGHT_OPTIONS = "StartSel=**, StopSel=**, MaxFragments=2, MaxWords=25, MinWords=8"
+
+
+def match_condition(param_index):
+    """Условие совпадения с поисковой строкой, переданной параметром $param_index."""
+    return MATCH_CONDITION.replace("$1", f"${param_index}")
+
+
+def build_search_query(search_query, brand_filter=None, category_filter=None, limit=None, min_rating=None):
+    """Текст и параметры запроса ранжированного поиска.
+
+    Подсветка (ts_headline) считается только для отобранных строк, а не для всех совпадений."""
+    if limit is None:
+        limit = config.SEARCH_TOP_K
+
+    conditions = [MATCH_CONDITION]
+    params = [search_query]
+
+    if brand_filter:
+        conditions.append(f"b.brand_name = ${len(params) + 1}")
+        params.append(brand_filter)
+
+    if category_filter:
+        conditions.append(f"c.name = ${len(params) + 1}")
+        params.append(category_filter)
+
+    rating_join = ""
+    if min_rating:
+        rating_join = "JOIN product_rating_stats rs ON rs.product_id = p.id"
+        conditions.append(f"rs.avg_rate >= ${len(params) + 1}")
+        params.append(min_rating)
+
+    params.append(limit)
+    where = " AND ".join(conditions)
+
+    query = f"""
+        SELECT found.*,
+               ts_headline('russian', coalesce(found.name, ''), {TSQUERY}, '{HIGHLIGHT_OPTIONS}') AS name_highlight,
+               ts_headline('russian', coalesce(found.description, ''), {TSQUERY}, '{HIGHLIGHT_OPTIONS}') AS description_highlight
+        FROM (
+            SELECT p.id, p.name, p.description, p.price, p.stock_quantity,
+                   b.brand_name AS brand, c.name AS category,
+                   ts_rank_cd(p.search_vector, {TSQUERY}) AS rank,
+                   similarity(p.name, $1) AS name_similarity
+            FROM products p
+            LEFT JOIN brands b ON p.brand_id = b.id
+            LEFT JOIN categories c ON p.category_id = c.id
+            {rating_join}
+            WHERE {where}
+            ORDER BY rank DESC, name_similarity DESC, p.id
+            LIMIT ${len(params)}
+        ) found
+        ORDER BY found.rank DESC, found.name_similarity DESC, found.id
+    """
+
+    return query, params
+
+
+async def search_products(search_query, brand_filter=None, category_filter=None, limit=None, min_rating=None):
+    """Ранжированный поиск товаров: top-K результатов с подсветкой совпадений."""
+    query, params = build_search_query(search_query, brand_filter, category_filter, limit, min_rating)
+    async with db.connection() as conn:
+        return await conn.fetch(query, *params)
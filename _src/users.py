@@ -0,0 +1,88 @@
+import threading
+import time
+
+from _src import config
+from _src import db
+from _src import notifications
+from _src import queries
+
+# ----- Контекст вошедшего пользователя -----
+# Имя, роль и баланс пользователя хранятся в сессии (см. log_user.current_user) и
+# перечитываются из базы, только если устарели. Процесс ведёт счётчик версий по
+# пользователям: изменение роли или баланса через приложение увеличивает его сразу
+# (invalidate), а изменения из других процессов и прямым SQL приходят уведомлением
+# из migrations/006_user_notify.sql. Проверка актуальности - сравнение чисел в
+# памяти, без запроса к базе; USER_CONTEXT_TTL ограничивает возраст контекста,
+# если уведомления выключены или потерялись.
+
+CHANNEL = "user_changed"
+
+USER_CONTEXT_QUERY = queries.statement("users.load", """
+    SELECT c.id, c.name, r.role, c.balance
+    FROM customers c
+    LEFT JOIN roles r ON c.role = r.id
+    WHERE c.id = $1
+""")
+
+_versions = {}
+_epoch = 0
+_lock = threading.Lock()
+_subscribed = False
+
+
+class UserContext:
+    """Снимок данных пользователя, нужных страницам, с версией на момент загрузки."""
+
+    __slots__ = ('id', 'name', 'role', 'balance', 'version', 'loaded_at')
+
+    def __init__(self, id, name, role, balance, version, loaded_at):
+        self.id = id
+        self.name = name
+        self.role = role
+        self.balance = balance
+        self.version = version
+        self.loaded_at = loaded_at
+
+    def __repr__(self):
+        return f"UserContext(id={self.id}, name={self.name!r}, role={self.role!r})"
+
+
+def _version(user_id):
+    with _lock:
+        return _epoch, _versions.get(user_id, 0)
+
+
+def invalidate(user_id=None):
+    """Помечает устаревшим контекст пользователя или, без аргумента, всех пользователей."""
+    global _epoch
+    with _lock:
+        if user_id is None:
+            _epoch += 1
+        else:
+            _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def _on_notify(payload):
+    invalidate(int(payload) if payload else None)
+
+
+async def load(user_id):
+    """Контекст пользователя из базы; None, если пользователя нет."""
+    global _subscribed
+    if not _subscribed:
+        _subscribed = True
+        await notifications.listen(CHANNEL, _on_notify)
+
+    # Версия берётся до запроса: изменение во время загрузки сделает контекст устаревшим
+    version = _version(user_id)
+    async with db.connection() as conn:
+        row = await conn.fetchrow(USER_CONTEXT_QUERY, user_id)
+    if row is None:
+        return None
+    return UserContext(row['id'], row['name'], row['role'], row['balance'], version, time.monotonic())
+
+
+def is_current(context):
+    """Контекст не менялся с момента загрузки и не старше config.USER_CONTEXT_TTL."""
+    return (context.version == _version(context.id)
+            and time.monotonic() - context.loaded_at < config.USER_CONTEXT_TTL)
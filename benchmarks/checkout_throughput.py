@@ -0,0 +1,116 @@
+"""Бенчмарк корзины и оформления заказа: SQL из Python против функций PL/pgSQL.
+
+Для каждого режима config.ORDER_BACKEND ('python' и 'procedure') создаёт товары
+с большим остатком и покупателей с открытыми заказами, конкурентно кладёт товары
+в корзины через _src.cart.add_item, затем конкурентно оформляет все заказы через
+_src.checkout и печатает пропускную способность обеих операций. Созданные строки
+удаляются в конце. Нужна база с migrations/004_order_procedures.sql.
+
+    python -m benchmarks.checkout_throughput --buyers 500 --items 5 --connections 20
+"""
+import argparse
+import random
+import time
+import uuid
+
+from _src import cart
+from _src import checkout
+from _src import config
+from _src import db
+from _src import runner
+
+PRICE = 10
+STOCK = 1_000_000
+
+
+async def create_fixture(products, buyers, items):
+    """Товары и покупатели с пустыми открытыми заказами; возвращает (product_ids, [(customer_id, order_id)])."""
+    tag = f"checkout-bench-{uuid.uuid4().hex[:8]}"
+    async with db.connection() as conn:
+        async with conn.transaction():
+            product_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO products (name, description, price, stock_quantity)
+                       SELECT $1 || '-' || g, $1, $3, $4 FROM generate_series(1, $2) g
+                       RETURNING id
+                   )
+                   SELECT array_agg(id ORDER BY id) FROM created""",
+                tag, products, PRICE, STOCK)
+            customer_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO customers (name, role, password, balance)
+                       SELECT $1 || '-' || g, NULL, 'x', $3 FROM generate_series(1, $2) g
+                       RETURNING id
+                   )
+                   SELECT array_agg(id ORDER BY id) FROM created""",
+                tag, buyers, PRICE * items * 10)
+            order_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO orders (customer_id, order_date, order_summ, order_state)
+                       SELECT c, NOW(), 0, 'в обработке' FROM unnest($1::int[]) c
+                       RETURNING id, customer_id, order_date
+                   ), registered AS (
+                       INSERT INTO open_orders (customer_id, order_id, order_date)
+                       SELECT customer_id, id, order_date FROM created
+                   )
+                   SELECT array_agg(id ORDER BY customer_id) FROM created""",
+                customer_ids)
+    return product_ids, list(zip(customer_ids, order_ids))
+
+
+async def remove_fixture(product_ids, buyers):
+    customer_ids = [customer_id for customer_id, _ in buyers]
+    order_ids = [order_id for _, order_id in buyers]
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM order_items WHERE order_id = ANY($1::int[])", order_ids)
+            await conn.execute("DELETE FROM orders WHERE id = ANY($1::int[])", order_ids)
+            await conn.execute("DELETE FROM customers WHERE id = ANY($1::int[])", customer_ids)
+            await conn.execute("DELETE FROM products WHERE id = ANY($1::int[])", product_ids)
+
+
+def timed_gather(coros):
+    started = time.perf_counter()
+    results = runner.gather(*coros)
+    return results, time.perf_counter() - started
+
+
+def run_mode(mode, args, rng):
+    config.ORDER_BACKEND = mode
+    product_ids, buyers = runner.run(create_fixture(args.products, args.buyers, args.items))
+    try:
+        additions = [(order_id, product_id)
+                     for _, order_id in buyers
+                     for product_id in rng.sample(product_ids, min(args.items, len(product_ids)))]
+        _, add_seconds = timed_gather([cart.add_item(order_id, product_id, 1, PRICE)
+                                       for order_id, product_id in additions])
+        results, checkout_seconds = timed_gather([checkout.checkout(order_id, customer_id)
+                                                  for customer_id, order_id in buyers])
+    finally:
+        runner.run(remove_fixture(product_ids, buyers))
+
+    failed = sum(not result.ok for result in results)
+    print(f"{mode:<10} корзина {len(additions) / add_seconds:9.1f} оп/с   "
+          f"оформление {len(buyers) / checkout_seconds:9.1f} заказов/с"
+          + (f"   неуспешных: {failed}" if failed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--buyers", type=int, default=500)
+    parser.add_argument("--items", type=int, default=5, help="позиций в каждой корзине")
+    parser.add_argument("--connections", type=int, default=20, help="размер пула")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    config.DB_POOL_MAX_SIZE = args.connections
+    try:
+        for mode in ("python", "procedure"):
+            run_mode(mode, args, random.Random(args.seed))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
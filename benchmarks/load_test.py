@@ -0,0 +1,268 @@
+"""Нагрузочный тест: одновременные покупатели проходят страницы приложения через AppTest.
+
+Каждый виртуальный пользователь - отдельная сессия streamlit.testing.v1.AppTest,
+которая выполняет настоящий скрипт __main__.py: каталог -> добавление товара в
+корзину -> корзина и оформление заказа -> профиль и отзыв; часть пользователей -
+менеджеры, они ещё открывают управление товарами. Все сессии работают в одном
+процессе с общим пулом соединений, как на сервере Streamlit.
+
+Печатает пропускную способность (отрисовок в секунду), задержку отрисовки
+p50/p95/p99 по шагам и число запросов к базе на отрисовку (нужен asyncpg >= 0.29),
+и дописывает итог строкой JSON в файл --results (по умолчанию
+benchmarks/results/load_test.jsonl, каталог не отслеживается git) вместе с
+текущим коммитом - сравнивается с предыдущим запуском с теми же параметрами.
+
+Тест создаёт своих пользователей и товары и удаляет их в конце, но покупки
+уменьшают остатки, поэтому запускайте его на тестовой базе с синтетическими данными (python -m tools.generate_data).
+Паузы time.sleep, которые страницы делают после сообщений, на время теста
+отключаются (--keep-pauses оставляет их).
+
+    python -m benchmarks.load_test --users 20 --iterations 5 --managers 2
+"""
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import pathlib
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+
+from streamlit.testing.v1 import AppTest
+
+from _src import config
+from _src import db
+from _src import runner
+from _src import sales_rollups
+from _src.pages import cart_page
+from _src.pages import customer_page
+from _src.pages import edit_products
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+APP = ROOT / "__main__.py"
+RESULTS = pathlib.Path(__file__).resolve().parent / "results" / "load_test.jsonl"
+
+PRICE = 10
+STOCK = 1_000_000
+BALANCE = 1_000_000
+
+
+async def create_fixture(tag, users, managers, products):
+    """Пользователи (первые managers - менеджеры) и товары; возвращает [(id, имя, роль)]."""
+    async with db.connection() as conn:
+        async with conn.transaction():
+            roles = dict(await conn.fetch("SELECT role, id FROM roles"))
+            await conn.execute(
+                "INSERT INTO products (name, description, price, stock_quantity) "
+                "SELECT $1 || '-' || g, 'товар нагрузочного теста', $3, $4 FROM generate_series(1, $2) g",
+                tag, products, PRICE, STOCK)
+            created = []
+            for i in range(users):
+                role = 'manager' if i < managers else 'customer'
+                user_id = await conn.fetchval(
+                    "INSERT INTO customers (name, role, password, balance) VALUES ($1, $2, 'x', $3) RETURNING id",
+                    f"{tag}-user-{i}", roles[role], BALANCE)
+                created.append((user_id, f"{tag}-user-{i}", role))
+    return created
+
+
+async def remove_fixture(tag, users):
+    user_ids = [user_id for user_id, _, _ in users]
+    async with db.connection() as conn:
+        async with conn.transaction():
+            # Оплаченные заказы уже в очереди сводок продаж или в самих сводках
+            order_ids = await conn.fetchval(
+                "SELECT COALESCE(array_agg(id), '{}') FROM orders WHERE customer_id = ANY($1::int[])", user_ids)
+            await sales_rollups.forget_orders(conn, order_ids)
+            await conn.execute("DELETE FROM reviews WHERE customer_id = ANY($1::int[])", user_ids)
+            await conn.execute(
+                "DELETE FROM order_items WHERE order_id IN (SELECT id FROM orders WHERE customer_id = ANY($1::int[]))",
+                user_ids)
+            await conn.execute("DELETE FROM orders WHERE customer_id = ANY($1::int[])", user_ids)
+            await conn.execute("DELETE FROM customers WHERE id = ANY($1::int[])", user_ids)
+            await conn.execute("DELETE FROM order_items WHERE product_id IN "
+                               "(SELECT id FROM products WHERE name LIKE $1 || '-%')", tag)
+            await conn.execute("DELETE FROM products WHERE name LIKE $1 || '-%'", tag)
+
+
+class _NoPauses:
+    """Замена модуля time в страницах: всё как в time, кроме sleep."""
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+    @staticmethod
+    def sleep(seconds):
+        pass
+
+
+class Recorder:
+    """Задержки отрисовок по шагам и ошибки, общие для всех потоков."""
+
+    def __init__(self):
+        self.timings = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self._lock = threading.Lock()
+
+    def render(self, step, app):
+        started = time.perf_counter()
+        app.run()
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.timings[step].append(elapsed)
+            if app.exception:
+                self.errors[step] += 1
+        return app
+
+
+def _click(app, label):
+    """Нажимает первую кнопку с такой подписью; False, если её нет на странице."""
+    for button in app.button:
+        if button.label == label:
+            button.click()
+            return True
+    return False
+
+
+def _open(app, page):
+    app.sidebar.radio[0].set_value(page)
+
+
+def shopper(user, iterations, recorder):
+    user_id, username, role = user
+    app = AppTest.from_file(str(APP), default_timeout=60)
+    app.session_state['logged_in'] = True
+    app.session_state['user_id'] = user_id
+    app.session_state['username'] = username
+    app.session_state['role'] = role
+    recorder.render("каталог", app)
+
+    for _ in range(iterations):
+        _open(app, "Купить товары")
+        recorder.render("каталог", app)
+        if _click(app, "Добавить в корзину"):
+            recorder.render("в корзину", app)
+
+        _open(app, "Корзина")
+        recorder.render("корзина", app)
+        if _click(app, "Оформить заказ"):
+            recorder.render("оформление", app)
+
+        _open(app, "Профиль")
+        recorder.render("профиль", app)
+        if _click(app, "Отправить отзыв"):
+            recorder.render("отзыв", app)
+
+        if role == 'manager':
+            _open(app, "Редактировать товары")
+            recorder.render("управление товарами", app)
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(recorder, elapsed, queries):
+    steps = {}
+    for step, timings in recorder.timings.items():
+        timings = sorted(timings)
+        steps[step] = {
+            "renders": len(timings),
+            "p50_ms": round(statistics.median(timings), 1),
+            "p95_ms": round(_percentile(timings, 0.95), 1),
+            "p99_ms": round(_percentile(timings, 0.99), 1),
+            "errors": recorder.errors[step],
+        }
+    everything = sorted(t for timings in recorder.timings.values() for t in timings)
+    return {
+        "renders": len(everything),
+        "renders_per_s": round(len(everything) / elapsed, 2),
+        "p50_ms": round(statistics.median(everything), 1),
+        "p95_ms": round(_percentile(everything, 0.95), 1),
+        "p99_ms": round(_percentile(everything, 0.99), 1),
+        "queries_per_render": round(queries / len(everything), 2),
+        "steps": steps,
+    }
+
+
+def report(summary, previous):
+    print(f"{'шаг':<22}{'отрисовок':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ошибок':>8}")
+    for step, s in summary["steps"].items():
+        print(f"{step:<22}{s['renders']:>10}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['errors']:>8}")
+    print(f"Всего: {summary['renders']} отрисовок, {summary['renders_per_s']} в секунду, "
+          f"p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms, "
+          f"запросов на отрисовку {summary['queries_per_render']}")
+    if previous is not None:
+        before = previous["summary"]
+        print(f"Предыдущий запуск ({previous['commit'][:10]}): {before['renders_per_s']} в секунду, "
+              f"p95 {before['p95_ms']} ms, запросов на отрисовку {before['queries_per_render']}")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def store(args, summary):
+    """Дописывает результат в файл args.results; возвращает предыдущий результат с теми же параметрами."""
+    results = pathlib.Path(args.results)
+    parameters = {"users": args.users, "managers": args.managers, "iterations": args.iterations,
+                  "products": args.products, "connections": config.DB_POOL_MAX_SIZE,
+                  "keep_pauses": args.keep_pauses}
+    previous = None
+    if results.exists():
+        for line in results.read_text(encoding="utf-8").splitlines():
+            entry = json.loads(line)
+            if entry["parameters"] == parameters:
+                previous = entry
+    results.parent.mkdir(parents=True, exist_ok=True)
+    entry = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "commit": _commit(),
+             "parameters": parameters, "summary": summary}
+    with results.open("a", encoding="utf-8") as file:
+        file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    parser.add_argument("--managers", type=int, default=2, help="сколько из них менеджеры")
+    parser.add_argument("--iterations", type=int, default=5, help="проходов сценария на пользователя")
+    parser.add_argument("--products", type=int, default=50, help="товаров, созданных для теста")
+    parser.add_argument("--connections", type=int, default=config.DB_POOL_MAX_SIZE, help="размер пула")
+    parser.add_argument("--keep-pauses", action="store_true", help="не отключать паузы time.sleep на страницах")
+    parser.add_argument("--results", default=str(RESULTS), help="файл JSONL с результатами запусков")
+    args = parser.parse_args()
+
+    config.DB_POOL_MAX_SIZE = args.connections
+    if not args.keep_pauses:
+        for module in (cart_page, customer_page, edit_products):
+            module.time = _NoPauses()
+
+    tag = f"load-test-{uuid.uuid4().hex[:8]}"
+    users = runner.run(create_fixture(tag, args.users, args.managers, args.products))
+    recorder = Recorder()
+    try:
+        queries_before = db.query_count()
+        started = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.users) as sessions:
+            for future in [sessions.submit(shopper, user, args.iterations, recorder) for user in users]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        queries = db.query_count() - queries_before
+    finally:
+        runner.run(remove_fixture(tag, users))
+        db.close()
+
+    summary = summarize(recorder, elapsed, queries)
+    report(summary, store(args, summary))
+
+
+if __name__ == "__main__":
+    main()
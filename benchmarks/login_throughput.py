@@ -0,0 +1,99 @@
+"""Бенчмарк входа в приложение: пропускная способность при одновременных входах.
+
+Создаёт пользователей с паролем, захешированным bcrypt с заданной стоимостью, и
+из нескольких потоков (как из параллельных сессий Streamlit) выполняет входы:
+прежним способом (bcrypt.checkpw в потоке страницы) и через log_user.login
+(проверка в пуле _src.passwords). Печатает входы в секунду и задержку p50/p95.
+Созданные пользователи удаляются в конце.
+
+    python -m benchmarks.login_throughput --sessions 32 --logins 500 --rounds 12
+"""
+import argparse
+import concurrent.futures
+import statistics
+import time
+import uuid
+
+import bcrypt
+
+from _src import config
+from _src import db
+from _src import runner
+from _src.pages import log_user
+
+PASSWORD = "benchmark-password"
+
+
+async def create_users(tag, count, password_hash):
+    async with db.connection() as conn:
+        return await conn.fetchval(
+            """WITH created AS (
+                   INSERT INTO customers (name, role, password, balance)
+                   SELECT $1 || '-' || g, (SELECT min(id) FROM roles), $3, 0 FROM generate_series(1, $2) g
+                   RETURNING name
+               )
+               SELECT array_agg(name) FROM created""",
+            tag, count, password_hash)
+
+
+async def remove_users(tag):
+    async with db.connection() as conn:
+        await conn.execute("DELETE FROM customers WHERE name LIKE $1 || '%'", tag)
+
+
+def legacy_login(username):
+    """Вход так, как его выполняла страница до пула: bcrypt в потоке страницы."""
+    user = runner.run(log_user.check_customer(username))
+    return bcrypt.checkpw(PASSWORD.encode('utf-8'), user['password'].encode('utf-8'))
+
+
+def pooled_login(username):
+    return runner.run(log_user.login(username, PASSWORD))[1]
+
+
+def measure(name, login, usernames, sessions):
+    timings = []
+
+    def timed(username):
+        started = time.perf_counter()
+        ok = login(username)
+        timings.append((time.perf_counter() - started) * 1000)
+        return ok
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sessions) as sessions_pool:
+        results = list(sessions_pool.map(timed, usernames))
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<10} {len(usernames) / elapsed:8.1f} входов/с   "
+          f"p50 {statistics.median(timings):8.1f} ms   p95 {p95:8.1f} ms"
+          + ("" if all(results) else "   есть неуспешные входы!"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=32, help="одновременных сессий (потоков)")
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=config.BCRYPT_ROUNDS, help="стоимость bcrypt")
+    args = parser.parse_args()
+
+    # Хеш уже с текущей стоимостью, поэтому перехеширование при входе не срабатывает
+    config.BCRYPT_ROUNDS = args.rounds
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(args.rounds)).decode('utf-8')
+    tag = f"login-bench-{uuid.uuid4().hex[:8]}"
+    try:
+        usernames = runner.run(create_users(tag, args.users, password_hash))
+        logins = [usernames[i % len(usernames)] for i in range(args.logins)]
+        print(f"bcrypt rounds {args.rounds}, потоков пула паролей {config.PASSWORD_HASH_WORKERS}")
+        measure("прежний", legacy_login, logins, args.sessions)
+        measure("пул", pooled_login, logins, args.sessions)
+    finally:
+        runner.run(remove_users(tag))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Бенчмарк поиска последнего заказа и корзины при растущей истории заказов.
+
+Создаёт товары и покупателей с открытыми заказами и позициями в корзине, затем
+ступенями (--stages) добавляет этим покупателям оплаченные заказы, разбросанные по
+последним --months месяцам, и на каждой ступени замеряет p50/p95 для профиля
+покупателя (customer_page.get_last_order + get_order_items) и загрузки корзины
+(cart.load_cart). С секционированием по месяцам (migrations/009_order_partitions.sql)
+задержки не должны расти вместе с историей. Созданные строки удаляются в конце.
+
+    python -m benchmarks.order_history --customers 200 --stages 100000,1000000 --months 36
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+import uuid
+
+from _src import cart
+from _src import db
+from _src import order_partitions
+from _src import runner
+from _src.pages import customer_page
+
+PRICE = 10
+BATCH = 100_000
+
+HISTORY_QUERY = """
+    WITH created AS (
+        INSERT INTO orders (customer_id, order_date, order_summ, order_state)
+        SELECT ($1::int[])[1 + (random() * (cardinality($1::int[]) - 1))::int],
+               NOW() - random() * make_interval(months => $4),
+               $5 * $6, 'оплачен'
+        FROM generate_series(1, $3)
+        RETURNING id, order_date
+    )
+    INSERT INTO order_items (order_id, order_date, product_id, quantity, unitprice)
+    SELECT c.id, c.order_date, ($2::int[])[1 + (random() * (cardinality($2::int[]) - 1))::int], 1, $6
+    FROM created c, generate_series(1, $5)
+"""
+
+
+async def create_partitions(months):
+    """Секции на всю глубину истории и текущий месяц."""
+    current = datetime.date.today().replace(day=1)
+    async with db.connection() as conn:
+        await conn.execute("SELECT shop_create_order_partitions($1, $2)",
+                           order_partitions.add_months(current, -months),
+                           order_partitions.add_months(current, 1))
+
+
+async def create_fixture(customers, products, items):
+    """Товары и покупатели с открытыми заказами; возвращает (product_ids, [(customer_id, order_id)])."""
+    tag = f"history-bench-{uuid.uuid4().hex[:8]}"
+    async with db.connection() as conn:
+        async with conn.transaction():
+            product_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO products (name, description, price, stock_quantity)
+                       SELECT $1 || '-' || g, $1, $3, 1000 FROM generate_series(1, $2) g
+                       RETURNING id
+                   )
+                   SELECT array_agg(id ORDER BY id) FROM created""",
+                tag, products, PRICE)
+            customer_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO customers (name, role, password, balance)
+                       SELECT $1 || '-' || g, NULL, 'x', 0 FROM generate_series(1, $2) g
+                       RETURNING id
+                   )
+                   SELECT array_agg(id ORDER BY id) FROM created""",
+                tag, customers)
+            order_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO orders (customer_id, order_date, order_summ, order_state)
+                       SELECT c, NOW(), $2 * $3, 'в обработке' FROM unnest($1::int[]) c
+                       RETURNING id, customer_id, order_date
+                   ), registered AS (
+                       INSERT INTO open_orders (customer_id, order_id, order_date)
+                       SELECT customer_id, id, order_date FROM created
+                   ), items AS (
+                       INSERT INTO order_items (order_id, order_date, product_id, quantity, unitprice)
+                       SELECT c.id, c.order_date, ($4::int[])[g], 1, $3
+                       FROM created c, generate_series(1, $2) g
+                   )
+                   SELECT array_agg(id ORDER BY customer_id) FROM created""",
+                customer_ids, items, PRICE, product_ids)
+    return product_ids, list(zip(customer_ids, order_ids))
+
+
+async def grow_history(customer_ids, product_ids, orders, months, items):
+    """Добавляет orders оплаченных заказов пачками по BATCH и обновляет статистику."""
+    async with db.connection() as conn:
+        while orders > 0:
+            batch = min(orders, BATCH)
+            await conn.execute(HISTORY_QUERY, customer_ids, product_ids, batch, months, items, PRICE)
+            orders -= batch
+        await conn.execute("ANALYZE orders, order_items")
+
+
+async def remove_fixture(product_ids, buyers):
+    customer_ids = [customer_id for customer_id, _ in buyers]
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """DELETE FROM order_items oi USING orders o
+                   WHERE o.id = oi.order_id AND o.order_date = oi.order_date AND o.customer_id = ANY($1::int[])""",
+                customer_ids)
+            # Строки open_orders удаляются каскадно вместе с заказами
+            await conn.execute("DELETE FROM orders WHERE customer_id = ANY($1::int[])", customer_ids)
+            await conn.execute("DELETE FROM customers WHERE id = ANY($1::int[])", customer_ids)
+            await conn.execute("DELETE FROM products WHERE id = ANY($1::int[])", product_ids)
+
+
+async def profile_lookup(customer_id):
+    last_order = await customer_page.get_last_order(customer_id)
+    if last_order:
+        await customer_page.get_order_items(last_order['id'], last_order['order_date'])
+
+
+def measure(call, arguments):
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        runner.run(call(argument))
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--items", type=int, default=3, help="позиций в заказе и в корзине")
+    parser.add_argument("--stages", default="0,100000,1000000",
+                        help="размеры истории через запятую (всего оплаченных заказов на ступени)")
+    parser.add_argument("--months", type=int, default=36, help="глубина истории")
+    parser.add_argument("--lookups", type=int, default=500, help="замеров на ступень")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    stages = sorted(int(value) for value in args.stages.split(","))
+    rng = random.Random(args.seed)
+
+    try:
+        runner.run(create_partitions(args.months))
+        product_ids, buyers = runner.run(create_fixture(args.customers, args.products, args.items))
+        customer_ids = [customer_id for customer_id, _ in buyers]
+        try:
+            print(f"{'история':>10}{'профиль p50':>14}{'p95 ms':>9}{'корзина p50':>14}{'p95 ms':>9}")
+            history = 0
+            for stage in stages:
+                runner.run(grow_history(customer_ids, product_ids, stage - history, args.months, args.items))
+                history = max(history, stage)
+                sample = [rng.choice(buyers) for _ in range(args.lookups)]
+                profile = measure(profile_lookup, [customer_id for customer_id, _ in sample])
+                basket = measure(cart.load_cart, [order_id for _, order_id in sample])
+                print(f"{history:>10}{profile[0]:>14.2f}{profile[1]:>9.2f}{basket[0]:>14.2f}{basket[1]:>9.2f}")
+        finally:
+            runner.run(remove_fixture(product_ids, buyers))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
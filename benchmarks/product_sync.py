@@ -0,0 +1,151 @@
+"""Бенчмарк сохранения таблицы товаров: построчная синхронизация против _src.product_sync.
+
+Создаёт синтетические товары (по умолчанию 50 000), строит их DataFrame так же,
+как страница менеджера, правит часть строк, добавляет и удаляет несколько товаров
+и замеряет сохранение прежним способом (UPDATE на каждую строку таблицы, поиск
+бренда и категории на каждую новую строку) и через product_sync.sync_products.
+Для каждого способа данные создаются заново; в конце всё созданное удаляется.
+
+    python -m benchmarks.product_sync --products 50000 --changed 0.05
+"""
+import argparse
+import decimal
+import random
+import time
+import uuid
+
+import pandas as pd
+
+from _src import db
+from _src import product_sync
+from _src import runner
+
+BRANDS = 20
+CATEGORIES = 10
+
+
+async def create_fixture(tag, products, rng):
+    """Бренды, категории и товары; возвращает DataFrame в формате get_products_dataframe."""
+    async with db.connection() as conn:
+        async with conn.transaction():
+            brands = await conn.fetch(
+                "INSERT INTO brands (brand_name) SELECT $1 || '-brand-' || g FROM generate_series(1, $2) g "
+                "RETURNING id, brand_name", tag, BRANDS)
+            categories = await conn.fetch(
+                "INSERT INTO categories (name) SELECT $1 || '-category-' || g FROM generate_series(1, $2) g "
+                "RETURNING id, name", tag, CATEGORIES)
+            # Номер дополнен нулями, чтобы порядок имён в базе совпадал с порядком создания
+            rows = [(f"{tag}-{i:07d}", f"описание {i}", decimal.Decimal(f"{rng.uniform(5, 500):.2f}"), rng.randint(0, 100),
+                     rng.choice(brands), rng.choice(categories)) for i in range(products)]
+            ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO products (name, description, price, stock_quantity, brand_id, category_id)
+                       SELECT * FROM unnest($1::varchar[], $2::text[], $3::numeric[], $4::int[], $5::int[], $6::int[])
+                       RETURNING id, name
+                   )
+                   SELECT array_agg(id ORDER BY name) FROM created""",
+                [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows],
+                [r[4]['id'] for r in rows], [r[5]['id'] for r in rows])
+    return pd.DataFrame({
+        'product_id': ids,
+        'product_name': [r[0] for r in rows],
+        'description': [r[1] for r in rows],
+        'price': [r[2] for r in rows],
+        'stock_quantity': [r[3] for r in rows],
+        'brand_name': [r[4]['brand_name'] for r in rows],
+        'category_name': [r[5]['name'] for r in rows],
+    })
+
+
+async def remove_fixture(tag):
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute("DELETE FROM products WHERE name LIKE $1 || '%'", tag)
+            await conn.execute("DELETE FROM brands WHERE brand_name LIKE $1 || '%'", tag)
+            await conn.execute("DELETE FROM categories WHERE name LIKE $1 || '%'", tag)
+
+
+def edit(original, tag, changed, added, deleted, rng):
+    """Правки менеджера: часть цен и остатков, новые товары (в том числе с новым брендом), удаления."""
+    edited = original.copy()
+    rows = rng.sample(range(len(edited)), int(len(edited) * changed))
+    edited.loc[rows, 'price'] = edited.loc[rows, 'price'] + 1
+    edited.loc[rows, 'stock_quantity'] = edited.loc[rows, 'stock_quantity'] + 1
+    edited = edited.drop(index=rng.sample(range(len(edited)), deleted))
+    new_rows = pd.DataFrame({
+        'product_id': [None] * added,
+        'product_name': [f"{tag}-new-{i}" for i in range(added)],
+        'description': ["новый товар"] * added,
+        'price': [9.99] * added,
+        'stock_quantity': [10] * added,
+        'brand_name': [f"{tag}-brand-new"] * added,
+        'category_name': [f"{tag}-category-1"] * added,
+    })
+    return pd.concat([edited, new_rows], ignore_index=True)
+
+
+async def legacy_sync(df, original_ids):
+    """Прежняя edit_products.sync_dataframe_changes (значения приведены к типам, которые принимает asyncpg)."""
+    async with db.connection() as conn:
+        for index, row in df.iterrows():
+            product_id = None if pd.isna(row['product_id']) else int(row['product_id'])
+            row['price'] = decimal.Decimal(str(row['price']))
+            row['stock_quantity'] = int(row['stock_quantity'])
+            if product_id in original_ids:
+                await conn.execute(
+                    "UPDATE products SET name = $1, description = $2, price = $3, stock_quantity = $4 WHERE id = $5",
+                    row['product_name'], row['description'], row['price'], row['stock_quantity'], product_id)
+            else:
+                category_id = await conn.fetchval("SELECT id FROM categories WHERE name = $1", row['category_name'])
+                if not category_id:
+                    category_id = await conn.fetchval("INSERT INTO categories (name) VALUES ($1) RETURNING id",
+                                                      row['category_name'])
+                brand_id = await conn.fetchval("SELECT id FROM brands WHERE brand_name = $1", row['brand_name'])
+                if not brand_id:
+                    brand_id = await conn.fetchval("INSERT INTO brands (brand_name) VALUES ($1) RETURNING id",
+                                                   row['brand_name'])
+                await conn.execute(
+                    "INSERT INTO products (name, description, price, stock_quantity, category_id, brand_id) "
+                    "VALUES ($1, $2, $3, $4, $5, $6)",
+                    row['product_name'], row['description'], row['price'], row['stock_quantity'],
+                    category_id, brand_id)
+
+        ids_to_delete = list(set(original_ids) - set(df['product_id']))
+        if ids_to_delete:
+            await conn.execute("DELETE FROM order_items WHERE product_id = ANY($1)", ids_to_delete)
+            await conn.execute("DELETE FROM products WHERE id = ANY($1)", ids_to_delete)
+
+
+def measure(name, args, save):
+    rng = random.Random(args.seed)
+    tag = f"sync-bench-{uuid.uuid4().hex[:8]}"
+    original = runner.run(create_fixture(tag, args.products, rng))
+    try:
+        edited = edit(original, tag, args.changed, args.added, args.deleted, rng)
+        started = time.perf_counter()
+        runner.run(save(original, edited))
+        elapsed = time.perf_counter() - started
+    finally:
+        runner.run(remove_fixture(tag))
+    print(f"{name:<14} {elapsed:8.2f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--changed", type=float, default=0.05, help="доля изменённых строк")
+    parser.add_argument("--added", type=int, default=100)
+    parser.add_argument("--deleted", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    try:
+        measure("построчно", args,
+                lambda original, edited: legacy_sync(edited, original['product_id'].tolist()))
+        measure("product_sync", args, product_sync.sync_products)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Микробенчмарк задержки отрисовки страницы покупок (только работа с базой).
+
+Сравнивает прежнюю схему (asyncio.run и новое соединение на каждый запрос)
+с текущей (общий пул в фоновом цикле runner, независимые запросы конкурентно).
+Нужна база, созданная из migrations/ddl.sql и migrations/dml.sql; параметры
+подключения берутся из _src.config (переменные окружения DB_*/DATABASE_URL).
+
+    python -m benchmarks.render_latency --renders 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import asyncpg
+
+from _src import db
+from _src import runner
+from _src.pages import buy_products
+
+
+async def _legacy_fetch(query, *args):
+    """Запрос так, как его выполняли страницы до общего пула: своё соединение на вызов."""
+    conn = await asyncpg.connect(**db.connect_options())
+    try:
+        return await conn.fetch(query, *args)
+    finally:
+        await conn.close()
+
+
+def legacy_render():
+    asyncio.run(_legacy_fetch("SELECT DISTINCT brand_name FROM brands"))
+    asyncio.run(_legacy_fetch("SELECT DISTINCT name FROM categories"))
+    products = asyncio.run(_legacy_fetch("""
+        SELECT p.id, p.name, p.description, p.price, p.stock_quantity, b.brand_name AS brand, c.name AS category
+        FROM products p
+        LEFT JOIN brands b ON p.brand_id = b.id
+        LEFT JOIN categories c ON p.category_id = c.id
+    """))
+    for product in products:
+        if product['stock_quantity'] > 0:
+            asyncio.run(_legacy_fetch("""
+                SELECT c.name, r.comment, r.rate
+                FROM reviews r
+                JOIN customers c ON r.customer_id = c.id
+                WHERE r.product_id = $1
+            """, product['id']))
+
+
+def current_render():
+    runner.gather(buy_products.fetch_brands(), buy_products.fetch_categories())
+    products = runner.run(buy_products.fetch_products())
+    runner.run(buy_products.fetch_reviews(
+        [product['id'] for product in products if product['stock_quantity'] > 0]
+    ))
+
+
+def measure(render, renders, warmup):
+    for _ in range(warmup):
+        render()
+    timings = []
+    for _ in range(renders):
+        started = time.perf_counter()
+        render()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<10} mean {statistics.mean(timings):8.2f} ms   "
+          f"p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--renders", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    args = parser.parse_args()
+
+    report("before", measure(legacy_render, args.renders, args.warmup))
+    report("after", measure(current_render, args.renders, args.warmup))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Бенчмарк поиска по каталогу: прежний p.name LIKE '%...%' против полнотекстового поиска.
+
+Внутри одной транзакции добавляет синтетические товары (по умолчанию 100 000),
+обновляет статистику, замеряет задержку обоих вариантов на наборе поисковых
+строк (в том числе с опечатками) и откатывает транзакцию - база не меняется.
+Нужна база с migrations/ddl.sql и migrations/001_product_search.sql.
+
+    python -m benchmarks.search_latency --products 100000 --queries 200
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import asyncpg
+
+from _src import db
+from _src import search
+
+BRANDS = ["Botanee", "Paco Rabanne", "DIOR", "Chanel", "Lancome", "Clinique", "Nivea", "Garnier",
+          "L'Oreal", "Estee Lauder", "Givenchy", "Guerlain"]
+CATEGORIES = ["Парфюмерная косметика", "Уход за лицом", "Уход за волосами", "Декоративная косметика",
+              "Бад для здоровья волос и ногтей", "Уход за телом"]
+WORDS = ["аромат", "крем", "сыворотка", "шампунь", "бальзам", "маска", "тоник", "коллаген", "витамин",
+         "увлажняющий", "ночной", "дневной", "цветочный", "древесный", "свежий", "интенсивный",
+         "eau", "parfum", "elixir", "intense", "night", "day", "repair", "hydra", "gold", "rose",
+         "vanilla", "musk", "citrus", "oud", "velvet", "silk"]
+
+LEGACY_QUERY = """
+    SELECT p.id, p.name, p.description, p.price, p.stock_quantity, b.brand_name AS brand, c.name AS category
+    FROM products p
+    LEFT JOIN brands b ON p.brand_id = b.id
+    LEFT JOIN categories c ON p.category_id = c.id
+    WHERE p.name LIKE $1
+"""
+
+
+def _typo(word, rng):
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def make_products(count, brand_ids, category_ids, rng):
+    for _ in range(count):
+        name_words = rng.sample(WORDS, rng.randint(2, 4))
+        description_words = rng.choices(WORDS, k=rng.randint(15, 40))
+        yield (
+            " ".join(name_words).capitalize(),
+            " ".join(description_words),
+            round(rng.uniform(5, 500), 2),
+            rng.randint(0, 100),
+            rng.choice(category_ids),
+            rng.choice(brand_ids),
+        )
+
+
+def make_search_terms(count, rng):
+    terms = []
+    for _ in range(count):
+        word = rng.choice(WORDS)
+        terms.append(_typo(word, rng) if rng.random() < 0.2 else word)
+    return terms
+
+
+async def seed(conn, products, rng):
+    brand_ids = [await conn.fetchval("INSERT INTO brands (brand_name) VALUES ($1) RETURNING id", name)
+                 for name in BRANDS]
+    category_ids = [await conn.fetchval("INSERT INTO categories (name) VALUES ($1) RETURNING id", name)
+                    for name in CATEGORIES]
+    await conn.copy_records_to_table(
+        "products",
+        records=make_products(products, brand_ids, category_ids, rng),
+        columns=["name", "description", "price", "stock_quantity", "category_id", "brand_id"],
+    )
+    await conn.execute("ANALYZE products")
+
+
+def _ranked_queries(terms, top_k):
+    """Тот же SQL, что выполняет search.search_products, для каждой поисковой строки."""
+    query = search.build_search_query("", limit=top_k)[0]
+    return query, [search.build_search_query(term, limit=top_k)[1] for term in terms]
+
+
+async def time_queries(conn, query, params_list):
+    timings = []
+    for params in params_list:
+        started = time.perf_counter()
+        await conn.fetch(query, *params)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<12} p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms")
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    conn = await asyncpg.connect(**db.connect_options())
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        print(f"Заполнение: {args.products} товаров...")
+        await seed(conn, args.products, rng)
+
+        terms = make_search_terms(args.queries, rng)
+        legacy = await time_queries(conn, LEGACY_QUERY, [(f"%{term}%",) for term in terms])
+
+        ranked = await time_queries(conn, *_ranked_queries(terms, args.top_k))
+
+        report("LIKE", legacy)
+        report("full-text", ranked)
+    finally:
+        await transaction.rollback()
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+-- Полнотекстовый и нечёткий (триграммный) поиск по товарам.
+-- Применяется после ddl.sql.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE public.products ADD search_vector tsvector NULL;
+
+-- Документ для поиска: название (A), бренд и категория (B), описание (C/D).
+-- Каждое поле индексируется в русской и английской конфигурациях.
+CREATE OR REPLACE FUNCTION public.product_search_document(
+	p_name varchar, p_description text, p_brand varchar, p_category varchar
+) RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+	SELECT setweight(to_tsvector('russian', coalesce(p_name, '')), 'A')
+	    || setweight(to_tsvector('english', coalesce(p_name, '')), 'A')
+	    || setweight(to_tsvector('russian', coalesce(p_brand, '') || ' ' || coalesce(p_category, '')), 'B')
+	    || setweight(to_tsvector('english', coalesce(p_brand, '') || ' ' || coalesce(p_category, '')), 'B')
+	    || setweight(to_tsvector('russian', coalesce(p_description, '')), 'C')
+	    || setweight(to_tsvector('english', coalesce(p_description, '')), 'D')
+$$;
+
+CREATE OR REPLACE FUNCTION public.products_search_vector_refresh() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	NEW.search_vector := public.product_search_document(
+		NEW."name",
+		NEW.description,
+		(SELECT brand_name FROM public.brands WHERE id = NEW.brand_id),
+		(SELECT "name" FROM public.categories WHERE id = NEW.category_id)
+	);
+	RETURN NEW;
+END
+$$;
+
+CREATE TRIGGER products_search_vector_trg
+	BEFORE INSERT OR UPDATE OF "name", description, brand_id, category_id ON public.products
+	FOR EACH ROW EXECUTE FUNCTION public.products_search_vector_refresh();
+
+-- Переименование бренда или категории пересчитывает документы связанных товаров
+CREATE OR REPLACE FUNCTION public.products_search_vector_refresh_related() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	IF TG_TABLE_NAME = 'brands' THEN
+		UPDATE public.products p
+		SET search_vector = public.product_search_document(p."name", p.description, NEW.brand_name, c."name")
+		FROM public.products p2
+		LEFT JOIN public.categories c ON c.id = p2.category_id
+		WHERE p.id = p2.id AND p.brand_id = NEW.id;
+	ELSE
+		UPDATE public.products p
+		SET search_vector = public.product_search_document(p."name", p.description, b.brand_name, NEW."name")
+		FROM public.products p2
+		LEFT JOIN public.brands b ON b.id = p2.brand_id
+		WHERE p.id = p2.id AND p.category_id = NEW.id;
+	END IF;
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER brands_search_vector_trg
+	AFTER UPDATE OF brand_name ON public.brands
+	FOR EACH ROW EXECUTE FUNCTION public.products_search_vector_refresh_related();
+
+CREATE TRIGGER categories_search_vector_trg
+	AFTER UPDATE OF "name" ON public.categories
+	FOR EACH ROW EXECUTE FUNCTION public.products_search_vector_refresh_related();
+
+-- Заполнение для уже существующих товаров
+UPDATE public.products p
+SET search_vector = public.product_search_document(p."name", p.description, b.brand_name, c."name")
+FROM public.products p2
+LEFT JOIN public.brands b ON b.id = p2.brand_id
+LEFT JOIN public.categories c ON c.id = p2.category_id
+WHERE p.id = p2.id;
+
+CREATE INDEX products_search_vector_idx ON public.products USING gin (search_vector);
+CREATE INDEX products_name_trgm_idx ON public.products USING gin ("name" gin_trgm_ops);
@@ -0,0 +1,32 @@
+-- Индексы под запросы страниц (_src/pages) и поиска (_src/search.py).
+-- Применяется после 001_product_search.sql. Проверка планов: python -m tools.check_query_plans
+
+-- Позиции заказа: корзина и состав заказа читаются по order_id, правка/удаление позиции - по (order_id, product_id)
+CREATE INDEX order_items_order_product_idx ON public.order_items USING btree (order_id, product_id);
+-- Удаление товара менеджером чистит его позиции во всех заказах
+CREATE INDEX order_items_product_id_idx ON public.order_items USING btree (product_id);
+
+-- Отзывы о товарах каталога (product_id = ANY(...) ORDER BY product_id, date)
+CREATE INDEX reviews_product_date_idx ON public.reviews USING btree (product_id, "date");
+-- Проверка «уже оставил отзыв» на странице профиля
+CREATE INDEX reviews_customer_product_idx ON public.reviews USING btree (customer_id, product_id);
+
+-- Заказы покупателя по состоянию, новые первыми
+CREATE INDEX orders_customer_state_date_idx ON public.orders USING btree (customer_id, order_state, order_date DESC);
+-- Последний оплаченный заказ (customer_page.get_last_order)
+CREATE INDEX orders_customer_paid_date_idx ON public.orders USING btree (customer_id, order_date DESC)
+	WHERE order_state = 'оплачен';
+
+-- Вход по имени пользователя
+CREATE INDEX customers_name_idx ON public.customers USING btree ("name");
+
+-- Внешние ключи товаров и поиск справочников по имени
+CREATE INDEX products_brand_id_idx ON public.products USING btree (brand_id);
+CREATE INDEX products_category_id_idx ON public.products USING btree (category_id);
+CREATE INDEX brands_brand_name_idx ON public.brands USING btree (brand_name);
+CREATE INDEX categories_name_idx ON public.categories USING btree ("name");
+
+-- Keyset-пагинация каталога: выражения совпадают с buy_products.SORT_OPTIONS
+CREATE INDEX products_sort_name_idx ON public.products USING btree ((COALESCE("name", '')), id);
+CREATE INDEX products_sort_price_idx ON public.products USING btree ((COALESCE(price, 0)), id);
+CREATE INDEX products_sort_stock_idx ON public.products USING btree ((COALESCE(stock_quantity, 0)), id);
@@ -0,0 +1,19 @@
+-- Уведомления об изменении справочников брендов и категорий.
+-- Процессы приложения слушают канал reference_data_changed и сбрасывают кэш
+-- фильтров каталога (_src/cache.py); payload - имя изменённой таблицы.
+
+CREATE OR REPLACE FUNCTION public.notify_reference_data_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER brands_notify_trg
+	AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.brands
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_reference_data_changed();
+
+CREATE TRIGGER categories_notify_trg
+	AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.categories
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_reference_data_changed();
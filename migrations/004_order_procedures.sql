@@ -0,0 +1,133 @@
+-- Серверные функции для оформления заказа и изменения корзины.
+-- Используются при ORDER_BACKEND=procedure (_src/config.py): каждая операция - один вызов.
+
+-- Оформление заказа: блокирует заказ, покупателя и товары (в порядке id), проверяет
+-- остатки и баланс и только при успехе списывает их и переводит заказ в «оплачен».
+-- status: success | insufficient_funds | out_of_stock | empty_cart | order_closed
+CREATE OR REPLACE FUNCTION public.shop_checkout(p_order_id int4, p_customer_id int4)
+RETURNS TABLE (
+	status text,
+	total numeric,
+	balance numeric,
+	short_ids int4[],
+	short_names varchar[],
+	short_requested int8[],
+	short_available int4[]
+)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+	v_items int8;
+BEGIN
+	total := 0;
+
+	PERFORM 1
+	FROM public.orders o
+	WHERE o.id = p_order_id AND o.customer_id = p_customer_id AND o.order_state = 'в обработке'
+	FOR UPDATE;
+	IF NOT FOUND THEN
+		SELECT c.balance INTO balance FROM public.customers c WHERE c.id = p_customer_id;
+		status := 'order_closed';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	SELECT c.balance INTO balance FROM public.customers c WHERE c.id = p_customer_id FOR UPDATE;
+
+	SELECT count(*), COALESCE(SUM(oi.quantity * oi.unitprice), 0)
+	INTO v_items, total
+	FROM public.order_items oi
+	WHERE oi.order_id = p_order_id;
+	IF v_items = 0 THEN
+		status := 'empty_cart';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	SELECT array_agg(l.id ORDER BY l.id), array_agg(l.name ORDER BY l.id),
+	       array_agg(l.quantity ORDER BY l.id), array_agg(COALESCE(l.stock_quantity, 0) ORDER BY l.id)
+	INTO short_ids, short_names, short_requested, short_available
+	FROM (
+		SELECT p.id, p.name, p.stock_quantity, i.quantity
+		FROM public.products p
+		JOIN (SELECT oi.product_id, SUM(oi.quantity) AS quantity
+		      FROM public.order_items oi
+		      WHERE oi.order_id = p_order_id
+		      GROUP BY oi.product_id) i ON i.product_id = p.id
+		ORDER BY p.id
+		FOR UPDATE OF p
+	) l
+	WHERE COALESCE(l.stock_quantity, 0) < l.quantity;
+
+	IF short_ids IS NOT NULL THEN
+		status := 'out_of_stock';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	IF balance IS NULL OR balance < total THEN
+		status := 'insufficient_funds';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	UPDATE public.products p
+	SET stock_quantity = p.stock_quantity - i.quantity
+	FROM (SELECT oi.product_id, SUM(oi.quantity) AS quantity
+	      FROM public.order_items oi
+	      WHERE oi.order_id = p_order_id
+	      GROUP BY oi.product_id) i
+	WHERE p.id = i.product_id;
+
+	UPDATE public.customers c
+	SET balance = c.balance - total
+	WHERE c.id = p_customer_id
+	RETURNING c.balance INTO balance;
+
+	UPDATE public.orders o
+	SET order_state = 'оплачен', order_summ = total
+	WHERE o.id = p_order_id;
+
+	status := 'success';
+	RETURN NEXT;
+END
+$$;
+
+-- Добавление товара в корзину с пересчётом суммы заказа; возвращает новую сумму
+CREATE OR REPLACE FUNCTION public.shop_add_cart_item(p_order_id int4, p_product_id int4, p_quantity int4, p_unitprice numeric)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_summ numeric;
+BEGIN
+	INSERT INTO public.order_items (order_id, product_id, quantity, unitprice)
+	VALUES (p_order_id, p_product_id, p_quantity, p_unitprice);
+
+	UPDATE public.orders o
+	SET order_summ = (SELECT SUM(oi.quantity * oi.unitprice) FROM public.order_items oi WHERE oi.order_id = p_order_id)
+	WHERE o.id = p_order_id
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
+
+-- Изменение количества товара в корзине с пересчётом суммы заказа; возвращает новую сумму
+CREATE OR REPLACE FUNCTION public.shop_set_cart_item_quantity(p_order_id int4, p_product_id int4, p_quantity int4)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_summ numeric;
+BEGIN
+	UPDATE public.order_items oi
+	SET quantity = p_quantity
+	WHERE oi.order_id = p_order_id AND oi.product_id = p_product_id;
+
+	UPDATE public.orders o
+	SET order_summ = (SELECT SUM(oi.quantity * oi.unitprice) FROM public.order_items oi WHERE oi.order_id = p_order_id)
+	WHERE o.id = p_order_id
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
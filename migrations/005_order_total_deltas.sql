@@ -0,0 +1,75 @@
+-- Сумма заказа поддерживается приращениями: функции корзины из
+-- 004_order_procedures.sql больше не пересчитывают SUM по всем позициям заказа,
+-- а сдвигают orders.order_summ на изменение одной позиции.
+-- Сверка и починка сумм: python -m tools.check_order_totals [--repair]
+
+CREATE OR REPLACE FUNCTION public.shop_add_cart_item(p_order_id int4, p_product_id int4, p_quantity int4, p_unitprice numeric)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_summ numeric;
+BEGIN
+	INSERT INTO public.order_items (order_id, product_id, quantity, unitprice)
+	VALUES (p_order_id, p_product_id, p_quantity, p_unitprice);
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) + p_quantity * p_unitprice
+	WHERE o.id = p_order_id
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.shop_set_cart_item_quantity(p_order_id int4, p_product_id int4, p_quantity int4)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_delta numeric;
+	v_summ numeric;
+BEGIN
+	WITH previous AS (
+		SELECT oi.id, oi.quantity
+		FROM public.order_items oi
+		WHERE oi.order_id = p_order_id AND oi.product_id = p_product_id
+		FOR UPDATE
+	), changed AS (
+		UPDATE public.order_items oi
+		SET quantity = p_quantity
+		FROM previous
+		WHERE oi.id = previous.id
+		RETURNING (oi.quantity - previous.quantity) * oi.unitprice AS delta
+	)
+	SELECT COALESCE(SUM(changed.delta), 0) INTO v_delta FROM changed;
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) + v_delta
+	WHERE o.id = p_order_id
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.shop_remove_cart_item(p_order_id int4, p_product_id int4)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_amount numeric;
+	v_summ numeric;
+BEGIN
+	WITH removed AS (
+		DELETE FROM public.order_items oi
+		WHERE oi.order_id = p_order_id AND oi.product_id = p_product_id
+		RETURNING oi.quantity * oi.unitprice AS amount
+	)
+	SELECT COALESCE(SUM(removed.amount), 0) INTO v_amount FROM removed;
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) - v_amount
+	WHERE o.id = p_order_id
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
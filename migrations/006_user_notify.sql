@@ -0,0 +1,15 @@
+-- Уведомления об изменении пользователей.
+-- Процессы приложения слушают канал user_changed и помечают устаревшим
+-- контекст пользователя в сессиях (_src/users.py); payload - customers.id.
+
+CREATE OR REPLACE FUNCTION public.notify_user_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM pg_notify('user_changed', OLD.id::text);
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER customers_notify_trg
+	AFTER UPDATE OF name, role, balance OR DELETE ON public.customers
+	FOR EACH ROW EXECUTE FUNCTION public.notify_user_changed();
@@ -0,0 +1,54 @@
+-- Уведомления об изменении товаров для общего кэша каталога (_src/cache.py, cache.products).
+-- Изменение нескольких товаров (до 100 строк за оператор) шлёт по уведомлению на товар:
+-- {"id": ..., "price": ..., "stock_quantity": ..., "changed": [изменённые столбцы]}.
+-- Добавление, удаление и массовые изменения шлют пустой payload - кэш сбрасывается целиком.
+
+CREATE OR REPLACE FUNCTION public.notify_products_updated() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+	r record;
+BEGIN
+	IF (SELECT count(*) FROM new_rows) > 100 THEN
+		PERFORM pg_notify('products_changed', '');
+		RETURN NULL;
+	END IF;
+
+	FOR r IN
+		SELECT n.id, n.price, n.stock_quantity,
+		       array_remove(ARRAY[
+		           CASE WHEN n.name IS DISTINCT FROM o.name THEN 'name' END,
+		           CASE WHEN n.description IS DISTINCT FROM o.description THEN 'description' END,
+		           CASE WHEN n.price IS DISTINCT FROM o.price THEN 'price' END,
+		           CASE WHEN n.stock_quantity IS DISTINCT FROM o.stock_quantity THEN 'stock_quantity' END,
+		           CASE WHEN n.brand_id IS DISTINCT FROM o.brand_id THEN 'brand_id' END,
+		           CASE WHEN n.category_id IS DISTINCT FROM o.category_id THEN 'category_id' END
+		       ], NULL) AS changed
+		FROM new_rows n
+		JOIN old_rows o ON o.id = n.id
+	LOOP
+		-- Обновления только search_vector (переименование бренда или категории) кэш не касаются
+		IF cardinality(r.changed) > 0 THEN
+			PERFORM pg_notify('products_changed', json_build_object(
+				'id', r.id, 'price', r.price, 'stock_quantity', r.stock_quantity, 'changed', r.changed)::text);
+		END IF;
+	END LOOP;
+	RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.notify_products_replaced() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	PERFORM pg_notify('products_changed', '');
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER products_update_notify_trg
+	AFTER UPDATE ON public.products
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_products_updated();
+
+CREATE TRIGGER products_replace_notify_trg
+	AFTER INSERT OR DELETE OR TRUNCATE ON public.products
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_products_replaced();
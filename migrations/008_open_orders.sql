@@ -0,0 +1,44 @@
+-- Один открытый заказ ('в обработке') на покупателя и архив заброшенных корзин.
+-- Открытый заказ переиспользуется (_src/orders.py: acquire_open_order), а не создаётся
+-- при каждой новой сессии; заказы, не тронутые дольше OPEN_ORDER_MAX_AGE_HOURS,
+-- вместе с позициями переносятся в архив (reap_stale_orders, python -m tools.reap_orders).
+
+CREATE TABLE public.orders_archive (
+	LIKE public.orders,
+	archived_at timestamp NOT NULL DEFAULT now(),
+	CONSTRAINT orders_archive_pkey PRIMARY KEY (id)
+);
+
+CREATE TABLE public.order_items_archive (
+	LIKE public.order_items,
+	CONSTRAINT order_items_archive_pkey PRIMARY KEY (id)
+);
+CREATE INDEX order_items_archive_order_id_idx ON public.order_items_archive USING btree (order_id);
+
+-- До индекса у покупателя могло накопиться несколько открытых заказов:
+-- последний остаётся открытым, остальные уходят в архив как просроченные
+CREATE TEMP TABLE extra_open_orders AS
+SELECT id
+FROM (
+	SELECT id, row_number() OVER (PARTITION BY customer_id ORDER BY id DESC) AS n
+	FROM public.orders
+	WHERE order_state = 'в обработке'
+) o
+WHERE o.n > 1;
+
+INSERT INTO public.order_items_archive
+SELECT oi.* FROM public.order_items oi JOIN extra_open_orders e ON e.id = oi.order_id;
+DELETE FROM public.order_items oi USING extra_open_orders e WHERE oi.order_id = e.id;
+
+INSERT INTO public.orders_archive (id, customer_id, order_date, order_summ, order_state)
+SELECT o.id, o.customer_id, o.order_date, o.order_summ, 'просрочен'
+FROM public.orders o JOIN extra_open_orders e ON e.id = o.id;
+DELETE FROM public.orders o USING extra_open_orders e WHERE o.id = e.id;
+DROP TABLE extra_open_orders;
+
+-- Открытый заказ покупателя: поиск при входе в каталог и защита от второго открытого заказа
+CREATE UNIQUE INDEX orders_open_customer_idx ON public.orders USING btree (customer_id)
+	WHERE order_state = 'в обработке';
+-- Поиск заброшенных корзин по давности
+CREATE INDEX orders_open_date_idx ON public.orders USING btree (order_date)
+	WHERE order_state = 'в обработке';
@@ -0,0 +1,313 @@
+-- Помесячное секционирование orders и order_items по order_date (PostgreSQL 14+).
+-- Выполнять одной транзакцией (psql -1 -f ...): таблицы пересоздаются и данные копируются.
+--
+-- Первичный ключ секционированной таблицы включает ключ секционирования, поэтому
+-- orders и order_items получают ключ (id, order_date), а позиции - столбец order_date.
+-- Запросы, знающие order_date, читают одну секцию. Открытые заказы перечислены в
+-- open_orders (один на покупателя): корзина и оформление берут order_date оттуда.
+-- Будущие секции создаёт shop_create_order_partitions (процесс приложения и
+-- python -m tools.order_partitions ensure), старые секции выгружаются в сжатые файлы
+-- и отсоединяются (python -m tools.order_partitions archive).
+
+CREATE OR REPLACE FUNCTION public.shop_create_order_partitions(p_from date, p_to date)
+RETURNS int
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_month date := date_trunc('month', p_from);
+	v_suffix text;
+	v_created int := 0;
+BEGIN
+	WHILE v_month < p_to LOOP
+		v_suffix := to_char(v_month, 'YYYY_MM');
+		IF to_regclass('public.orders_' || v_suffix) IS NULL THEN
+			EXECUTE format('CREATE TABLE public.%I PARTITION OF public.orders FOR VALUES FROM (%L) TO (%L)',
+			               'orders_' || v_suffix, v_month, v_month + interval '1 month');
+			v_created := v_created + 1;
+		END IF;
+		IF to_regclass('public.order_items_' || v_suffix) IS NULL THEN
+			EXECUTE format('CREATE TABLE public.%I PARTITION OF public.order_items FOR VALUES FROM (%L) TO (%L)',
+			               'order_items_' || v_suffix, v_month, v_month + interval '1 month');
+		END IF;
+		v_month := v_month + interval '1 month';
+	END LOOP;
+	RETURN v_created;
+END
+$$;
+
+-- Прежние таблицы уступают имена; их индексы удаляются вместе с ними в конце
+ALTER TABLE public.order_items RENAME TO order_items_unpartitioned;
+ALTER TABLE public.orders RENAME TO orders_unpartitioned;
+ALTER TABLE public.order_items_unpartitioned RENAME CONSTRAINT order_items_pkey TO order_items_unpartitioned_pkey;
+ALTER TABLE public.orders_unpartitioned RENAME CONSTRAINT orders_pkey TO orders_unpartitioned_pkey;
+DROP INDEX public.order_items_order_product_idx;
+DROP INDEX public.order_items_product_id_idx;
+DROP INDEX public.orders_customer_state_date_idx;
+DROP INDEX public.orders_customer_paid_date_idx;
+DROP INDEX public.orders_open_customer_idx;
+DROP INDEX public.orders_open_date_idx;
+
+CREATE TABLE public.orders (
+	id int4 NOT NULL DEFAULT nextval('orders_id_seq'::regclass),
+	customer_id int4 NULL,
+	order_date timestamp NOT NULL,
+	order_summ numeric NULL,
+	order_state varchar(20) NULL,
+	CONSTRAINT orders_pkey PRIMARY KEY (id, order_date),
+	CONSTRAINT orders_cus_fk FOREIGN KEY (customer_id) REFERENCES public.customers(id)
+) PARTITION BY RANGE (order_date);
+
+CREATE TABLE public.order_items (
+	id int4 NOT NULL DEFAULT nextval('order_items_id_seq'::regclass),
+	order_id int4 NULL,
+	order_date timestamp NOT NULL,
+	product_id int4 NULL,
+	quantity int4 NULL,
+	unitprice numeric NULL,
+	CONSTRAINT order_items_pkey PRIMARY KEY (id, order_date),
+	CONSTRAINT items_orders_fk FOREIGN KEY (order_id, order_date) REFERENCES public.orders(id, order_date),
+	CONSTRAINT items_products_fk FOREIGN KEY (product_id) REFERENCES public.products(id)
+) PARTITION BY RANGE (order_date);
+
+ALTER TABLE public.orders OWNER TO postgres;
+ALTER TABLE public.order_items OWNER TO postgres;
+ALTER SEQUENCE public.orders_id_seq OWNED BY public.orders.id;
+ALTER SEQUENCE public.order_items_id_seq OWNED BY public.order_items.id;
+
+-- Те же индексы, что в 002_indexes.sql; создаются в каждой секции
+CREATE INDEX order_items_order_product_idx ON public.order_items USING btree (order_id, product_id);
+CREATE INDEX order_items_product_id_idx ON public.order_items USING btree (product_id);
+CREATE INDEX orders_customer_state_date_idx ON public.orders USING btree (customer_id, order_state, order_date DESC);
+CREATE INDEX orders_customer_paid_date_idx ON public.orders USING btree (customer_id, order_date DESC)
+	WHERE order_state = 'оплачен';
+
+-- Открытый заказ покупателя ('в обработке'): заменяет частичные индексы из 008_open_orders.sql,
+-- которые на секционированной таблице не могут быть уникальными по одному customer_id
+CREATE TABLE public.open_orders (
+	customer_id int4 NOT NULL,
+	order_id int4 NOT NULL,
+	order_date timestamp NOT NULL,
+	CONSTRAINT open_orders_pkey PRIMARY KEY (customer_id),
+	CONSTRAINT open_orders_order_key UNIQUE (order_id),
+	CONSTRAINT open_orders_customer_fk FOREIGN KEY (customer_id) REFERENCES public.customers(id),
+	CONSTRAINT open_orders_order_fk FOREIGN KEY (order_id, order_date)
+		REFERENCES public.orders(id, order_date) ON DELETE CASCADE
+);
+CREATE INDEX open_orders_order_date_idx ON public.open_orders USING btree (order_date);
+
+ALTER TABLE public.order_items_archive ADD order_date timestamp NULL;
+
+SELECT public.shop_create_order_partitions(
+	LEAST((SELECT min(order_date) FROM public.orders_unpartitioned), now())::date,
+	(GREATEST((SELECT max(order_date) FROM public.orders_unpartitioned), now()) + interval '3 months')::date
+);
+
+-- Заказы без даты получают время миграции
+INSERT INTO public.orders (id, customer_id, order_date, order_summ, order_state)
+SELECT id, customer_id, COALESCE(order_date, date_trunc('minute', now())), order_summ, order_state
+FROM public.orders_unpartitioned;
+
+INSERT INTO public.order_items (id, order_id, order_date, product_id, quantity, unitprice)
+SELECT oi.id, oi.order_id, o.order_date, oi.product_id, oi.quantity, oi.unitprice
+FROM public.order_items_unpartitioned oi
+JOIN public.orders o ON o.id = oi.order_id;
+
+INSERT INTO public.open_orders (customer_id, order_id, order_date)
+SELECT customer_id, id, order_date
+FROM public.orders
+WHERE order_state = 'в обработке' AND customer_id IS NOT NULL;
+
+DROP TABLE public.order_items_unpartitioned;
+DROP TABLE public.orders_unpartitioned;
+
+ANALYZE public.orders;
+ANALYZE public.order_items;
+ANALYZE public.open_orders;
+
+-- Функции корзины и оформления (004, 005) находят секцию заказа по open_orders.
+-- Заказ, которого нет в open_orders, уже не открыт: изменения корзины его не трогают.
+
+CREATE OR REPLACE FUNCTION public.shop_checkout(p_order_id int4, p_customer_id int4)
+RETURNS TABLE (
+	status text,
+	total numeric,
+	balance numeric,
+	short_ids int4[],
+	short_names varchar[],
+	short_requested int8[],
+	short_available int4[]
+)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+	v_items int8;
+	v_order_date timestamp;
+BEGIN
+	total := 0;
+
+	SELECT oo.order_date INTO v_order_date
+	FROM public.open_orders oo
+	WHERE oo.order_id = p_order_id AND oo.customer_id = p_customer_id;
+
+	PERFORM 1
+	FROM public.orders o
+	WHERE o.id = p_order_id AND o.order_date = v_order_date
+	  AND o.customer_id = p_customer_id AND o.order_state = 'в обработке'
+	FOR UPDATE;
+	IF NOT FOUND THEN
+		SELECT c.balance INTO balance FROM public.customers c WHERE c.id = p_customer_id;
+		status := 'order_closed';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	SELECT c.balance INTO balance FROM public.customers c WHERE c.id = p_customer_id FOR UPDATE;
+
+	SELECT count(*), COALESCE(SUM(oi.quantity * oi.unitprice), 0)
+	INTO v_items, total
+	FROM public.order_items oi
+	WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date;
+	IF v_items = 0 THEN
+		status := 'empty_cart';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	SELECT array_agg(l.id ORDER BY l.id), array_agg(l.name ORDER BY l.id),
+	       array_agg(l.quantity ORDER BY l.id), array_agg(COALESCE(l.stock_quantity, 0) ORDER BY l.id)
+	INTO short_ids, short_names, short_requested, short_available
+	FROM (
+		SELECT p.id, p.name, p.stock_quantity, i.quantity
+		FROM public.products p
+		JOIN (SELECT oi.product_id, SUM(oi.quantity) AS quantity
+		      FROM public.order_items oi
+		      WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date
+		      GROUP BY oi.product_id) i ON i.product_id = p.id
+		ORDER BY p.id
+		FOR UPDATE OF p
+	) l
+	WHERE COALESCE(l.stock_quantity, 0) < l.quantity;
+
+	IF short_ids IS NOT NULL THEN
+		status := 'out_of_stock';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	IF balance IS NULL OR balance < total THEN
+		status := 'insufficient_funds';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	UPDATE public.products p
+	SET stock_quantity = p.stock_quantity - i.quantity
+	FROM (SELECT oi.product_id, SUM(oi.quantity) AS quantity
+	      FROM public.order_items oi
+	      WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date
+	      GROUP BY oi.product_id) i
+	WHERE p.id = i.product_id;
+
+	UPDATE public.customers c
+	SET balance = c.balance - total
+	WHERE c.id = p_customer_id
+	RETURNING c.balance INTO balance;
+
+	UPDATE public.orders o
+	SET order_state = 'оплачен', order_summ = total
+	WHERE o.id = p_order_id AND o.order_date = v_order_date;
+
+	DELETE FROM public.open_orders oo WHERE oo.order_id = p_order_id;
+
+	status := 'success';
+	RETURN NEXT;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.shop_add_cart_item(p_order_id int4, p_product_id int4, p_quantity int4, p_unitprice numeric)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_order_date timestamp;
+	v_summ numeric;
+BEGIN
+	SELECT oo.order_date INTO v_order_date FROM public.open_orders oo WHERE oo.order_id = p_order_id;
+	IF NOT FOUND THEN
+		RETURN NULL;
+	END IF;
+
+	INSERT INTO public.order_items (order_id, order_date, product_id, quantity, unitprice)
+	VALUES (p_order_id, v_order_date, p_product_id, p_quantity, p_unitprice);
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) + p_quantity * p_unitprice
+	WHERE o.id = p_order_id AND o.order_date = v_order_date
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.shop_set_cart_item_quantity(p_order_id int4, p_product_id int4, p_quantity int4)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_order_date timestamp;
+	v_delta numeric;
+	v_summ numeric;
+BEGIN
+	SELECT oo.order_date INTO v_order_date FROM public.open_orders oo WHERE oo.order_id = p_order_id;
+	IF NOT FOUND THEN
+		RETURN NULL;
+	END IF;
+
+	WITH previous AS (
+		SELECT oi.id, oi.quantity
+		FROM public.order_items oi
+		WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date AND oi.product_id = p_product_id
+		FOR UPDATE
+	), changed AS (
+		UPDATE public.order_items oi
+		SET quantity = p_quantity
+		FROM previous
+		WHERE oi.id = previous.id AND oi.order_date = v_order_date
+		RETURNING (oi.quantity - previous.quantity) * oi.unitprice AS delta
+	)
+	SELECT COALESCE(SUM(changed.delta), 0) INTO v_delta FROM changed;
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) + v_delta
+	WHERE o.id = p_order_id AND o.order_date = v_order_date
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.shop_remove_cart_item(p_order_id int4, p_product_id int4)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_order_date timestamp;
+	v_amount numeric;
+	v_summ numeric;
+BEGIN
+	SELECT oo.order_date INTO v_order_date FROM public.open_orders oo WHERE oo.order_id = p_order_id;
+	IF NOT FOUND THEN
+		RETURN NULL;
+	END IF;
+
+	WITH removed AS (
+		DELETE FROM public.order_items oi
+		WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date AND oi.product_id = p_product_id
+		RETURNING oi.quantity * oi.unitprice AS amount
+	)
+	SELECT COALESCE(SUM(removed.amount), 0) INTO v_amount FROM removed;
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) - v_amount
+	WHERE o.id = p_order_id AND o.order_date = v_order_date
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
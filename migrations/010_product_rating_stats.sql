@@ -0,0 +1,201 @@
+-- Сводка оценок товаров: число отзывов, сумма и средняя оценка, гистограмма оценок 1-5.
+-- Строка есть у каждого товара (создаётся вместе с товаром) и меняется приращениями
+-- триггерами на reviews при добавлении, изменении и удалении отзывов. Каталог сортирует
+-- и фильтрует по avg_rate через индекс (_src/pages/buy_products.py). Изменение средней
+-- оценки шлёт в канал products_changed {"id": ..., "changed": ["rating"]} для общего кэша
+-- каталога. Пересчёт с нуля: SELECT shop_rebuild_rating_stats() или
+-- python -m tools.rebuild_rating_stats.
+
+CREATE TABLE public.product_rating_stats (
+	product_id int4 NOT NULL,
+	review_count int4 NOT NULL DEFAULT 0,
+	-- Отзывы с оценкой (rate не NULL) и сумма их оценок
+	rate_count int4 NOT NULL DEFAULT 0,
+	rate_sum numeric NOT NULL DEFAULT 0,
+	avg_rate numeric GENERATED ALWAYS AS (CASE WHEN rate_count > 0 THEN rate_sum / rate_count ELSE 0 END) STORED,
+	rate_1 int4 NOT NULL DEFAULT 0,
+	rate_2 int4 NOT NULL DEFAULT 0,
+	rate_3 int4 NOT NULL DEFAULT 0,
+	rate_4 int4 NOT NULL DEFAULT 0,
+	rate_5 int4 NOT NULL DEFAULT 0,
+	CONSTRAINT product_rating_stats_pkey PRIMARY KEY (product_id),
+	CONSTRAINT product_rating_stats_product_fk FOREIGN KEY (product_id) REFERENCES public.products(id) ON DELETE CASCADE
+);
+-- Сортировка каталога по рейтингу (в обе стороны) и фильтр по минимальной оценке
+CREATE INDEX product_rating_stats_avg_idx ON public.product_rating_stats USING btree (avg_rate, product_id);
+
+ALTER TABLE public.product_rating_stats OWNER TO postgres;
+GRANT ALL ON TABLE public.product_rating_stats TO postgres;
+
+-- Прибавляет к сводке отзывы (p_product_ids[i], p_rates[i]) со знаком p_sign (1 или -1).
+-- Строки сводки обновляются в порядке product_id, чтобы встречные изменения не взаимоблокировались.
+CREATE OR REPLACE FUNCTION public.shop_add_rating_deltas(p_product_ids int[], p_rates numeric[], p_sign int)
+RETURNS void
+LANGUAGE sql AS $$
+	INSERT INTO public.product_rating_stats AS s
+		(product_id, review_count, rate_count, rate_sum, rate_1, rate_2, rate_3, rate_4, rate_5)
+	SELECT d.product_id,
+	       p_sign * count(*),
+	       p_sign * count(d.rate),
+	       p_sign * COALESCE(sum(d.rate), 0),
+	       p_sign * count(*) FILTER (WHERE round(d.rate) = 1),
+	       p_sign * count(*) FILTER (WHERE round(d.rate) = 2),
+	       p_sign * count(*) FILTER (WHERE round(d.rate) = 3),
+	       p_sign * count(*) FILTER (WHERE round(d.rate) = 4),
+	       p_sign * count(*) FILTER (WHERE round(d.rate) = 5)
+	FROM unnest(p_product_ids, p_rates) AS d(product_id, rate)
+	WHERE d.product_id IS NOT NULL
+	GROUP BY d.product_id
+	ORDER BY d.product_id
+	ON CONFLICT (product_id) DO UPDATE SET
+		review_count = s.review_count + EXCLUDED.review_count,
+		rate_count = s.rate_count + EXCLUDED.rate_count,
+		rate_sum = s.rate_sum + EXCLUDED.rate_sum,
+		rate_1 = s.rate_1 + EXCLUDED.rate_1,
+		rate_2 = s.rate_2 + EXCLUDED.rate_2,
+		rate_3 = s.rate_3 + EXCLUDED.rate_3,
+		rate_4 = s.rate_4 + EXCLUDED.rate_4,
+		rate_5 = s.rate_5 + EXCLUDED.rate_5;
+$$;
+
+-- Изменение отзыва = удаление старой строки и добавление новой
+CREATE OR REPLACE FUNCTION public.reviews_stats_removed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_product_ids int[];
+	v_rates numeric[];
+BEGIN
+	SELECT array_agg(product_id), array_agg(rate) INTO v_product_ids, v_rates FROM old_rows;
+	PERFORM public.shop_add_rating_deltas(v_product_ids, v_rates, -1);
+	RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.reviews_stats_added() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_product_ids int[];
+	v_rates numeric[];
+BEGIN
+	SELECT array_agg(product_id), array_agg(rate) INTO v_product_ids, v_rates FROM new_rows;
+	PERFORM public.shop_add_rating_deltas(v_product_ids, v_rates, 1);
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER reviews_stats_insert_trg
+	AFTER INSERT ON public.reviews
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.reviews_stats_added();
+
+CREATE TRIGGER reviews_stats_delete_trg
+	AFTER DELETE ON public.reviews
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.reviews_stats_removed();
+
+-- Триггеры UPDATE срабатывают в порядке имён: сначала вычитается старая строка, потом прибавляется новая
+CREATE TRIGGER reviews_stats_update_1_trg
+	AFTER UPDATE OF product_id, rate ON public.reviews
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.reviews_stats_removed();
+
+CREATE TRIGGER reviews_stats_update_2_trg
+	AFTER UPDATE OF product_id, rate ON public.reviews
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.reviews_stats_added();
+
+-- Новый товар сразу получает пустую сводку и участвует в сортировке по рейтингу
+CREATE OR REPLACE FUNCTION public.products_stats_created() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO public.product_rating_stats (product_id)
+	SELECT id FROM new_rows
+	ON CONFLICT (product_id) DO NOTHING;
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER products_stats_insert_trg
+	AFTER INSERT ON public.products
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.products_stats_created();
+
+-- Изменение средней оценки сбрасывает страницы каталога, зависящие от рейтинга
+-- (как migrations/007_products_notify.sql: больше 100 строк - пустой payload)
+CREATE OR REPLACE FUNCTION public.notify_rating_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+	r record;
+BEGIN
+	IF (SELECT count(*) FROM new_rows) > 100 THEN
+		PERFORM pg_notify('products_changed', '');
+		RETURN NULL;
+	END IF;
+
+	FOR r IN
+		SELECT n.product_id
+		FROM new_rows n
+		JOIN old_rows o ON o.product_id = n.product_id
+		WHERE n.avg_rate IS DISTINCT FROM o.avg_rate
+	LOOP
+		PERFORM pg_notify('products_changed', json_build_object(
+			'id', r.product_id, 'changed', ARRAY['rating'])::text);
+	END LOOP;
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER product_rating_stats_notify_trg
+	AFTER UPDATE ON public.product_rating_stats
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_rating_changed();
+
+-- Пересчёт сводки по всем отзывам; возвращает число исправленных строк.
+-- Запись в reviews на время пересчёта блокируется, иначе приращения триггеров потерялись бы.
+CREATE OR REPLACE FUNCTION public.shop_rebuild_rating_stats()
+RETURNS int
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_fixed int;
+BEGIN
+	LOCK TABLE public.reviews IN SHARE MODE;
+	WITH fresh AS (
+		SELECT p.id AS product_id,
+		       count(r.id) AS review_count,
+		       count(r.rate) AS rate_count,
+		       COALESCE(sum(r.rate), 0) AS rate_sum,
+		       count(r.id) FILTER (WHERE round(r.rate) = 1) AS rate_1,
+		       count(r.id) FILTER (WHERE round(r.rate) = 2) AS rate_2,
+		       count(r.id) FILTER (WHERE round(r.rate) = 3) AS rate_3,
+		       count(r.id) FILTER (WHERE round(r.rate) = 4) AS rate_4,
+		       count(r.id) FILTER (WHERE round(r.rate) = 5) AS rate_5
+		FROM public.products p
+		LEFT JOIN public.reviews r ON r.product_id = p.id
+		GROUP BY p.id
+	), fixed AS (
+		INSERT INTO public.product_rating_stats AS s
+			(product_id, review_count, rate_count, rate_sum, rate_1, rate_2, rate_3, rate_4, rate_5)
+		SELECT * FROM fresh
+		ORDER BY product_id
+		ON CONFLICT (product_id) DO UPDATE SET
+			review_count = EXCLUDED.review_count,
+			rate_count = EXCLUDED.rate_count,
+			rate_sum = EXCLUDED.rate_sum,
+			rate_1 = EXCLUDED.rate_1,
+			rate_2 = EXCLUDED.rate_2,
+			rate_3 = EXCLUDED.rate_3,
+			rate_4 = EXCLUDED.rate_4,
+			rate_5 = EXCLUDED.rate_5
+		WHERE (s.review_count, s.rate_count, s.rate_sum, s.rate_1, s.rate_2, s.rate_3, s.rate_4, s.rate_5)
+		      IS DISTINCT FROM
+		      (EXCLUDED.review_count, EXCLUDED.rate_count, EXCLUDED.rate_sum,
+		       EXCLUDED.rate_1, EXCLUDED.rate_2, EXCLUDED.rate_3, EXCLUDED.rate_4, EXCLUDED.rate_5)
+		RETURNING 1
+	)
+	SELECT count(*) INTO v_fixed FROM fixed;
+	RETURN v_fixed;
+END
+$$;
+
+SELECT public.shop_rebuild_rating_stats();
+ANALYZE public.product_rating_stats;
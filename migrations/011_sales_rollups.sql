@@ -0,0 +1,79 @@
+-- Сводки продаж для страницы аналитики менеджера (_src/pages/analytics_page.py).
+-- sales_daily - продажи товара за день, sales_daily_totals - итоги дня; учитываются
+-- только оплаченные заказы (order_state = 'оплачен'), день - order_date заказа.
+-- Триггеры на orders ставят заказ, ставший оплаченным, в очередь sales_rollup_queue;
+-- фоновая задача процесса приложения (_src/sales_rollups.py) разбирает очередь пачками
+-- и прибавляет позиции заказов к сводкам. Сводки не зависят от размера истории и
+-- переживают выгрузку старых секций заказов в архив.
+-- Пересчёт за период: python -m tools.rebuild_sales_rollups --since 2024-01-01.
+
+CREATE TABLE public.sales_daily (
+	"day" date NOT NULL,
+	product_id int4 NOT NULL,
+	-- Бренд и категория товара на момент первой продажи за день: разрезы строятся без products
+	brand_id int4 NULL,
+	category_id int4 NULL,
+	orders int4 NOT NULL DEFAULT 0,
+	units int8 NOT NULL DEFAULT 0,
+	revenue numeric NOT NULL DEFAULT 0,
+	CONSTRAINT sales_daily_pkey PRIMARY KEY ("day", product_id)
+);
+
+CREATE TABLE public.sales_daily_totals (
+	"day" date NOT NULL,
+	orders int4 NOT NULL DEFAULT 0,
+	units int8 NOT NULL DEFAULT 0,
+	revenue numeric NOT NULL DEFAULT 0,
+	CONSTRAINT sales_daily_totals_pkey PRIMARY KEY ("day")
+);
+
+CREATE TABLE public.sales_rollup_queue (
+	order_id int4 NOT NULL,
+	order_date timestamp NOT NULL,
+	CONSTRAINT sales_rollup_queue_pkey PRIMARY KEY (order_id, order_date)
+);
+
+ALTER TABLE public.sales_daily OWNER TO postgres;
+GRANT ALL ON TABLE public.sales_daily TO postgres;
+ALTER TABLE public.sales_daily_totals OWNER TO postgres;
+GRANT ALL ON TABLE public.sales_daily_totals TO postgres;
+ALTER TABLE public.sales_rollup_queue OWNER TO postgres;
+GRANT ALL ON TABLE public.sales_rollup_queue TO postgres;
+
+CREATE OR REPLACE FUNCTION public.orders_paid_inserted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO public.sales_rollup_queue (order_id, order_date)
+	SELECT id, order_date FROM new_rows
+	WHERE order_state = 'оплачен'
+	ON CONFLICT DO NOTHING;
+	RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.orders_paid_updated() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO public.sales_rollup_queue (order_id, order_date)
+	SELECT n.id, n.order_date
+	FROM new_rows n
+	JOIN old_rows o ON o.id = n.id AND o.order_date = n.order_date
+	WHERE n.order_state = 'оплачен' AND o.order_state IS DISTINCT FROM 'оплачен'
+	ON CONFLICT DO NOTHING;
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER orders_paid_insert_trg
+	AFTER INSERT ON public.orders
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.orders_paid_inserted();
+
+CREATE TRIGGER orders_paid_update_trg
+	AFTER UPDATE ON public.orders
+	REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.orders_paid_updated();
+
+-- Уже оплаченные заказы попадают в сводки через очередь
+INSERT INTO public.sales_rollup_queue (order_id, order_date)
+SELECT id, order_date FROM public.orders WHERE order_state = 'оплачен';
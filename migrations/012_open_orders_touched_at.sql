@@ -0,0 +1,48 @@
+-- Время последнего действия с открытым заказом: заброшенной считается корзина, которую
+-- не трогали дольше OPEN_ORDER_MAX_AGE_HOURS, а не созданная так давно
+-- (_src/orders.py: reap_stale_orders). touched_at сдвигается, когда покупатель получает
+-- свой открытый заказ (acquire_open_order), и триггерами на order_items при любом
+-- изменении позиций - одинаково для ORDER_BACKEND = python и procedure.
+-- Уже открытые заказы получают время миграции: их корзины не уходят в архив сразу.
+
+ALTER TABLE public.open_orders ADD touched_at timestamp NOT NULL DEFAULT now();
+
+-- Поиск заброшенных корзин по давности последнего действия
+CREATE INDEX open_orders_touched_at_idx ON public.open_orders USING btree (touched_at);
+
+CREATE OR REPLACE FUNCTION public.open_orders_touch_new() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	UPDATE public.open_orders oo
+	SET touched_at = now()
+	WHERE oo.order_id IN (SELECT order_id FROM new_rows);
+	RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.open_orders_touch_old() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	UPDATE public.open_orders oo
+	SET touched_at = now()
+	WHERE oo.order_id IN (SELECT order_id FROM old_rows);
+	RETURN NULL;
+END
+$$;
+
+CREATE TRIGGER order_items_touch_insert_trg
+	AFTER INSERT ON public.order_items
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.open_orders_touch_new();
+
+CREATE TRIGGER order_items_touch_update_trg
+	AFTER UPDATE ON public.order_items
+	REFERENCING NEW TABLE AS new_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.open_orders_touch_new();
+
+CREATE TRIGGER order_items_touch_delete_trg
+	AFTER DELETE ON public.order_items
+	REFERENCING OLD TABLE AS old_rows
+	FOR EACH STATEMENT EXECUTE FUNCTION public.open_orders_touch_old();
+
+ANALYZE public.open_orders;
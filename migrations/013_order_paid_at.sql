@@ -0,0 +1,144 @@
+-- Время оплаты заказа: сводки продаж (011_sales_rollups.sql) относят продажу ко дню
+-- оплаты, а не ко дню создания заказа. Открытый заказ переиспользуется
+-- (008_open_orders.sql), поэтому order_date - день, когда покупатель начал корзину.
+-- paid_at ставят оформление заказа (_src/checkout.py) и shop_checkout; у заказов,
+-- оплаченных раньше, и у заказов, вставленных сразу оплаченными (tools/generate_data.py),
+-- днём оплаты считается order_date.
+-- Очередь сводок хранит время оплаты, чтобы пачка не читала его из orders повторно.
+
+ALTER TABLE public.orders ADD paid_at timestamp NULL;
+
+UPDATE public.orders SET paid_at = order_date WHERE order_state = 'оплачен';
+
+ALTER TABLE public.sales_rollup_queue ADD paid_at timestamp NULL;
+
+UPDATE public.sales_rollup_queue q
+SET paid_at = o.paid_at
+FROM public.orders o
+WHERE o.id = q.order_id AND o.order_date = q.order_date;
+
+UPDATE public.sales_rollup_queue SET paid_at = order_date WHERE paid_at IS NULL;
+
+ALTER TABLE public.sales_rollup_queue ALTER paid_at SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.orders_paid_inserted() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO public.sales_rollup_queue (order_id, order_date, paid_at)
+	SELECT id, order_date, COALESCE(paid_at, order_date) FROM new_rows
+	WHERE order_state = 'оплачен'
+	ON CONFLICT DO NOTHING;
+	RETURN NULL;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.orders_paid_updated() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+	INSERT INTO public.sales_rollup_queue (order_id, order_date, paid_at)
+	SELECT n.id, n.order_date, COALESCE(n.paid_at, n.order_date)
+	FROM new_rows n
+	JOIN old_rows o ON o.id = n.id AND o.order_date = n.order_date
+	WHERE n.order_state = 'оплачен' AND o.order_state IS DISTINCT FROM 'оплачен'
+	ON CONFLICT DO NOTHING;
+	RETURN NULL;
+END
+$$;
+
+-- Та же функция, что в 009_order_partitions.sql, но с временем оплаты
+CREATE OR REPLACE FUNCTION public.shop_checkout(p_order_id int4, p_customer_id int4)
+RETURNS TABLE (
+	status text,
+	total numeric,
+	balance numeric,
+	short_ids int4[],
+	short_names varchar[],
+	short_requested int8[],
+	short_available int4[]
+)
+LANGUAGE plpgsql AS $$
+#variable_conflict use_column
+DECLARE
+	v_items int8;
+	v_order_date timestamp;
+BEGIN
+	total := 0;
+
+	SELECT oo.order_date INTO v_order_date
+	FROM public.open_orders oo
+	WHERE oo.order_id = p_order_id AND oo.customer_id = p_customer_id;
+
+	PERFORM 1
+	FROM public.orders o
+	WHERE o.id = p_order_id AND o.order_date = v_order_date
+	  AND o.customer_id = p_customer_id AND o.order_state = 'в обработке'
+	FOR UPDATE;
+	IF NOT FOUND THEN
+		SELECT c.balance INTO balance FROM public.customers c WHERE c.id = p_customer_id;
+		status := 'order_closed';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	SELECT c.balance INTO balance FROM public.customers c WHERE c.id = p_customer_id FOR UPDATE;
+
+	SELECT count(*), COALESCE(SUM(oi.quantity * oi.unitprice), 0)
+	INTO v_items, total
+	FROM public.order_items oi
+	WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date;
+	IF v_items = 0 THEN
+		status := 'empty_cart';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	SELECT array_agg(l.id ORDER BY l.id), array_agg(l.name ORDER BY l.id),
+	       array_agg(l.quantity ORDER BY l.id), array_agg(COALESCE(l.stock_quantity, 0) ORDER BY l.id)
+	INTO short_ids, short_names, short_requested, short_available
+	FROM (
+		SELECT p.id, p.name, p.stock_quantity, i.quantity
+		FROM public.products p
+		JOIN (SELECT oi.product_id, SUM(oi.quantity) AS quantity
+		      FROM public.order_items oi
+		      WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date
+		      GROUP BY oi.product_id) i ON i.product_id = p.id
+		ORDER BY p.id
+		FOR UPDATE OF p
+	) l
+	WHERE COALESCE(l.stock_quantity, 0) < l.quantity;
+
+	IF short_ids IS NOT NULL THEN
+		status := 'out_of_stock';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	IF balance IS NULL OR balance < total THEN
+		status := 'insufficient_funds';
+		RETURN NEXT;
+		RETURN;
+	END IF;
+
+	UPDATE public.products p
+	SET stock_quantity = p.stock_quantity - i.quantity
+	FROM (SELECT oi.product_id, SUM(oi.quantity) AS quantity
+	      FROM public.order_items oi
+	      WHERE oi.order_id = p_order_id AND oi.order_date = v_order_date
+	      GROUP BY oi.product_id) i
+	WHERE p.id = i.product_id;
+
+	UPDATE public.customers c
+	SET balance = c.balance - total
+	WHERE c.id = p_customer_id
+	RETURNING c.balance INTO balance;
+
+	UPDATE public.orders o
+	SET order_state = 'оплачен', order_summ = total, paid_at = now()
+	WHERE o.id = p_order_id AND o.order_date = v_order_date;
+
+	DELETE FROM public.open_orders oo WHERE oo.order_id = p_order_id;
+
+	status := 'success';
+	RETURN NEXT;
+END
+$$;
@@ -0,0 +1,35 @@
+-- Добавление в корзину блокирует строку заказа, как shop_checkout (013_order_paid_at.sql):
+-- позиция не попадает в заказ, который оплачивают одновременно. После оплаты заказ уже
+-- не 'в обработке', и функция возвращает NULL, ничего не меняя (_src/cart.py: ADD_ITEM_QUERY).
+
+CREATE OR REPLACE FUNCTION public.shop_add_cart_item(p_order_id int4, p_product_id int4, p_quantity int4, p_unitprice numeric)
+RETURNS numeric
+LANGUAGE plpgsql AS $$
+DECLARE
+	v_order_date timestamp;
+	v_summ numeric;
+BEGIN
+	SELECT oo.order_date INTO v_order_date FROM public.open_orders oo WHERE oo.order_id = p_order_id;
+	IF NOT FOUND THEN
+		RETURN NULL;
+	END IF;
+
+	PERFORM 1
+	FROM public.orders o
+	WHERE o.id = p_order_id AND o.order_date = v_order_date AND o.order_state = 'в обработке'
+	FOR UPDATE;
+	IF NOT FOUND THEN
+		RETURN NULL;
+	END IF;
+
+	INSERT INTO public.order_items (order_id, order_date, product_id, quantity, unitprice)
+	VALUES (p_order_id, v_order_date, p_product_id, p_quantity, p_unitprice);
+
+	UPDATE public.orders o
+	SET order_summ = COALESCE(o.order_summ, 0) + p_quantity * p_unitprice
+	WHERE o.id = p_order_id AND o.order_date = v_order_date
+	RETURNING o.order_summ INTO v_summ;
+
+	RETURN v_summ;
+END
+$$;
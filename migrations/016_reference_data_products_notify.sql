@@ -0,0 +1,13 @@
+-- Страницы каталога в общем кэше (_src/cache.py, cache.products) показывают название
+-- бренда и категории товара. Переименование или удаление бренда или категории меняет
+-- эти строки, не трогая products, поэтому триггеры из 007_products_notify.sql
+-- молчат. Такие изменения редки: они шлют в products_changed пустой payload, и кэш
+-- каталога сбрасывается целиком. Добавление бренда или категории страниц не меняет.
+
+CREATE TRIGGER brands_products_notify_trg
+	AFTER UPDATE OR DELETE OR TRUNCATE ON public.brands
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_products_replaced();
+
+CREATE TRIGGER categories_products_notify_trg
+	AFTER UPDATE OR DELETE OR TRUNCATE ON public.categories
+	FOR EACH STATEMENT EXECUTE FUNCTION public.notify_products_replaced();
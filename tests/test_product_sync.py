@@ -0,0 +1,55 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("asyncpg")
+pytest.importorskip("streamlit")
+
+from _src import product_sync
+from _src.pages import edit_products
+
+
+def _products(*rows):
+    """DataFrame товаров тех же типов, что строит таблица менеджера."""
+    return edit_products.records_to_dataframe(list(rows))
+
+
+ORIGINAL = _products(
+    (1, 'Чайник', None, None, 3, None, None),
+    (2, 'Кружка', 'Фарфор', 250.0, 10, 'Дом', 'Посуда'),
+)
+
+
+@pytest.mark.parametrize("column, value", [
+    ('description', 'Стальной'),
+    ('price', 1990.0),
+    ('brand_name', 'Дом'),
+    ('category_name', 'Посуда'),
+])
+def test_null_to_value_is_changed(column, value):
+    edited = ORIGINAL.copy()
+    edited.loc[0, column] = value
+
+    changed, added, deleted = product_sync.diff_products(ORIGINAL, edited)
+
+    assert list(changed['product_id']) == [1]
+    assert changed.iloc[0][column] == value
+    assert added.empty
+    assert deleted == []
+
+
+@pytest.mark.parametrize("column", ['description', 'price', 'brand_name', 'category_name'])
+def test_value_to_null_is_changed(column):
+    edited = ORIGINAL.copy()
+    edited.loc[1, column] = None
+
+    changed, _, _ = product_sync.diff_products(ORIGINAL, edited)
+
+    assert list(changed['product_id']) == [2]
+
+
+def test_unchanged_nulls_are_not_changed():
+    changed, added, deleted = product_sync.diff_products(ORIGINAL, ORIGINAL.copy())
+
+    assert changed.empty
+    assert added.empty
+    assert deleted == []
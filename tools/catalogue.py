@@ -0,0 +1,43 @@
+"""Импорт и экспорт каталога товаров из командной строки (CSV или Parquet, по расширению файла).
+
+Делает то же, что раздел «Импорт и экспорт» страницы управления товарами, но без
+загрузки файла через браузер - удобно для больших каталогов. Завершается с
+ненулевым кодом, если при импорте были отклонены строки.
+
+    python -m tools.catalogue export catalogue.parquet
+    python -m tools.catalogue import catalogue.csv
+"""
+import argparse
+import sys
+
+from _src import catalogue_io
+from _src import db
+from _src import runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+
+    fmt = catalogue_io.file_format(args.path)
+    try:
+        if args.action == "export":
+            rows = runner.run(catalogue_io.export_catalogue(args.path, fmt, args.chunk_size))
+            print(f"Выгружено товаров: {rows}")
+            return
+        report = runner.run(catalogue_io.import_catalogue(args.path, fmt, chunk_size=args.chunk_size))
+    finally:
+        db.close()
+
+    print(f"Прочитано: {report.read}, добавлено: {report.inserted}, обновлено: {report.updated}, "
+          f"отклонено: {report.rejected}")
+    for line, reason in report.rejected_rows:
+        print(f"  строка {line}: {reason}")
+    sys.exit(1 if report.rejected else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Проверка оформления заказов под конкурентной нагрузкой: товар не должен уходить в минус.
+
+Создаёт один товар с небольшим остатком и сотни покупателей, у каждого из которых
+открыт заказ на этот товар, одновременно оформляет все заказы через
+_src.checkout и проверяет инварианты: продано не больше, чем было на складе,
+остаток совпадает с проданным, деньги списаны ровно у успешных покупателей.
+Созданные строки удаляются в конце. Завершается с ненулевым кодом при нарушении.
+
+    python -m tools.check_checkout_concurrency --buyers 300 --stock 50
+"""
+import argparse
+import random
+import sys
+import uuid
+
+from _src import checkout
+from _src import config
+from _src import db
+from _src import runner
+from _src import sales_rollups
+
+PRICE = 10
+BALANCE = 1000
+
+
+async def create_fixture(buyers, stock, rng):
+    """Товар и покупатели с открытыми заказами; возвращает (product_id, [(customer_id, order_id, quantity)])."""
+    tag = f"checkout-check-{uuid.uuid4().hex[:8]}"
+    async with db.connection() as conn:
+        async with conn.transaction():
+            product_id = await conn.fetchval(
+                "INSERT INTO products (name, description, price, stock_quantity) VALUES ($1, $1, $2, $3) RETURNING id",
+                tag, PRICE, stock)
+            customer_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO customers (name, role, password, balance)
+                       SELECT $1 || '-' || g, NULL, 'x', $3 FROM generate_series(1, $2) g
+                       RETURNING id
+                   )
+                   SELECT array_agg(id ORDER BY id) FROM created""",
+                tag, buyers, BALANCE)
+            quantities = [rng.choice((1, 1, 1, 2, 3)) for _ in customer_ids]
+            order_ids = await conn.fetchval(
+                """WITH created AS (
+                       INSERT INTO orders (customer_id, order_date, order_summ, order_state)
+                       SELECT c, NOW(), 0, 'в обработке' FROM unnest($1::int[]) c
+                       RETURNING id, customer_id, order_date
+                   ), registered AS (
+                       INSERT INTO open_orders (customer_id, order_id, order_date)
+                       SELECT customer_id, id, order_date FROM created
+                   )
+                   SELECT array_agg(id ORDER BY customer_id) FROM created""",
+                customer_ids)
+            await conn.execute(
+                """INSERT INTO order_items (order_id, order_date, product_id, quantity, unitprice)
+                   SELECT t.o, oo.order_date, $2, t.q, $3
+                   FROM unnest($1::int[], $4::int[]) AS t(o, q)
+                   JOIN open_orders oo ON oo.order_id = t.o""",
+                order_ids, product_id, PRICE, quantities)
+    return product_id, list(zip(customer_ids, order_ids, quantities))
+
+
+async def remove_fixture(product_id, buyers):
+    customer_ids = [customer_id for customer_id, _, _ in buyers]
+    order_ids = [order_id for _, order_id, _ in buyers]
+    async with db.connection() as conn:
+        async with conn.transaction():
+            # Оплаченные заказы уже в очереди сводок продаж или в самих сводках
+            await sales_rollups.forget_orders(conn, order_ids)
+            await conn.execute("DELETE FROM order_items WHERE order_id = ANY($1::int[])", order_ids)
+            await conn.execute("DELETE FROM orders WHERE id = ANY($1::int[])", order_ids)
+            await conn.execute("DELETE FROM customers WHERE id = ANY($1::int[])", customer_ids)
+            await conn.execute("DELETE FROM products WHERE id = $1", product_id)
+
+
+async def read_state(product_id, buyers):
+    async with db.connection() as conn:
+        stock = await conn.fetchval("SELECT stock_quantity FROM products WHERE id = $1", product_id)
+        balances = dict(await conn.fetch("SELECT id, balance FROM customers WHERE id = ANY($1::int[])",
+                                         [customer_id for customer_id, _, _ in buyers]))
+        states = dict(await conn.fetch("SELECT id, order_state FROM orders WHERE id = ANY($1::int[])",
+                                       [order_id for _, order_id, _ in buyers]))
+    return stock, balances, states
+
+
+def verify(stock, buyers, results, final_stock, balances, states):
+    errors = []
+    sold = sum(quantity for (_, _, quantity), result in zip(buyers, results) if result.ok)
+    if sold > stock:
+        errors.append(f"продано {sold} при остатке {stock}")
+    if final_stock != stock - sold:
+        errors.append(f"остаток {final_stock}, ожидалось {stock - sold}")
+    if final_stock < 0:
+        errors.append(f"отрицательный остаток {final_stock}")
+    for (customer_id, order_id, quantity), result in zip(buyers, results):
+        expected_balance = BALANCE - PRICE * quantity if result.ok else BALANCE
+        if balances[customer_id] != expected_balance:
+            errors.append(f"покупатель {customer_id}: баланс {balances[customer_id]}, ожидалось {expected_balance}")
+        expected_state = 'оплачен' if result.ok else 'в обработке'
+        if states[order_id] != expected_state:
+            errors.append(f"заказ {order_id}: состояние {states[order_id]}, ожидалось {expected_state}")
+        if not result.ok and result.status != checkout.OUT_OF_STOCK:
+            errors.append(f"заказ {order_id}: неожиданный статус {result.status}")
+    return sold, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--buyers", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=50,
+                        help="размер пула, то есть число по-настоящему параллельных оформлений")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    config.DB_POOL_MAX_SIZE = args.connections
+    product_id, buyers = runner.run(create_fixture(args.buyers, args.stock, random.Random(args.seed)))
+    try:
+        results = runner.gather(*[checkout.checkout(order_id, customer_id)
+                                  for customer_id, order_id, _ in buyers])
+        final_stock, balances, states = runner.run(read_state(product_id, buyers))
+    finally:
+        runner.run(remove_fixture(product_id, buyers))
+        db.close()
+
+    sold, errors = verify(args.stock, buyers, results, final_stock, balances, states)
+    print(f"Покупателей: {len(buyers)}, успешно: {sum(r.ok for r in results)}, продано: {sold} из {args.stock}")
+    for error in errors:
+        print(f"FAIL {error}")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Сверка orders.order_summ с суммой позиций заказа и, по запросу, починка.
+
+Сумма заказа поддерживается приращениями (см. _src/cart.py), поэтому правка
+order_items в обход приложения (ручной SQL, старая версия кода) может её
+рассинхронизировать. Скрипт одним запросом находит заказы, у которых order_summ
+не равна SUM(quantity * unitprice), и печатает их. С --repair пересчитывает
+найденные заказы пачками: строки заказов сначала блокируются, затем сумма
+считается заново - одновременная правка корзины либо уже видна, либо дождётся
+блокировки и добавит своё приращение к исправленной сумме.
+Завершается с ненулевым кодом, если остались расхождения.
+
+    python -m tools.check_order_totals --state 'в обработке'
+    python -m tools.check_order_totals --repair
+"""
+import argparse
+import sys
+
+from _src import db
+from _src import runner
+
+MISMATCH_QUERY = """
+    SELECT o.id, o.order_summ, COALESCE(t.expected, 0) AS expected
+    FROM orders o
+    LEFT JOIN (
+        SELECT order_id, order_date, SUM(quantity * unitprice) AS expected
+        FROM order_items
+        GROUP BY order_id, order_date
+    ) t ON t.order_id = o.id AND t.order_date = o.order_date
+    WHERE ($1::text IS NULL OR o.order_state = $1)
+      AND o.order_summ IS DISTINCT FROM COALESCE(t.expected, 0)
+    ORDER BY o.id
+"""
+
+LOCK_QUERY = """
+    SELECT id FROM orders WHERE id = ANY($1::int[]) ORDER BY id FOR UPDATE
+"""
+
+REPAIR_QUERY = """
+    UPDATE orders o
+    SET order_summ = COALESCE(t.expected, 0)
+    FROM unnest($1::int[]) AS ids(id)
+    LEFT JOIN (
+        SELECT order_id, SUM(quantity * unitprice) AS expected
+        FROM order_items
+        WHERE order_id = ANY($1::int[])
+        GROUP BY order_id
+    ) t ON t.order_id = ids.id
+    WHERE o.id = ids.id
+      AND o.order_summ IS DISTINCT FROM COALESCE(t.expected, 0)
+    RETURNING o.id
+"""
+
+
+async def find_mismatches(state=None):
+    """Заказы с неверной суммой: список (id, order_summ, ожидаемая сумма)."""
+    async with db.connection() as conn:
+        return [tuple(row) for row in await conn.fetch(MISMATCH_QUERY, state)]
+
+
+async def repair(order_ids):
+    """Пересчитывает сумму указанных заказов; возвращает число исправленных."""
+    async with db.connection() as conn:
+        async with conn.transaction():
+            await conn.execute(LOCK_QUERY, order_ids)
+            return len(await conn.fetch(REPAIR_QUERY, order_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--state", help="проверять только заказы в этом состоянии")
+    parser.add_argument("--repair", action="store_true", help="исправить найденные расхождения")
+    parser.add_argument("--batch", type=int, default=1000, help="заказов в одной транзакции починки")
+    parser.add_argument("--show", type=int, default=20, help="сколько расхождений напечатать")
+    args = parser.parse_args()
+
+    try:
+        mismatches = runner.run(find_mismatches(args.state))
+        print(f"Заказов с неверной суммой: {len(mismatches)}")
+        for order_id, order_summ, expected in mismatches[:args.show]:
+            print(f"  заказ {order_id}: order_summ {order_summ}, по позициям {expected}")
+
+        if args.repair and mismatches:
+            order_ids = [order_id for order_id, _, _ in mismatches]
+            batches = [order_ids[i:i + args.batch] for i in range(0, len(order_ids), args.batch)]
+            repaired = sum(runner.gather(*[repair(batch) for batch in batches]))
+            print(f"Исправлено: {repaired}")
+            mismatches = runner.run(find_mismatches(args.state))
+            print(f"Осталось расхождений: {len(mismatches)}")
+    finally:
+        db.close()
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
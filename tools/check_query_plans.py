@@ -0,0 +1,306 @@
+"""Проверка планов запросов: ни один запрос страниц не должен читать большие таблицы целиком.
+
+Собирает все SQL-строки из модулей _src/pages, запросы из реестра _src/queries.py,
+запросы сохранения и импорта каталога (_src/product_sync.py, _src/catalogue_io.py)
+и запросы, которые строятся динамически (страница каталога, поиск), наполняет базу большим синтетическим
+набором данных внутри транзакции, выполняет для каждого запроса
+EXPLAIN (FORMAT JSON) и завершается с ненулевым кодом, если где-то остался
+Seq Scan. Транзакция откатывается, база не меняется.
+
+    python -m tools.check_query_plans --scale 1.0
+"""
+import argparse
+import ast
+import asyncio
+import datetime
+import decimal
+import json
+import pathlib
+import sys
+
+import asyncpg
+
+# cart, checkout, orders, order_partitions, ratings, users, analytics_page, customer_page,
+# edit_managers и log_user нужны ради запросов, которые они регистрируют в _src/queries.py при импорте
+from _src import cart
+from _src import catalogue_io
+from _src import checkout
+from _src import db
+from _src import order_partitions
+from _src import orders
+from _src import product_sync
+from _src import queries
+from _src import ratings
+from _src import sales_rollups
+from _src import search
+from _src import users
+from _src.pages import analytics_page
+from _src.pages import buy_products
+from _src.pages import customer_page
+from _src.pages import edit_managers
+from _src.pages import edit_products
+from _src.pages import log_user
+
+PAGES_DIR = pathlib.Path(__file__).resolve().parent.parent / "_src" / "pages"
+
+SQL_PREFIXES = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# Маленькие справочники, полный просмотр которых дешевле индекса; очередь сводок продаж
+# разбирается каждые SALES_ROLLUP_INTERVAL секунд и тоже остаётся маленькой
+SMALL_TABLES = {"roles", "brands", "categories", "sales_rollup_queue"}
+
+# Временные таблицы сохранения и импорта каталога читаются целиком по смыслу
+STAGING_TABLES = {product_sync.STAGING_TABLE, catalogue_io.STAGING_TABLE}
+
+# Запросы, которым по смыслу нужна вся таблица (функция -> причина)
+FULL_SCAN_ALLOWED = {
+    "edit_managers.fetch_users": "список всех пользователей для администратора",
+    "catalogue_io.export_catalogue": "выгрузка всего каталога",
+    "sales_rollups.queue_paid_orders": "пересчёт сводок продаж по всем оплаченным заказам",
+    "sales_rollups.queue_paid_orders_since": "пересчёт сводок продаж вручную, без индекса по дню оплаты",
+    "sales_rollups.delete_empty_daily": "удаление тестовых данных (benchmarks, tools), не страницы",
+    "sales_rollups.delete_empty_daily_totals": "удаление тестовых данных (benchmarks, tools), не страницы",
+}
+
+# Объём синтетических данных при --scale 1.0
+BASE_ROWS = {
+    "brands": 200,
+    "categories": 50,
+    "customers": 200_000,
+    "products": 100_000,
+    "orders": 500_000,
+    "order_items": 1_000_000,
+    "reviews": 300_000,
+}
+
+
+def collect_page_queries():
+    """Статические SQL-строки из модулей страниц: список (имя функции, текст запроса)."""
+    queries = []
+    for path in sorted(PAGES_DIR.glob("*.py")):
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+        for function in ast.walk(tree):
+            if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            # Части f-строк - это фрагменты динамических запросов, они проверяются отдельно
+            fragments = {id(part) for node in ast.walk(function) if isinstance(node, ast.JoinedStr)
+                         for part in node.values}
+            for node in ast.walk(function):
+                if (isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in fragments
+                        and node.value.strip().upper().startswith(SQL_PREFIXES)):
+                    queries.append((f"{path.stem}.{function.name}", node.value))
+    return queries
+
+
+def collect_dynamic_queries():
+    """Запросы, собираемые в коде: все варианты сортировки каталога, фильтры, курсор, поиск, окна таблицы
+    менеджера."""
+    queries = []
+    for sort in buy_products.SORT_OPTIONS:
+        name = f"buy_products.fetch_products[sort={sort}]"
+        queries.append((name, buy_products.build_products_query(sort=sort)[0]))
+        queries.append((name, buy_products.build_products_query(
+            brand_filter="brand_1", category_filter="category_1", sort=sort, after=(0, 0))[0]))
+    queries.append(("buy_products.fetch_products[search]",
+                    buy_products.build_products_query(search_query="крем")[0]))
+    queries.append(("buy_products.fetch_products[min_rating]",
+                    buy_products.build_products_query(min_rating=4, after=("product", 0))[0]))
+    queries.append(("search.search_products", search.build_search_query("крем", "brand_1")[0]))
+    queries.append(("search.search_products", search.build_search_query("крем", min_rating=4)[0]))
+    name = "edit_products.get_products_dataframe"
+    queries.append((name, edit_products.build_products_window_query()[0]))
+    queries.append((name, edit_products.build_products_window_query(after=("product", 0))[0]))
+    queries.append((name, edit_products.build_products_window_query(
+        brand_filter="brand_1", category_filter="category_1", low_stock=True)[0]))
+    queries.append((name, edit_products.build_products_window_query(name_search="крем")[0]))
+    return queries
+
+
+def collect_staging_queries():
+    """Запросы к временным таблицам сохранения (product_sync) и импорта (catalogue_io) каталога.
+
+    Таблицы создаются в транзакции проверки перед EXPLAIN."""
+    queries = []
+    for module, function in ((product_sync, "sync_products"), (catalogue_io, "import_catalogue")):
+        name = f"{module.__name__.rsplit('.', 1)[-1]}.{function}"
+        queries.append((name, product_sync.INSERT_BRANDS_QUERY.format(table=module.STAGING_TABLE)))
+        queries.append((name, product_sync.INSERT_CATEGORIES_QUERY.format(table=module.STAGING_TABLE)))
+    queries.append(("product_sync.sync_products", product_sync.UPDATE_QUERY))
+    queries.append(("product_sync.sync_products", product_sync.INSERT_QUERY))
+    queries.append(("catalogue_io.import_catalogue", catalogue_io.UPSERT_QUERY))
+    queries.append(("catalogue_io.import_catalogue", catalogue_io.INSERT_QUERY))
+    queries.append(("catalogue_io.import_catalogue", catalogue_io.SEQUENCE_QUERY))
+    queries.append(("catalogue_io.export_catalogue", catalogue_io.EXPORT_QUERY))
+    return queries
+
+
+def collect_registered_queries():
+    """Запросы реестра _src/queries.py (регистрируются при импорте модулей): список (имя, текст запроса).
+
+    LOCK и TRUNCATE не поддерживают EXPLAIN и пропускаются."""
+    return [(statement.name, statement) for statement in queries.registered()
+            if statement.strip().upper().startswith(SQL_PREFIXES)]
+
+
+async def generate_dataset(conn, scale):
+    rows = {table: max(1, int(count * scale)) for table, count in BASE_ROWS.items()}
+    await conn.execute(f"""
+        INSERT INTO brands (brand_name) SELECT 'brand_' || g FROM generate_series(1, {rows['brands']}) g;
+        INSERT INTO categories (name) SELECT 'category_' || g FROM generate_series(1, {rows['categories']}) g;
+        INSERT INTO customers (name, role, password, balance)
+            SELECT 'user_' || g, (SELECT min(id) FROM roles), 'x', 1000
+            FROM generate_series(1, {rows['customers']}) g;
+    """)
+    await conn.execute(f"""
+        WITH b AS (SELECT array_agg(id) AS ids FROM brands),
+             c AS (SELECT array_agg(id) AS ids FROM categories)
+        INSERT INTO products (name, description, price, stock_quantity, category_id, brand_id)
+        SELECT 'product ' || g || ' крем аромат', 'описание товара ' || g, (random() * 500)::numeric(10, 2),
+               (random() * 100)::int,
+               c.ids[1 + floor(random() * array_length(c.ids, 1))::int],
+               b.ids[1 + floor(random() * array_length(b.ids, 1))::int]
+        FROM generate_series(1, {rows['products']}) g, b, c;
+    """)
+    await conn.execute("SELECT shop_create_order_partitions((now() - interval '3 years')::date, "
+                       "(now() + interval '3 months')::date)")
+    await conn.execute(f"""
+        WITH cu AS (SELECT array_agg(id) AS ids FROM customers)
+        INSERT INTO orders (customer_id, order_date, order_summ, order_state)
+        SELECT cu.ids[1 + floor(random() * array_length(cu.ids, 1))::int],
+               now() - random() * interval '3 years', 0, 'оплачен'
+        FROM generate_series(1, {rows['orders']}) g, cu;
+        -- Открытый заказ ('в обработке') - не больше одного на покупателя, записан в open_orders
+        WITH created AS (
+            INSERT INTO orders (customer_id, order_date, order_summ, order_state)
+            SELECT id, now() - random() * interval '30 days', 0, 'в обработке'
+            FROM customers
+            WHERE random() < 0.1
+            RETURNING id, customer_id, order_date
+        )
+        INSERT INTO open_orders (customer_id, order_id, order_date)
+        SELECT customer_id, id, order_date FROM created;
+    """)
+    await conn.execute(f"""
+        WITH o AS (SELECT array_agg(id) AS ids, array_agg(order_date) AS dates, count(*)::int AS n FROM orders),
+             p AS (SELECT array_agg(id) AS ids FROM products)
+        INSERT INTO order_items (order_id, order_date, product_id, quantity, unitprice)
+        SELECT o.ids[r.i], o.dates[r.i],
+               p.ids[1 + floor(random() * array_length(p.ids, 1))::int],
+               1 + (random() * 4)::int, (random() * 500)::numeric(10, 2)
+        FROM o, p, LATERAL (
+            SELECT 1 + floor(random() * o.n)::int AS i FROM generate_series(1, {rows['order_items']}) g
+        ) r;
+    """)
+    await conn.execute(f"""
+        WITH cu AS (SELECT array_agg(id) AS ids FROM customers),
+             p AS (SELECT array_agg(id) AS ids FROM products)
+        INSERT INTO reviews (product_id, customer_id, rate, comment, date)
+        SELECT p.ids[1 + floor(random() * array_length(p.ids, 1))::int],
+               cu.ids[1 + floor(random() * array_length(cu.ids, 1))::int],
+               1 + (random() * 4)::int, 'отзыв ' || g, now() - random() * interval '3 years'
+        FROM generate_series(1, {rows['reviews']}) g, cu, p;
+    """)
+    # Сводки продаж по всем оплаченным заказам - так их заполняет фоновая задача приложения
+    await conn.execute(sales_rollups.REFRESH_QUERY, rows['orders'])
+    await conn.execute("ANALYZE")
+
+
+def sample_value(pg_type):
+    """Правдоподобное значение параметра по его типу в Postgres."""
+    return _sample_by_name(pg_type.name)
+
+
+def _sample_by_name(name):
+    if name.startswith("_"):
+        # Массив (_int4, _numeric, _text, ...) - из значений типа элемента
+        if name in ("_int2", "_int4", "_int8"):
+            return [1, 2, 3]
+        return [_sample_by_name(name[1:])]
+    if name in ("int2", "int4", "int8"):
+        return 1
+    if name == "numeric":
+        return decimal.Decimal(1)
+    if name in ("float4", "float8"):
+        return 1.0
+    if name in ("text", "varchar", "bpchar", "name"):
+        return "user_1"
+    if name == "bool":
+        return True
+    if name == "date":
+        # Начало окна страницы аналитики
+        return datetime.date.today() - datetime.timedelta(days=30)
+    if name in ("timestamp", "timestamptz"):
+        return datetime.datetime(2024, 1, 1)
+    if name == "interval":
+        return datetime.timedelta(days=7)
+    raise ValueError(f"нет тестового значения для типа {name}")
+
+
+def seq_scans(plan):
+    """Имена таблиц, которые план читает последовательным просмотром."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def explain(conn, query):
+    statement = await conn.prepare(query)
+    params = [sample_value(pg_type) for pg_type in statement.get_parameters()]
+    result = await conn.fetchval("EXPLAIN (FORMAT JSON) " + query, *params)
+    return json.loads(result)[0]["Plan"]
+
+
+async def run(args):
+    queries = (collect_page_queries() + collect_registered_queries() + collect_staging_queries()
+               + collect_dynamic_queries())
+    failures = []
+
+    conn = await asyncpg.connect(**db.connect_options())
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        print(f"Генерация данных (scale={args.scale})...")
+        await generate_dataset(conn, args.scale)
+
+        await conn.execute(product_sync.CREATE_STAGING_QUERY)
+        await conn.execute(catalogue_io.CREATE_STAGING_QUERY)
+
+        # Секции заказов за пределами данных пусты - их полный просмотр ничего не стоит
+        small = SMALL_TABLES | STAGING_TABLES | {row['relname'] for row in await conn.fetch(
+            "SELECT relname FROM pg_class WHERE relispartition AND reltuples < 1000")}
+
+        for name, query in queries:
+            plan = await explain(conn, query)
+            # Системные каталоги (список секций в order_partitions) малы и не проверяются
+            scanned = [table for table in seq_scans(plan) if table not in small and not table.startswith("pg_")]
+            if scanned and name in FULL_SCAN_ALLOWED:
+                print(f"SKIP {name}: {', '.join(scanned)} ({FULL_SCAN_ALLOWED[name]})")
+            elif scanned:
+                failures.append((name, scanned, query))
+                print(f"FAIL {name}: Seq Scan по {', '.join(scanned)}")
+            else:
+                print(f"OK   {name}")
+    finally:
+        await transaction.rollback()
+        await conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} запрос(ов) без подходящего индекса:")
+        for name, scanned, query in failures:
+            print(f"\n--- {name} ({', '.join(scanned)})\n{query.strip()}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="множитель объёма синтетических данных")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
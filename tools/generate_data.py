@@ -0,0 +1,330 @@
+"""Генератор синтетических данных магазина для измерений на объёмах production.
+
+Заполняет схему migrations/ddl.sql брендами, категориями, покупателями, товарами,
+заказами с позициями и отзывами. Распределения приближены к реальным:
+популярность товаров подчиняется закону Ципфа (немногие товары собирают
+большую часть покупок и отзывов), бренды тоже неравны по числу товаров,
+часть покупателей покупает заметно чаще остальных, оценки смещены к 4-5.
+Оплаченные заказы ('оплачен') распределены по последним --days дням до --end-date,
+у части покупателей есть открытая корзина ('в обработке', не больше одной на покупателя).
+
+Данные детерминированы: каждый кусок строится своим генератором случайных чисел
+от (--seed, таблица, номер куска), поэтому при тех же параметрах и той же
+--end-date получаются те же строки независимо от числа --workers. Исключение -
+order_items.id: число позиций заранее неизвестно, id выдаёт последовательность.
+Куски строятся в пуле потоков и загружаются COPY одновременно через --workers
+соединений пула. Все покупатели получают пароль PASSWORD, имена user<id>.
+
+--truncate предварительно очищает таблицы магазина (кроме roles) - только для
+тестовой базы. Без него данные добавляются после существующих id.
+
+    python -m tools.generate_data --truncate --customers 1000000 --products 200000 --orders 3000000
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import time
+
+import bcrypt
+import numpy as np
+import pandas as pd
+
+from _src import config
+from _src import db
+from _src import runner
+from _src import sales_rollups
+
+PASSWORD = "password"
+
+PAID = 'оплачен'
+OPEN = 'в обработке'
+
+# Строк в одном куске COPY
+CHUNK_SIZE = 50_000
+
+# Показатели закона Ципфа: популярность товаров, размер брендов, активность покупателей
+PRODUCT_EXPONENT = 1.1
+BRAND_EXPONENT = 1.0
+CUSTOMER_EXPONENT = 0.6
+
+# Вероятности оценок 1..5
+RATE_WEIGHTS = [0.05, 0.05, 0.10, 0.30, 0.50]
+
+# Порядок загрузки (внешние ключи); номер таблицы в списке входит в зерно генератора
+TABLES = ['brands', 'categories', 'customers', 'products', 'orders', 'reviews']
+
+SEQUENCES = {
+    'brands': 'brands_id_seq',
+    'categories': 'categories_id_seq',
+    'customers': 'customers_new_id_seq',
+    'products': 'products_new_id_seq',
+    'orders': 'orders_id_seq',
+    'order_items': 'order_items_id_seq',
+    'reviews': 'rewiewes_id_seq',
+}
+
+TRUNCATE_QUERY = ("TRUNCATE reviews, product_rating_stats, open_orders, order_items, orders, products, customers, "
+                  "brands, categories, sales_daily, sales_daily_totals, sales_rollup_queue")
+
+SYLLABLES = np.array(['ла', 'ро', 'ми', 'ве', 'на', 'то', 'ри', 'са', 'ко', 'лю', 'ан', 'эль', 'ви', 'де', 'ор', 'ма'])
+CATEGORIES = [
+    'Уход за лицом', 'Уход за телом', 'Уход за волосами', 'Парфюмерия', 'Декоративная косметика',
+    'Солнцезащитные средства', 'Бады для волос и ногтей', 'Витамины', 'Мужской уход', 'Детская косметика',
+    'Средства для бритья', 'Ароматы для дома', 'Маникюр', 'Гигиена', 'Аксессуары', 'Наборы',
+]
+NOUNS = np.array(['крем', 'шампунь', 'бальзам', 'гель', 'лосьон', 'тоник', 'парфюм', 'скраб', 'спрей',
+                  'мусс', 'флюид', 'эликсир', 'концентрат', 'коллаген', 'комплекс'])
+ADJECTIVES = np.array(['увлажняющий', 'питательный', 'восстанавливающий', 'матирующий', 'освежающий',
+                       'ночной', 'дневной', 'солнцезащитный', 'успокаивающий', 'укрепляющий'])
+EXTRAS = np.array(['с коллагеном', 'с гиалуроновой кислотой', 'с витамином C', 'с алоэ', 'с маслом арганы',
+                   'с пептидами', 'с ниацинамидом', 'с ромашкой', 'с лимоном и лаймом', 'без отдушки'])
+COMMENTS = {
+    1: ['Не подошло', 'Пришло повреждённым', 'Деньги на ветер'],
+    2: ['Ожидал большего', 'Так себе', 'Запах не понравился'],
+    3: ['Нормально', 'Средне, за свою цену', 'Есть недостатки'],
+    4: ['Хороший товар', 'Понравилось, возьму ещё', 'Всё устраивает'],
+    5: ['Отлично!', 'Лучшее, что пробовала', 'Рекомендую всем', 'Покупаю не первый раз'],
+}
+
+
+def zipf_cdf(n, exponent, rng):
+    """Накопленные вероятности закона Ципфа для n объектов; ранги перемешаны, чтобы популярность не зависела от id."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def sample(cdf, rng, size):
+    """Индексы объектов (0..n-1), выбранные с вероятностями cdf."""
+    return np.minimum(np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1)
+
+
+def chunks(count, chunk_size=CHUNK_SIZE):
+    return [(number, start, min(start + chunk_size, count)) for number, start in enumerate(range(0, count, chunk_size))]
+
+
+class Plan:
+    """Общие для всех кусков данные: первые id, цены товаров и распределения популярности."""
+
+    def __init__(self, args, first_ids, customer_role):
+        self.args = args
+        self.first_ids = first_ids
+        self.customer_role = customer_role
+        self.password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(config.BCRYPT_ROUNDS)).decode('utf-8')
+        self.end = datetime.datetime.combine(args.end_date, datetime.time())
+
+        rng = self.rng('plan')
+        self.brand_names = self._brand_names(args.brands, rng)
+        self.brand_cdf = zipf_cdf(args.brands, BRAND_EXPONENT, rng)
+        self.prices = np.round(rng.lognormal(mean=6.5, sigma=1.0, size=args.products), 2)
+        self.product_cdf = zipf_cdf(args.products, PRODUCT_EXPONENT, rng)
+        self.customer_cdf = zipf_cdf(args.customers, CUSTOMER_EXPONENT, rng)
+        # Покупатели с открытой корзиной - без повторов
+        self.open_customers = rng.choice(args.customers, size=min(args.open_carts, args.customers), replace=False)
+
+    def rng(self, table, chunk=0):
+        return np.random.default_rng([self.args.seed, TABLES.index(table) if table in TABLES else len(TABLES), chunk])
+
+    @staticmethod
+    def _brand_names(count, rng):
+        names = pd.Series(SYLLABLES[rng.integers(0, len(SYLLABLES), size=(count, 3))].tolist()).str.join('').str.title()
+        duplicated = names.duplicated()
+        names[duplicated] = names[duplicated] + ' ' + pd.Series(np.arange(count))[duplicated].astype(str)
+        return names.to_numpy()
+
+    def dates(self, rng, size):
+        seconds = rng.integers(0, self.args.days * 86400, size=size)
+        return self.end - pd.to_timedelta(seconds, unit='s')
+
+    def brands(self, chunk):
+        _, start, stop = chunk
+        return [('brands', pd.DataFrame({
+            'id': self.first_ids['brands'] + np.arange(start, stop),
+            'brand_name': self.brand_names[start:stop],
+        }))]
+
+    def categories(self, chunk):
+        _, start, stop = chunk
+        names = [CATEGORIES[i % len(CATEGORIES)] + (f' {i // len(CATEGORIES) + 1}' if i >= len(CATEGORIES) else '')
+                 for i in range(start, stop)]
+        return [('categories', pd.DataFrame({'id': self.first_ids['categories'] + np.arange(start, stop), 'name': names}))]
+
+    def customers(self, chunk):
+        number, start, stop = chunk
+        rng = self.rng('customers', number)
+        ids = self.first_ids['customers'] + np.arange(start, stop)
+        return [('customers', pd.DataFrame({
+            'id': ids,
+            'name': 'user' + pd.Series(ids).astype(str),
+            'role': self.customer_role,
+            'password': self.password,
+            'balance': np.round(rng.lognormal(mean=8.0, sigma=1.2, size=stop - start), 2),
+        }))]
+
+    def products(self, chunk):
+        number, start, stop = chunk
+        rng = self.rng('products', number)
+        size = stop - start
+        brands = sample(self.brand_cdf, rng, size)
+        nouns = NOUNS[rng.integers(0, len(NOUNS), size)]
+        adjectives = ADJECTIVES[rng.integers(0, len(ADJECTIVES), size)]
+        extras = EXTRAS[rng.integers(0, len(EXTRAS), size)]
+        volumes = rng.choice([15, 30, 50, 100, 200, 250, 500], size)
+        # Примерно каждый двадцатый товар закончился
+        stock = np.where(rng.random(size) < 0.05, 0, rng.integers(1, 500, size))
+        return [('products', pd.DataFrame({
+            'id': self.first_ids['products'] + np.arange(start, stop),
+            'name': pd.Series(self.brand_names[brands]) + ' ' + nouns + ' ' + adjectives + ' ' + extras,
+            'description': pd.Series(nouns).str.capitalize() + ' ' + adjectives + ' ' + extras
+                           + '. Объём ' + pd.Series(volumes).astype(str) + ' мл.',
+            'price': self.prices[start:stop],
+            'stock_quantity': stock,
+            'category_id': self.first_ids['categories'] + rng.integers(0, self.args.categories, size),
+            'brand_id': self.first_ids['brands'] + brands,
+        }))]
+
+    def _orders(self, rng, first_id, customers, state):
+        """Заказы с позициями; сумма заказа равна сумме позиций."""
+        size = len(customers)
+        order_ids = first_id + np.arange(size)
+        lines = 1 + rng.poisson(1.5, size)
+        items = pd.DataFrame({
+            'order_id': np.repeat(order_ids, lines),
+            'product_index': sample(self.product_cdf, rng, lines.sum()),
+        }).drop_duplicates(['order_id', 'product_index'])
+        items['quantity'] = rng.geometric(0.6, len(items))
+        items['unitprice'] = self.prices[items['product_index'].to_numpy()]
+        items['product_id'] = self.first_ids['products'] + items.pop('product_index')
+        totals = (items['quantity'] * items['unitprice']).groupby(items['order_id']).sum().round(2)
+        orders = pd.DataFrame({
+            'id': order_ids,
+            'customer_id': self.first_ids['customers'] + customers,
+            'order_date': self.dates(rng, size) if state == PAID else self.end,
+            'order_summ': totals.reindex(order_ids).to_numpy(),
+            'order_state': state,
+        })
+        # Позиции лежат в той же секции, что и заказ
+        items['order_date'] = items['order_id'].map(orders.set_index('id')['order_date'])
+        frames = [('orders', orders),
+                  ('order_items', items[['order_id', 'order_date', 'product_id', 'quantity', 'unitprice']])]
+        if state == OPEN:
+            frames.append(('open_orders', orders.rename(columns={'id': 'order_id'})[
+                ['customer_id', 'order_id', 'order_date']]))
+        return frames
+
+    def paid_orders(self, chunk):
+        number, start, stop = chunk
+        rng = self.rng('orders', number)
+        return self._orders(rng, self.first_ids['orders'] + start, sample(self.customer_cdf, rng, stop - start), PAID)
+
+    def open_orders(self, chunk):
+        number, start, stop = chunk
+        # Номера кусков открытых корзин идут после кусков оплаченных заказов
+        rng = self.rng('orders', len(chunks(self.args.orders)) + number)
+        return self._orders(rng, self.first_ids['orders'] + self.args.orders + start,
+                            self.open_customers[start:stop], OPEN)
+
+    def reviews(self, chunk):
+        number, start, stop = chunk
+        rng = self.rng('reviews', number)
+        size = stop - start
+        # Отзывы пишут о том, что покупают: товары выбираются по той же популярности
+        rates = rng.choice(np.arange(1, 6), size, p=RATE_WEIGHTS)
+        picks = rng.integers(0, 12, size)
+        comments = [COMMENTS[rate][i % len(COMMENTS[rate])] for rate, i in zip(rates.tolist(), picks.tolist())]
+        reviews = pd.DataFrame({
+            'id': self.first_ids['reviews'] + np.arange(start, stop),
+            'product_id': self.first_ids['products'] + sample(self.product_cdf, rng, size),
+            'customer_id': self.first_ids['customers'] + rng.integers(0, self.args.customers, size),
+            'rate': rates,
+            'comment': comments,
+            'date': self.dates(rng, size),
+        })
+        # Как и в приложении, не больше одного отзыва покупателя на товар (в пределах куска)
+        return [('reviews', reviews.drop_duplicates(['product_id', 'customer_id']))]
+
+
+async def copy_frame(conn, table, frame):
+    buffer = io.BytesIO(frame.to_csv(index=False, header=False, date_format='%Y-%m-%d %H:%M:%S').encode('utf-8'))
+    await conn.copy_to_table(table, source=buffer, columns=list(frame.columns), format='csv')
+
+
+async def load(name, build, count, workers):
+    """Строит куски в пуле потоков и загружает их COPY через workers соединений одновременно."""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(workers)
+    started = time.perf_counter()
+
+    async def load_chunk(chunk):
+        async with semaphore:
+            frames = await loop.run_in_executor(None, build, chunk)
+            async with db.connection() as conn:
+                async with conn.transaction():
+                    for table, frame in frames:
+                        await copy_frame(conn, table, frame)
+            return sum(len(frame) for _, frame in frames)
+
+    rows = sum(await asyncio.gather(*(load_chunk(chunk) for chunk in chunks(count))))
+    print(f"{name:<18} {rows:>12} строк за {time.perf_counter() - started:8.1f} с")
+
+
+async def generate(args):
+    async with db.connection() as conn:
+        if args.truncate:
+            await conn.execute(TRUNCATE_QUERY)
+        first_ids = {table: await conn.fetchval(f"SELECT COALESCE(max(id), 0) + 1 FROM {table}")
+                     for table in TABLES}
+        customer_role = await conn.fetchval("SELECT id FROM roles WHERE role = 'customer'")
+        # Секции orders и order_items на весь диапазон дат заказов
+        end = args.end_date + datetime.timedelta(days=31)
+        await conn.execute("SELECT shop_create_order_partitions($1, $2)",
+                           args.end_date - datetime.timedelta(days=args.days), end)
+
+    plan = Plan(args, first_ids, customer_role)
+    await load("бренды", plan.brands, args.brands, args.workers)
+    await load("категории", plan.categories, args.categories, args.workers)
+    await load("покупатели", plan.customers, args.customers, args.workers)
+    await load("товары", plan.products, args.products, args.workers)
+    await load("заказы", plan.paid_orders, args.orders, args.workers)
+    await load("открытые корзины", plan.open_orders, len(plan.open_customers), args.workers)
+    await load("отзывы", plan.reviews, args.reviews, args.workers)
+
+    async with db.connection() as conn:
+        for table, sequence in SEQUENCES.items():
+            await conn.execute(f"SELECT setval('{sequence}', (SELECT max(id) FROM {table}))")
+        await conn.execute("ANALYZE")
+
+    # Оплаченные заказы поставлены в очередь сводок продаж триггерами; страница аналитики
+    # увидит их сразу, не дожидаясь фоновой задачи приложения
+    started = time.perf_counter()
+    refreshed = await sales_rollups.refresh_rollups()
+    print(f"{'сводки продаж':<18} {refreshed:>12} заказов за {time.perf_counter() - started:8.1f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--brands", type=int, default=500)
+    parser.add_argument("--categories", type=int, default=len(CATEGORIES))
+    parser.add_argument("--orders", type=int, default=2_000_000, help="оплаченных заказов")
+    parser.add_argument("--open-carts", type=int, default=10_000, help="покупателей с открытой корзиной")
+    parser.add_argument("--reviews", type=int, default=500_000)
+    parser.add_argument("--days", type=int, default=730, help="за сколько дней до --end-date распределены даты")
+    parser.add_argument("--end-date", type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument("--workers", type=int, default=config.DB_POOL_MAX_SIZE, help="одновременных COPY")
+    parser.add_argument("--truncate", action="store_true", help="очистить таблицы магазина перед загрузкой")
+    args = parser.parse_args()
+
+    config.DB_POOL_MAX_SIZE = max(config.DB_POOL_MAX_SIZE, args.workers)
+    try:
+        runner.run(generate(args))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
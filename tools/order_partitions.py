@@ -0,0 +1,55 @@
+"""Обслуживание месячных секций orders / order_items (migrations/009_order_partitions.sql).
+
+ensure создаёт секции на --months-ahead месяцев вперёд, archive выгружает секции
+старше --older-than-months месяцев в сжатые CSV (--dir) и удаляет их из базы,
+restore возвращает выгруженный месяц. Первые две операции выполняет и фоновая задача
+процесса приложения (_src/order_partitions.py); скрипт удобен для cron и разовых работ.
+
+    python -m tools.order_partitions ensure --months-ahead 3
+    python -m tools.order_partitions archive --older-than-months 24 --dir order_archive
+    python -m tools.order_partitions restore --month 2023-01 --dir order_archive
+"""
+import argparse
+import datetime
+
+from _src import config
+from _src import db
+from _src import order_partitions
+from _src import runner
+
+
+def month(value):
+    return datetime.datetime.strptime(value, '%Y-%m').date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="создать будущие секции")
+    ensure.add_argument("--months-ahead", type=int, default=config.ORDER_PARTITIONS_AHEAD)
+    archive = commands.add_parser("archive", help="выгрузить и удалить старые секции")
+    archive.add_argument("--older-than-months", type=int, required=not config.ORDER_ARCHIVE_AFTER_MONTHS,
+                         default=config.ORDER_ARCHIVE_AFTER_MONTHS or None)
+    archive.add_argument("--dir", default=config.ORDER_ARCHIVE_DIR)
+    restore = commands.add_parser("restore", help="вернуть выгруженный месяц")
+    restore.add_argument("--month", type=month, required=True, help="ГГГГ-ММ")
+    restore.add_argument("--dir", default=config.ORDER_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "ensure":
+            created = runner.run(order_partitions.ensure_partitions(args.months_ahead))
+            print(f"Создано секций: {created}")
+        elif args.command == "archive":
+            archived = runner.run(order_partitions.archive_partitions(args.older_than_months, args.dir))
+            print(f"Выгружено месяцев: {len(archived)}"
+                  + "".join(f"\n  {value:%Y-%m}" for value in archived))
+        else:
+            restored = runner.run(order_partitions.restore_partition(args.month, args.dir))
+            print(f"Восстановлено заказов за {args.month:%Y-%m}: {restored}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Перенос заброшенных открытых заказов ('в обработке') и их позиций в архив.
+
+То же делает фоновая задача процесса приложения (_src/orders.py) раз в
+OPEN_ORDER_REAP_INTERVAL секунд; скрипт удобен для cron, если она выключена
+(OPEN_ORDER_REAP_INTERVAL=0), или для разовой чистки с другим порогом.
+
+    python -m tools.reap_orders --max-age-hours 168 --batch 1000
+"""
+import argparse
+
+from _src import config
+from _src import db
+from _src import orders
+from _src import runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-age-hours", type=float, default=config.OPEN_ORDER_MAX_AGE_HOURS)
+    parser.add_argument("--batch", type=int, default=config.OPEN_ORDER_REAP_BATCH)
+    args = parser.parse_args()
+
+    try:
+        archived = runner.run(orders.reap_stale_orders(args.max_age_hours, args.batch))
+    finally:
+        db.close()
+    print(f"Перенесено в архив заказов: {archived}")
+
+
+if __name__ == "__main__":
+    main()
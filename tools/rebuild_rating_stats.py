@@ -0,0 +1,28 @@
+"""Пересчёт сводки оценок товаров (product_rating_stats) по всем отзывам.
+
+Обычно сводку поддерживают триггеры migrations/010_product_rating_stats.sql;
+пересчёт исправляет расхождения после ручных правок или массовой загрузки с
+выключенными триггерами. Запись отзывов на время пересчёта блокируется.
+
+    python -m tools.rebuild_rating_stats
+"""
+import argparse
+
+from _src import db
+from _src import ratings
+from _src import runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args()
+
+    try:
+        fixed = runner.run(ratings.rebuild_stats())
+    finally:
+        db.close()
+    print(f"Исправлено строк сводки: {fixed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Пересчёт сводок продаж страницы аналитики (sales_daily, sales_daily_totals).
+
+Обычно сводки пополняет фоновая задача процесса приложения (_src/sales_rollups.py)
+из очереди оплаченных заказов. Пересчёт нужен после ручных правок заказов или
+позиций: сводки с --since (или целиком) удаляются, оплаченные заказы этого периода
+ставятся в очередь и сразу разбираются. Дни из выгруженных в архив секций заказов
+пересчитывать нельзя - их заказов в базе уже нет.
+
+    python -m tools.rebuild_sales_rollups --since 2024-01-01
+"""
+import argparse
+import datetime
+
+from _src import db
+from _src import runner
+from _src import sales_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--since", type=datetime.date.fromisoformat, default=None,
+                        help="первый пересчитываемый день (по умолчанию - вся история)")
+    args = parser.parse_args()
+
+    try:
+        queued = runner.run(sales_rollups.rebuild_rollups(args.since))
+        refreshed = runner.run(sales_rollups.refresh_rollups())
+    finally:
+        db.close()
+    print(f"Поставлено в очередь заказов: {queued}, учтено в сводках: {refreshed}")
+
+
+if __name__ == "__main__":
+    main()